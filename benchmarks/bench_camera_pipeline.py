@@ -0,0 +1,228 @@
+#!/usr/bin/env -S uv run --script
+
+"""
+Benchmark of the camera tracking pipeline, without a camera.
+
+The pipeline is driven on synthetic frames (markers drawn on a flat background) or on a recording made with
+`EmioCamera.start_recording`, replayed as fast as possible. For each stage, the latency distribution is reported,
+and the throughput of the full `DepthCamera.update` is compared to the frame budget of the 30, 60 and 90 fps profiles.
+
+The results are saved in a JSON file, so that they can be compared between releases:
+```bash
+python benchmarks/bench_camera_pipeline.py --output bench_results.json
+python benchmarks/bench_camera_pipeline.py --recording path/to/recording --markers 0
+```
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from importlib import metadata
+
+import numpy as np
+import cv2 as cv
+import pyrealsense2 as rs
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__))+'/..')
+from emioapi._camerarecording import CameraRecorder
+from emioapi._depthcamera import DepthCamera, DEFAULT_CAMERA_PARAMS, MarkerDepthEstimator, PointCloudDeprojector, compute_median_depth
+from emioapi._positionestimation import PositionEstimation, compute_transform_from_pointclouds
+from emioapi._logging_config import logger
+
+
+WIDTH = 640
+HEIGHT = 480
+FPS_PROFILES = [30, 60, 90]
+
+
+def synthetic_intrinsics() -> rs.intrinsics:
+    intrinsics = rs.intrinsics()
+    intrinsics.width, intrinsics.height = WIDTH, HEIGHT
+    intrinsics.ppx, intrinsics.ppy = WIDTH / 2, HEIGHT / 2
+    intrinsics.fx, intrinsics.fy = 600.0, 600.0
+    intrinsics.model = rs.distortion.brown_conrady
+    intrinsics.coeffs = [0.0] * 5
+    return intrinsics
+
+
+def synthetic_frames(index: int, markers: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Noisy dark frame with `markers` green discs at about 250 mm, in front of a background at 800 mm.
+    One marker out of two has no depth at its center, to exercise the depth estimation of the contour.
+    """
+    color = rng.integers(20, 60, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    depth = rng.integers(780, 820, (HEIGHT, WIDTH), dtype=np.uint16)
+    columns = max(1, int(np.ceil(np.sqrt(markers))))
+    for k in range(markers):
+        x = int(WIDTH * ((k % columns) + 0.5) / columns) + int(5 * np.sin(index / 10 + k))
+        y = int(HEIGHT * ((k // columns) + 0.5) / columns)
+        cv.circle(color, (x, y), 10, (60, 200, 60), -1)
+        cv.circle(depth, (x, y), 10, 250, -1)
+        if k % 2:
+            depth[y - 2:y + 3, x - 2:x + 3] = 0
+    return color, depth
+
+
+def make_recording(path: str, frames: int, markers: int, fps: int):
+    rng = np.random.default_rng(0)
+    recorder = CameraRecorder(path, synthetic_intrinsics(), 0.001, fps, "synthetic")
+    for i in range(frames):
+        recorder.write(*synthetic_frames(i, markers, rng), timestamp=i / fps)
+    recorder.close()
+
+
+def latency_stats(samples_ns: list) -> dict:
+    """
+    Latency distribution in milliseconds and throughput in calls per second.
+    """
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    return {"count": int(len(samples)),
+            "mean_ms": float(samples.mean()),
+            "min_ms": float(samples.min()),
+            "p50_ms": float(np.percentile(samples, 50)),
+            "p95_ms": float(np.percentile(samples, 95)),
+            "p99_ms": float(np.percentile(samples, 99)),
+            "max_ms": float(samples.max()),
+            "throughput_per_s": float(1e3 / samples.mean())}
+
+
+def time_calls(function, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        samples.append(time.perf_counter_ns() - start)
+    return latency_stats(samples)
+
+
+def bench_update(recording: str, frames: int, point_cloud: bool, warmup: int=5, roi: tuple=None, **camera_options) -> dict:
+    """
+    Full `DepthCamera.update` on the replayed recording, as fast as possible.
+    """
+    camera = DepthCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), compute_point_cloud=point_cloud, tracking=True,
+                         replay_path=recording, **camera_options)
+    camera.open()
+    camera.replay.loop = True
+    camera.set_roi(roi)
+    samples = []
+    markers = []
+    for i in range(warmup + frames):
+        start = time.perf_counter_ns()
+        camera.update()
+        if i >= warmup:
+            samples.append(time.perf_counter_ns() - start)
+            markers.append(len(camera.trackers_pos))
+    camera.close()
+
+    stats = latency_stats(samples)
+    stats["markers_found_mean"] = float(np.mean(markers))
+    stats["fps_profiles"] = {}
+    for fps in FPS_PROFILES:
+        budget_ms = 1e3 / fps
+        over_budget = np.asarray(samples) / 1e6 > budget_ms
+        stats["fps_profiles"][str(fps)] = {"budget_ms": budget_ms,
+                                           "budget_used": stats["mean_ms"] / budget_ms,
+                                           "frames_over_budget": float(over_budget.mean()),
+                                           "sustainable": bool(stats["p99_ms"] < budget_ms)}
+    return stats
+
+
+def bench_stages(markers: int, repeat: int) -> dict:
+    """
+    The individual stages of the pipeline, on one synthetic frame.
+    """
+    rng = np.random.default_rng(1)
+    intrinsics = synthetic_intrinsics()
+    color, depth = synthetic_frames(0, max(markers, 1), rng)
+    estimator = PositionEstimation(intrinsics, "extended")
+    estimator.compute_camera_to_simulation_transform()
+
+    hsv = cv.cvtColor(color, cv.COLOR_BGR2HSV)
+    mask = cv.inRange(hsv, np.array([36, 138, 35]), np.array([90, 255, 255]))
+    contours, _ = cv.findContours(mask, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+    contour = max(contours, key=cv.contourArea)
+    depth_estimator = MarkerDepthEstimator()
+
+    pixels = np.column_stack((rng.uniform(0, WIDTH, max(markers, 1)),
+                              rng.uniform(0, HEIGHT, max(markers, 1)),
+                              rng.uniform(200, 400, max(markers, 1))))
+    cloud = rng.uniform(-100, 100, (9, 3))
+    deprojector = PointCloudDeprojector(intrinsics, 0.001)
+    vertices = deprojector.calculate(depth)
+    out = np.empty_like(vertices)
+
+    return {
+        "compute_median_depth": time_calls(lambda: compute_median_depth(contour, depth), repeat),
+        "marker_depth_estimator": time_calls(lambda: depth_estimator.estimate(contour, depth), repeat),
+        "camera_image_to_simulation": time_calls(lambda: [estimator.camera_image_to_simulation(*p) for p in pixels], repeat),
+        "camera_image_to_simulation_batch": time_calls(lambda: estimator.camera_image_to_simulation_batch(pixels), repeat),
+        "compute_transform_from_pointclouds": time_calls(lambda: compute_transform_from_pointclouds(cloud, cloud[::-1]), repeat),
+        "point_cloud_deprojection": time_calls(lambda: deprojector.calculate(depth, out=vertices), repeat),
+        "point_cloud_to_simulation": time_calls(lambda: estimator.camera_points_to_simulation(vertices, scale=1000.0, out=out), repeat),
+    }
+
+
+def package_version() -> str:
+    try:
+        return metadata.version("emioapi")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the Emio camera tracking pipeline")
+    parser.add_argument("--frames", type=int, default=300, help="Number of frames processed per configuration")
+    parser.add_argument("--repeat", type=int, default=200, help="Number of calls per stage")
+    parser.add_argument("--markers", type=int, nargs="+", default=[0, 4, 8, 16], help="Marker counts of the synthetic frames")
+    parser.add_argument("--recording", type=str, default=None, help="Recording to replay instead of synthetic frames")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4], choices=[1, 2, 4], help="Downscaling factors of the segmentation")
+    parser.add_argument("--classifiers", type=str, nargs="+", default=["hsv", "lut"], choices=["hsv", "lut"], help="Color classifiers of the segmentation")
+    parser.add_argument("--roi", type=int, nargs=4, default=None, metavar=("X", "Y", "W", "H"), help="Region of interest of the segmentation")
+    parser.add_argument("--output", type=str, default="bench_results.json", help="JSON file where the results are saved")
+    args = parser.parse_args()
+
+    results = {"version": package_version(),
+               "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "platform": {"python": platform.python_version(),
+                            "machine": platform.machine(),
+                            "system": platform.system(),
+                            "processor": platform.processor(),
+                            "numpy": np.__version__,
+                            "opencv": cv.__version__},
+               "roi": args.roi,
+               "update": {},
+               "stages": {}}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.recording is not None:
+            sources = {"recording": args.recording}
+        else:
+            sources = {}
+            for markers in args.markers:
+                sources[f"{markers}_markers"] = os.path.join(tmpdir, f"markers_{markers}")
+                make_recording(sources[f"{markers}_markers"], min(args.frames, 60), markers, FPS_PROFILES[0])
+
+        for name, recording in sources.items():
+            for classifier in args.classifiers:
+                for scale in args.scales:
+                    for point_cloud in [False, True]:
+                        key = f"{name}_{classifier}_scale_{scale}{'_point_cloud' if point_cloud else ''}"
+                        results["update"][key] = bench_update(recording, args.frames, point_cloud, roi=args.roi,
+                                                              segmentation_scale=scale, color_classifier=classifier)
+                        logger.info(f"update {key}: {results['update'][key]['p50_ms']:.2f} ms p50, "
+                                    f"{results['update'][key]['throughput_per_s']:.0f} frames/s")
+
+    for markers in args.markers:
+        results["stages"][f"{markers}_markers"] = bench_stages(markers, args.repeat)
+
+    with open(args.output, "w") as fp:
+        json.dump(results, fp, indent=4)
+    logger.info(f"Results saved in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 from .emiocamera import EmioCamera, CalibrationStatusEnum
 from .emiomotors import EmioMotors
+from ._simulatedbus import SimulatedPortHandler
 from .multiprocessemiocamera import MultiprocessEmioCamera
-from .emioapi import EmioAPI
\ No newline at end of file
+from .cameragroup import CameraGroup
+from .emioapi import EmioAPI
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+class FrameBufferPool:
+    """
+    Preallocated arrays for the processing of the frames, so that the steady state of the pipeline does not allocate images.
+
+    There are two kinds of buffers:
+    - the published buffers (HSV frame, mask, point cloud) which end up in the `FrameResult` of a frame. They rotate over `slots` arrays,
+      so the products of a frame stay valid until `slots - 1` more frames are processed;
+    - the scratch buffers, which are only used during the processing of a frame, and are shared by all the frames.
+
+    The arrays are allocated (zeroed) on first use, and reallocated when the requested shape or dtype changes.
+
+    Args:
+        slots: int: The number of rotating arrays of each published buffer.
+    """
+
+    def __init__(self, slots: int=3):
+        self.slots = slots
+        self.slot = 0
+        self._buffers = {}
+
+
+    def next_frame(self):
+        """
+        Move the published buffers to the arrays of the next frame.
+        """
+        self.slot = (self.slot + 1) % self.slots
+
+
+    def clear(self):
+        """
+        Release all the arrays, for instance when the region of interest changes.
+        """
+        self._buffers.clear()
+
+
+    def published(self, name: str, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        """
+        Get the array of the current frame for a published buffer.
+        """
+        return self._get((name, self.slot), shape, dtype)
+
+
+    def scratch(self, name: str, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        """
+        Get a scratch array.
+        """
+        return self._get((name, None), shape, dtype)
+
+
+    def _get(self, key: tuple, shape: tuple, dtype) -> np.ndarray:
+        array = self._buffers.get(key)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = self._buffers[key] = np.zeros(shape, dtype=dtype)
+        return array
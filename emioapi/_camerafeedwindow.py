@@ -21,6 +21,7 @@ class CameraFeedWindow():
         self.running = True
         self.window = tk.Toplevel(self.rootWindow)
         self.image = None
+        self.rgb = None
 
         self.window.title(self.name)
         # self.window.geometry("640x480")
@@ -59,10 +60,16 @@ class CameraFeedWindow():
             self.trackbarParams[key] = self.default_param[key]
 
     def set_frame(self, frame):
+        if not (self.rootWindow and self.window and self.window.winfo_exists()):
+            return
         # Convert the frame to a format that can be displayed in the Tkinter window
-        frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
-        frame = cv.resize(frame, (640, 480))
-        if self.rootWindow and self.window and self.window.winfo_exists():
-            self.image = ImageTk.PhotoImage(image=Image.fromarray(frame))
+        # The RGB frame and the image of the canvas are reused from one frame to the next
+        if frame.shape[:2] != (480, 640):
+            frame = cv.resize(frame, (640, 480))
+        self.rgb = cv.cvtColor(frame, cv.COLOR_BGR2RGB, dst=self.rgb)
+        if self.image is None:
+            self.image = ImageTk.PhotoImage(image=Image.fromarray(self.rgb))
             self.canvas.imgref = self.image
-            self.canvas.itemconfig(self.canvasImage, image=self.image)
\ No newline at end of file
+            self.canvas.itemconfig(self.canvasImage, image=self.image)
+        else:
+            self.image.paste(Image.fromarray(self.rgb))
\ No newline at end of file
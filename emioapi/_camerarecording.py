@@ -0,0 +1,185 @@
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pyrealsense2 as rs
+
+from emioapi._logging_config import logger
+
+
+METADATA_FILENAME = "metadata.json"
+COLOR_FILENAME = "color.bin"
+DEPTH_FILENAME = "depth.bin"
+TIMESTAMPS_FILENAME = "timestamps.bin"
+
+
+def intrinsics_to_dict(intrinsics) -> dict:
+    """
+    Convert realsense intrinsics to a JSON serializable dict.
+    """
+    return {"width": intrinsics.width,
+            "height": intrinsics.height,
+            "ppx": intrinsics.ppx,
+            "ppy": intrinsics.ppy,
+            "fx": intrinsics.fx,
+            "fy": intrinsics.fy,
+            "model": int(intrinsics.model),
+            "coeffs": list(intrinsics.coeffs)}
+
+
+def intrinsics_from_dict(values: dict) -> rs.intrinsics:
+    """
+    Create realsense intrinsics from a dict created by `intrinsics_to_dict`.
+    """
+    intrinsics = rs.intrinsics()
+    intrinsics.width = values["width"]
+    intrinsics.height = values["height"]
+    intrinsics.ppx = values["ppx"]
+    intrinsics.ppy = values["ppy"]
+    intrinsics.fx = values["fx"]
+    intrinsics.fy = values["fy"]
+    intrinsics.model = rs.distortion(values["model"])
+    intrinsics.coeffs = values["coeffs"]
+    return intrinsics
+
+
+class CameraRecorder:
+    """
+    Record the color and depth frames of a camera to a directory, with everything needed to replay them
+    through the tracking pipeline (intrinsics and depth scale).
+
+    The frames are appended to raw binary files as they arrive, and the metadata is written when the recording
+    starts, so that a recording interrupted by a crash can still be replayed up to the last complete frame.
+
+    Args:
+        path: str: The directory of the recording. It is created if needed, and an existing recording in it is overwritten.
+        intrinsics: The realsense intrinsics of the depth stream.
+        depth_scale: float: The depth units in meters.
+        fps: int: The framerate of the stream.
+        camera_serial: str: The serial number of the recorded camera.
+    """
+
+    def __init__(self, path: str, intrinsics, depth_scale: float, fps: int, camera_serial: str=None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.count = 0
+        metadata = {"intrinsics": intrinsics_to_dict(intrinsics),
+                    "depth_scale": depth_scale,
+                    "fps": fps,
+                    "camera_serial": camera_serial}
+        with open(self.path.joinpath(METADATA_FILENAME), 'w') as fp:
+            json.dump(metadata, fp, indent=4)
+        self._color_file = open(self.path.joinpath(COLOR_FILENAME), 'wb')
+        self._depth_file = open(self.path.joinpath(DEPTH_FILENAME), 'wb')
+        self._timestamps_file = open(self.path.joinpath(TIMESTAMPS_FILENAME), 'wb')
+        logger.info(f"Recording camera frames in {self.path}")
+
+
+    def write(self, color_image: np.ndarray, depth_image: np.ndarray, timestamp: float=None):
+        """
+        Append a pair of frames to the recording.
+
+        Args:
+            color_image: numpy.ndarray: The BGR color frame.
+            depth_image: numpy.ndarray: The z16 depth frame.
+            timestamp: float: The capture time of the frames in seconds. Defaults to the current time.
+        """
+        self._color_file.write(np.ascontiguousarray(color_image, dtype=np.uint8).data)
+        self._depth_file.write(np.ascontiguousarray(depth_image, dtype=np.uint16).data)
+        self._timestamps_file.write(np.float64(time.perf_counter() if timestamp is None else timestamp).tobytes())
+        self.count += 1
+
+
+    def close(self):
+        """
+        Flush and close the recording files.
+        """
+        for file in [self._color_file, self._depth_file, self._timestamps_file]:
+            file.close()
+        logger.info(f"Recorded {self.count} frames in {self.path}")
+
+
+class CameraReplay:
+    """
+    Replay a recording made by `CameraRecorder` as if it came from a camera.
+
+    The recording files are memory mapped, so the frames are read from disk on demand.
+
+    Args:
+        path: str: The directory of the recording.
+        realtime: bool: If True, the frames are delivered at the pace they were recorded. If False (default), as fast as possible.
+        loop: bool: If True, the replay restarts from the first frame when it reaches the end.
+    """
+
+    def __init__(self, path: str, realtime: bool=False, loop: bool=False):
+        self.path = Path(path)
+        self.realtime = realtime
+        self.loop = loop
+        with open(self.path.joinpath(METADATA_FILENAME), 'r') as fp:
+            metadata = json.load(fp)
+        self.intrinsics = intrinsics_from_dict(metadata["intrinsics"])
+        self.depth_scale = metadata["depth_scale"]
+        self.fps = metadata["fps"]
+        self.camera_serial = metadata["camera_serial"]
+        self.height, self.width = self.intrinsics.height, self.intrinsics.width
+
+        # The number of frames is deduced from the file sizes, so that a truncated recording stays readable
+        timestamps = np.fromfile(self.path.joinpath(TIMESTAMPS_FILENAME), dtype=np.float64)
+        color_count = self.path.joinpath(COLOR_FILENAME).stat().st_size // (self.height * self.width * 3)
+        depth_count = self.path.joinpath(DEPTH_FILENAME).stat().st_size // (self.height * self.width * 2)
+        self.count = min(len(timestamps), color_count, depth_count)
+        if self.count == 0:
+            raise ValueError(f"The recording {self.path} is empty")
+
+        self.timestamps = timestamps[:self.count]
+        self.color = np.memmap(self.path.joinpath(COLOR_FILENAME), dtype=np.uint8, mode='r', shape=(self.count, self.height, self.width, 3))
+        self.depth = np.memmap(self.path.joinpath(DEPTH_FILENAME), dtype=np.uint16, mode='r', shape=(self.count, self.height, self.width))
+        self.index = 0
+        self.timestamp = None # Recorded timestamp of the last replayed frame
+        self._start_time = None
+
+
+    @property
+    def finished(self) -> bool:
+        """
+        True when all the frames were replayed and the replay does not loop.
+        """
+        return self.index >= self.count and not self.loop
+
+
+    def get_frame(self) -> tuple:
+        """
+        Get the next pair of frames, waiting for its recorded time in realtime mode.
+
+        Returns:
+            (True, color_image, depth_image, None), or (False, None, None, None) when the replay is finished.
+            The images are copies, they can be modified.
+        """
+        if self.index >= self.count:
+            if not self.loop:
+                return False, None, None, None
+            self.index = 0
+            self._start_time = None
+
+        if self.realtime:
+            now = time.perf_counter()
+            if self._start_time is None:
+                self._start_time = now - (self.timestamps[self.index] - self.timestamps[0])
+            delay = self._start_time + (self.timestamps[self.index] - self.timestamps[0]) - now
+            if delay > 0:
+                time.sleep(delay)
+
+        color_image = np.array(self.color[self.index])
+        depth_image = np.array(self.depth[self.index])
+        self.timestamp = float(self.timestamps[self.index])
+        self.index += 1
+        return True, color_image, depth_image, None
+
+
+    def close(self):
+        """
+        Release the memory mapped files.
+        """
+        self.color = None
+        self.depth = None
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from emioapi._depthcamera import DepthCamera, FrameResult
+from emioapi._logging_config import logger
+
+
+MAX_CONSECUTIVE_ERRORS = 3  # errors in a row after which the thread stops, the isolated errors (e.g. a frame timeout) are retried
+
+class CaptureThread(threading.Thread):
+    """
+    Thread grabbing and processing the frames of a DepthCamera as fast as the camera streams them.
+
+    The results are double buffered: the thread fills the back slot while the consumers read the front
+    slot, then swaps them. `latest` never blocks on the camera, and `wait_for_next` blocks until a
+    newer frame than a given one is processed.
+
+    The feed windows are not refreshed by this thread (tkinter must be used from a single thread), the
+    consumer refreshes them with `DepthCamera.refresh_windows`.
+
+    An error while processing a frame is retried with the next frame. After `MAX_CONSECUTIVE_ERRORS` errors in a row,
+    the thread stops and keeps the last one in `error`, for the consumer to raise it.
+    """
+
+    def __init__(self, camera: DepthCamera):
+        super().__init__(name="EmioCameraCapture", daemon=True)
+        self._camera = camera
+        self._results: list[FrameResult | None] = [None, None]
+        self._front = 0
+        self._condition = threading.Condition()
+        self._running = threading.Event()
+        self.error: Exception | None = None  # The error which stopped the thread, if any
+
+
+    @property
+    def latest(self) -> FrameResult | None:
+        """
+        The result of the last processed frame, None if no frame was processed yet.
+        """
+        return self._results[self._front]
+
+
+    def start(self):
+        self._running.set()
+        super().start()
+
+
+    def run(self):
+        errors = 0
+        while self._running.is_set():
+            try:
+                if not self._camera.update(refresh_windows=False):
+                    if self._camera.replay_finished:
+                        break
+                    continue
+            except Exception as e:
+                if not self._running.is_set():
+                    break
+                errors += 1
+                if errors < MAX_CONSECUTIVE_ERRORS:
+                    logger.warning(f"Error in the camera capture thread, retrying: {e}")
+                    continue
+                logger.exception(f"Error in the camera capture thread: {e}")
+                self.error = e
+                break
+            errors = 0
+
+            back = 1 - self._front
+            self._results[back] = self._camera.result()
+            with self._condition:
+                self._front = back
+                self._condition.notify_all()
+
+        self._running.clear()
+        with self._condition:
+            self._condition.notify_all()
+
+
+    def wait_for_next(self, frame_number: int, timeout: float=None) -> FrameResult | None:
+        """
+        Block until a frame newer than `frame_number` is processed.
+
+        Args:
+            frame_number: int: The number of the last frame known by the caller.
+            timeout: float: The maximum time to wait in seconds. None to wait forever.
+
+        Returns:
+            The result of the newer frame, or None if the timeout expired or the thread stopped.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._condition:
+            while True:
+                result = self._results[self._front]
+                if result is not None and result.frame_number > frame_number:
+                    return result
+                if not self._running.is_set():
+                    return None
+                remaining = None if deadline is None else deadline - time.perf_counter()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+
+    def stop(self, timeout: float=2.0):
+        """
+        Stop the thread and wait for it to finish its current frame.
+        """
+        self._running.clear()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
@@ -0,0 +1,62 @@
+import numpy as np
+import cv2 as cv
+
+
+class HSVLookupClassifier:
+    """
+    Segment the pixels of a BGR frame whose HSV color is within bounds, without converting the frame to HSV.
+
+    Every BGR color is quantized to its 16 bits BGR565 code (5 bits of blue, 6 of green and 5 of red), and the classification of the
+    65536 codes is compiled once in a lookup table. Segmenting a frame is then a BGR565 conversion and a table lookup per pixel.
+    The table is only rebuilt when the bounds change. Because of the quantization, the pixels within a few units of the bounds
+    can be classified differently than by `cv.inRange` on the HSV frame.
+    """
+
+    def __init__(self):
+        self.bounds = None
+        self.table = None
+        self._codes = None # BGR565 codes and table indices of the last classified frame, reused between frames of the same size
+        self._index = None
+        # Center of the BGR888 colors of each BGR565 code
+        codes = np.arange(1 << 16, dtype=np.uint16).view(np.uint8).reshape(256, 256, 2)
+        self._colors = cv.cvtColor(codes, cv.COLOR_BGR5652BGR) | np.array([4, 2, 4], dtype=np.uint8)
+
+
+    def update(self, lower: tuple, upper: tuple) -> bool:
+        """
+        Compile the lookup table for the HSV bounds, if they changed since the last call.
+
+        Args:
+            lower: tuple: The lower (hue, saturation, value) bounds.
+            upper: tuple: The upper (hue, saturation, value) bounds.
+
+        Returns:
+            True if the table was rebuilt.
+        """
+        bounds = (tuple(lower), tuple(upper))
+        if bounds == self.bounds:
+            return False
+        hsv = cv.cvtColor(self._colors, cv.COLOR_BGR2HSV)
+        self.table = cv.inRange(hsv, np.array(bounds[0]), np.array(bounds[1])).ravel()
+        self.bounds = bounds
+        return True
+
+
+    def classify(self, frame: np.ndarray, dst: np.ndarray=None) -> np.ndarray:
+        """
+        Segment a BGR frame with the compiled table.
+
+        Args:
+            frame: numpy.ndarray: The (H, W, 3) BGR frame.
+            dst: numpy.ndarray: Optional (H, W) uint8 array in which the mask is written.
+
+        Returns:
+            numpy.ndarray: The (H, W) mask, 255 for the pixels within the bounds, else 0.
+        """
+        if self._codes is None or self._codes.shape[:2] != frame.shape[:2]:
+            self._codes = np.empty((frame.shape[0], frame.shape[1], 2), dtype=np.uint8)
+            self._index = np.empty(frame.shape[:2], dtype=np.intp)
+        codes = cv.cvtColor(frame, cv.COLOR_BGR2BGR565, dst=self._codes).view(np.uint16)[..., 0]
+        # np.take copies the indices that are not intp, and buffers the output in the default "raise" mode: both are avoided here
+        np.copyto(self._index, codes, casting="unsafe")
+        return np.take(self.table, self._index, out=dst, mode="clip")
@@ -1,15 +1,24 @@
 import os
+import sys
 import json
+import threading
 from time import sleep
 import time
 from enum import Enum
+from dataclasses import dataclass, field
 
 import numpy as np
 import cv2 as cv
 import pyrealsense2 as rs
 
 from ._camerafeedwindow import CameraFeedWindow
-from ._positionestimation import PositionEstimation, image_pixel_to_mm, CONFIG_FILENAME
+from ._camerarecording import CameraRecorder, CameraReplay
+from ._colorclassifier import HSVLookupClassifier
+from ._displaythread import DisplayThread
+from ._bufferpool import FrameBufferPool
+from ._overlay import MarkerObservation, OverlayRenderer
+from ._positionestimation import PositionEstimation, CalibrationSession, image_pixel_to_mm, CONFIG_FILENAME, DEFAULT_WORKSPACE_BOX
+from ._stagetimer import StageTimer
 from emioapi._logging_config import logger
 
 DEFAULT_CAMERA_PARAMS = {"hue_h": 90, "hue_l": 36, "sat_h": 255, "sat_l": 138, "value_h": 255, "value_l": 35, "erosion_size": 0, "area": 100}
@@ -20,6 +29,60 @@ class CalibrationStatusEnum(Enum):
     CALIBRATED = 2
 
 
+@dataclass
+class FrameResult:
+    """
+    The products of the processing of one camera frame.
+    """
+    frame_number: int = 0  # Number of the frame processed by the DepthCamera, starting at 1
+    completed_time: float = 0.0  # time.perf_counter() when the processing of the frame completed
+    timestamp: float = 0.0  # Capture time of the frame in seconds: the librealsense timestamp of the color frame, or the recorded time of a replayed frame
+    hardware_frame_number: int = 0  # Frame number of the color frame given by the camera, or index of the frame in a replayed recording
+    capture_time: float = 0.0  # time.perf_counter() when the frame was captured, estimated from the timestamp if the camera clock is synchronized with the host, else the received time
+    received_time: float = 0.0  # time.perf_counter() when the frames were received from the camera
+    trackers_pos: list = field(default_factory=list)
+    markers: list = field(default_factory=list)  # The MarkerObservation of the tracked markers, in the order of trackers_pos
+    point_cloud: np.ndarray = None
+    frame: np.ndarray = None
+    depth_frame: np.ndarray = None
+    mask: np.ndarray = None  # The binary segmentation mask
+    depth_rsframe: object = None  # The librealsense depth frame, used to colorize the depth window
+    _hsv_frame: np.ndarray = field(default=None, repr=False)
+    _mask_frame: np.ndarray = field(default=None, repr=False)
+
+    @property
+    def latency(self) -> float:
+        """
+        The time in seconds from the capture of the frame to the end of its processing.
+        """
+        return self.completed_time - self.capture_time
+
+    @property
+    def processing_time(self) -> float:
+        """
+        The time in seconds from the reception of the frame to the end of its processing.
+        """
+        return self.completed_time - self.received_time
+
+    @property
+    def hsv_frame(self) -> np.ndarray:
+        """
+        The HSV frame, converted from the color frame on first access if the segmentation did not already compute it.
+        """
+        if self._hsv_frame is None and self.frame is not None:
+            self._hsv_frame = cv.cvtColor(self.frame, cv.COLOR_BGR2HSV)
+        return self._hsv_frame
+
+    @property
+    def mask_frame(self) -> np.ndarray:
+        """
+        The color frame masked by the segmentation mask, computed on first access.
+        """
+        if self._mask_frame is None and self.frame is not None and self.mask is not None:
+            self._mask_frame = cv.bitwise_and(self.frame, self.frame, mask=self.mask)
+        return self._mask_frame
+
+
 def compute_contour_center(contour):
     M = cv.moments(contour)
     cX = 0
@@ -43,6 +106,102 @@ def compute_median_depth(contour, depth_image):
         return 0
 
 
+class MarkerDepthEstimator:
+    """
+    Estimate the depth of a marker from the valid (non zero) depth values inside its contour.
+
+    Only the bounding rectangle of the contour is rasterized and read, in a scratch buffer reused from one call to the next.
+
+    Args:
+        statistic: str: The robust statistic used on the depth values, one of "median" (default), "trimmed_mean" or "percentile".
+        parameter: float: The proportion of values cut at each end for "trimmed_mean" (default 0.1), or the percentile for "percentile" (default 50).
+    """
+    statistics = ["median", "trimmed_mean", "percentile"]
+    default_parameters = {"median": None, "trimmed_mean": 0.1, "percentile": 50.0}
+
+    def __init__(self, statistic: str="median", parameter: float=None):
+        if statistic not in self.statistics:
+            raise ValueError(f"statistic must be one of {self.statistics}")
+        if statistic == "trimmed_mean" and parameter is not None and not 0 <= parameter < 0.5:
+            raise ValueError("the trimmed proportion must be in [0, 0.5)")
+        if statistic == "percentile" and parameter is not None and not 0 <= parameter <= 100:
+            raise ValueError("the percentile must be in [0, 100]")
+        self.statistic = statistic
+        self.parameter = parameter if parameter is not None else self.default_parameters[statistic]
+        self._scratch = np.zeros((0, 0), dtype=np.uint8)
+
+
+    def estimate(self, contour: np.ndarray, depth_image: np.ndarray) -> float:
+        """
+        Args:
+            contour: numpy.ndarray: The contour of the marker, in image coordinates.
+            depth_image: numpy.ndarray: The depth image.
+
+        Returns:
+            The depth of the marker, 0 if there is no valid depth value inside the contour.
+        """
+        x, y, w, h = cv.boundingRect(contour)
+        if self._scratch.shape[0] < h or self._scratch.shape[1] < w:
+            self._scratch = np.zeros((max(h, self._scratch.shape[0]), max(w, self._scratch.shape[1])), dtype=np.uint8)
+        inside = self._scratch[:h, :w]
+        inside.fill(0)
+        # Fills the area bounded by the contour, shifted in the bounding rectangle
+        cv.drawContours(inside, contours=[contour], contourIdx=0, color=255, thickness=-1, offset=(-x, -y))
+
+        depth_roi = depth_image[y:y + h, x:x + w]
+        values = depth_roi[(inside != 0) & (depth_roi > 0)]
+        if len(values) == 0:
+            return 0
+
+        if self.statistic == "median":
+            return np.median(values)
+        if self.statistic == "percentile":
+            return np.percentile(values, self.parameter)
+        values = np.sort(values)
+        cut = int(len(values) * self.parameter)
+        return values[cut:len(values) - cut].mean()
+
+
+class PointCloudDeprojector:
+    """
+    Compute the point cloud of a depth image with numpy, for the frames that do not come from librealsense (replay).
+    The result is the same as `rs.pointcloud` for a distortion free depth stream: the vertices are in meters in the camera frame.
+
+    The per-pixel rays are computed once for the given intrinsics.
+
+    Args:
+        intrinsics: The realsense intrinsics of the depth stream.
+        depth_scale: float: The depth units in meters.
+    """
+
+    def __init__(self, intrinsics, depth_scale: float):
+        self.depth_scale = depth_scale
+        x = (np.arange(intrinsics.width, dtype=np.float32) - intrinsics.ppx) / intrinsics.fx
+        y = (np.arange(intrinsics.height, dtype=np.float32) - intrinsics.ppy) / intrinsics.fy
+        self._rays_x, self._rays_y = np.meshgrid(x, y)
+        # Coordinates of the last frame, merged in the vertices array
+        self._x, self._y, self._z = (np.empty((intrinsics.height, intrinsics.width), dtype=np.float32) for _ in range(3))
+
+
+    def calculate(self, depth_image: np.ndarray, out: np.ndarray=None) -> np.ndarray:
+        """
+        Args:
+            depth_image: numpy.ndarray: The z16 depth image.
+            out: numpy.ndarray: Optional (height * width, 3) float32 array to write the vertices in.
+
+        Returns:
+            The (height * width, 3) float32 array of the vertices.
+        """
+        if out is None:
+            out = np.empty((depth_image.size, 3), dtype=np.float32)
+        # OpenCV converts the depth to float without the temporary buffers numpy needs for the mixed types
+        cv.multiply(depth_image, self.depth_scale, dst=self._z, dtype=cv.CV_32F)
+        cv.multiply(self._rays_x, self._z, dst=self._x)
+        cv.multiply(self._rays_y, self._z, dst=self._y)
+        cv.merge((self._x, self._y, self._z), dst=out.reshape(depth_image.shape[0], depth_image.shape[1], 3))
+        return out
+
+
 def list_cameras() -> list:
     context = rs.context()
     return [d.get_info(rs.camera_info.serial_number) for d in context.devices]
@@ -64,21 +223,44 @@ class DepthCamera:
     initialized = False
     pc = None
     compute_point_cloud = False
+    point_cloud_in_simulation_frame = False
+    workspace_box = None
+    roi = None
+    roi_workspace = None
+    segmentation_scale = 1
+    color_classifier = "hsv"
+    _bounds = None
+    _bounds_arrays = None
     position_estimator: PositionEstimation = None
     parameter = {}
     tracking = False
     trackers_pos = []
+    markers = []
     maskWindow = None
     frameWindow = None
     hsvWindow = None
     depthWindow = None
     rootWindow = None
+    display: DisplayThread = None
+    _colorizer = None
     hsvFrame = None
-    maskFrame = None
+    mask = None
+    _result: FrameResult = None
     frame: np.ndarray = None
     depth_frame: np.ndarray = None
+    depth_rsframe = None
+    frame_number = 0
+    completed_time = 0.0
+    timestamp = 0.0
+    hardware_frame_number = 0
+    capture_time = 0.0
+    received_time = 0.0
     depth_max = 430
     depth_min = 2
+    depth_scale = 0.001
+    replay: CameraReplay = None
+    recorder: CameraRecorder = None
+    timer: StageTimer = None
     calibration_status = CalibrationStatusEnum.NOT_CALIBRATED
 
     @property
@@ -87,6 +269,8 @@ class DepthCamera:
         Returns the serial of the camera as str
 
         """
+        if self.replay is not None:
+            return self.replay.camera_serial
         return self.device.get_info(rs.camera_info.serial_number) if self.device else None
 
 
@@ -96,7 +280,12 @@ class DepthCamera:
                  compute_point_cloud: bool=False,
                  show_video_feed: bool=False,
                  tracking: bool=True,
-                 configuration: str="extended") -> None:
+                 configuration: str="extended",
+                 replay_path: str=None,
+                 replay_realtime: bool=False,
+                 segmentation_scale: int=1,
+                 color_classifier: str="hsv",
+                 threaded_display: bool=None) -> None:
         """
         Initialize the camera and the parameters.
 
@@ -111,18 +300,44 @@ class DepthCamera:
                 If True, the tracking will be enabled.
             configuration: str
                 Configuration of Emio, either "extended" (default) or "compact"
+            replay_path: str
+                If set, the frames are read from this recording (see `start_recording`) instead of a camera.
+            replay_realtime: bool
+                If True, the recording is replayed at the pace it was recorded, else as fast as possible.
+            segmentation_scale: int
+                1 (default), 2 or 4. Above 1, the markers are searched in frames downscaled by this factor, and refined at full resolution around each of them.
+            color_classifier: str
+                "hsv" (default) to segment the HSV frame, or "lut" to classify the BGR frame with a lookup table compiled from the HSV bounds.
+            threaded_display: bool
+                If True, the feed windows are rendered by a display thread which drops the frames it has no time to show, else by `refresh_windows`.
+                Defaults to True, except on macOS where tkinter must run in the main thread.
         """
         self.tracking = tracking
         self.show_video_feed = show_video_feed
         self.compute_point_cloud = compute_point_cloud
         self.configuration = configuration
         self._camera_serial = camera_serial
+        self._replay_path = replay_path
+        self._replay_realtime = replay_realtime
+        self._deprojector = None
+        self.buffers = FrameBufferPool()
+        self._pool_roi = None
+        self._structuring_elements = {}
+        self.overlay = OverlayRenderer()
+        self.threaded_display = sys.platform != "darwin" if threaded_display is None else threaded_display
+        self.depth_estimator = MarkerDepthEstimator()
+        self.timer = StageTimer()
+        self._recorder_lock = threading.Lock()  # the recorder is written by the capture thread and closed by the caller of stop_recording
+        self.set_segmentation_scale(segmentation_scale)
+        self._lut_classifier = HSVLookupClassifier()
+        self.set_color_classifier(color_classifier)
         self.initialized = True
 
         if not self.initialized:
             return
 
         self.trackers_pos = []
+        self.markers = []
 
         if parameter:
             self.parameter = parameter
@@ -142,7 +357,10 @@ class DepthCamera:
         self.initialized = True
 
         if self.show_video_feed:
-            self.create_feed_windows()
+            if self.threaded_display:
+                self.start_display()
+            else:
+                self.create_feed_windows()
 
         # self.update() # to get a first frame and trackers
 
@@ -164,6 +382,58 @@ class DepthCamera:
         else:
             raise ValueError("depth_min must be greater than or equal to 0")
 
+    def set_segmentation_scale(self, scale: int):
+        if scale in [1, 2, 4]:
+            self.segmentation_scale = scale
+        else:
+            raise ValueError("segmentation_scale can only be 1, 2 or 4")
+
+    def set_color_classifier(self, classifier: str):
+        if classifier in ["hsv", "lut"]:
+            self.color_classifier = classifier
+        else:
+            raise ValueError("color_classifier can only be 'hsv' or 'lut'")
+
+    def set_roi(self, roi: tuple | None):
+        """
+        Set the region of interest of the segmentation. The markers are only searched in this region, the rest of the frame is ignored.
+
+        Args:
+            roi: tuple | None: The region (x, y, w, h) in pixels, or None to process the full frame.
+        """
+        if roi is not None:
+            x, y, w, h = (int(v) for v in roi)
+            if x < 0 or y < 0 or w <= 0 or h <= 0 or x + w > self.width or y + h > self.height:
+                raise ValueError(f"The region of interest {roi} is not inside the {self.width}x{self.height} frame")
+            roi = (x, y, w, h)
+        self.roi = roi
+        self.roi_workspace = None
+
+
+    def set_roi_from_workspace(self, box: tuple=DEFAULT_WORKSPACE_BOX, margin: int=20) -> tuple | None:
+        """
+        Set the region of interest of the segmentation to the projection of a workspace volume in the image.
+        The region is computed again when the camera is calibrated.
+
+        Args:
+            box: tuple: The workspace volume ((xmin, ymin, zmin), (xmax, ymax, zmax)) in mm in the Emio frame.
+            margin: int: The number of pixels added around the projection.
+
+        Returns:
+            The region (x, y, w, h), or None if the volume could not be projected, in which case the full frame is processed.
+        """
+        self.roi_workspace = (box, margin)
+        self.roi = None
+        if self.position_estimator is not None:
+            self.roi = self.position_estimator.workspace_roi(self.width, self.height, box, margin)
+            if self.roi is None:
+                logger.warning(f"The workspace {box} is not entirely in front of the camera, processing the full frame.")
+        return self.roi
+
+
+    def set_marker_depth_statistic(self, statistic: str, parameter: float=None):
+        self.depth_estimator = MarkerDepthEstimator(statistic, parameter)
+
 
     def create_feed_windows(self):
         import tkinter as tk
@@ -202,13 +472,44 @@ class DepthCamera:
             self.depthWindow = CameraFeedWindow(rootWindow=self.rootWindow, name='Depth Frame')
 
     def quit(self):
+        self.destroy_feed_windows()
+        self.show_video_feed = False
+
+    def destroy_feed_windows(self):
+        """
+        Close the feed windows and release them. Must be called from the thread that created the windows,
+        as the Tk objects must not be garbage collected from another thread.
+        """
         for window in [self.maskWindow, self.frameWindow, self.hsvWindow, self.depthWindow]:
-            if window is not None:
+            if window is not None and window.running:
                 window.closed()
-        self.rootWindow.destroy()
-        self.show_video_feed = False
+        if self.rootWindow is not None:
+            self.rootWindow.destroy()
+        self.maskWindow = self.frameWindow = self.hsvWindow = self.depthWindow = None
         self.rootWindow = None
 
+    def start_display(self):
+        """
+        Start the display thread, which creates the feed windows, if it is not running.
+        """
+        if self.display is None or not self.display.is_alive():
+            self.display = DisplayThread(self, self.overlay.max_rate)
+            self.display.start()
+
+    def stop_display(self) -> bool:
+        """
+        Stop the display thread, which closes the feed windows.
+
+        Returns:
+            bool: True if the thread was running.
+        """
+        if self.display is None:
+            return False
+        running = self.display.is_alive()
+        self.display.stop()
+        self.display = None
+        return running
+
     def init_realsense(self):
         # Configure depth and color streams
         self.pipeline = rs.pipeline()
@@ -229,12 +530,26 @@ class DepthCamera:
 
         depth_sensor = self.device.first_depth_sensor()
         depth_sensor.set_option(rs.option.depth_units, 0.001)
+        self.depth_scale = depth_sensor.get_depth_scale()
 
         cfg = self.pipeline.start(self.rsconfig)
 
         self.profile = cfg.get_stream(rs.stream.depth)
         self.intr = self.profile.as_video_stream_profile().get_intrinsics()
 
+        self.init_position_estimator()
+
+    def init_replay(self):
+        self.replay = CameraReplay(self._replay_path, realtime=self._replay_realtime)
+        self.intr = self.replay.intrinsics
+        self.depth_scale = self.replay.depth_scale
+        self.height, self.width = self.replay.height, self.replay.width
+        self.fps = self.replay.fps
+        self._deprojector = PointCloudDeprojector(self.intr, self.depth_scale)
+
+        self.init_position_estimator()
+
+    def init_position_estimator(self):
         # Initialize the position estimation by reading the calibration file
         self.position_estimator = PositionEstimation(self.intr, self.configuration)
         self.position_estimator.intr= self.intr
@@ -244,9 +559,15 @@ class DepthCamera:
             logger.error('Position estimation initialization failed. Using default parameters.')
             raise Exception('Position estimation initialization failed. Please check the camera calibration.')
 
+        if self.roi_workspace is not None:
+            self.set_roi_from_workspace(*self.roi_workspace)
+
     def open(self):
         try:
-            self.init_realsense()
+            if self._replay_path is not None:
+                self.init_replay()
+            else:
+                self.init_realsense()
         except Exception as err:
             self.initialized = False
             raise Exception('Could not open depthcamera', str(err))
@@ -254,144 +575,430 @@ class DepthCamera:
 
     def calibrate(self):
         starttime = time.time()
-        first = False
         success = False
         self.calibration_status = CalibrationStatusEnum.CALIBRATING
 
+        # The calibration window is used from this thread, so the windows of the display thread are recreated here
+        restart_display = self.stop_display()
+        if restart_display and self.show_video_feed:
+            self.create_feed_windows()
+
         # Create the windows to display the binrary mask and the HSV frame
         calibration_window = CameraFeedWindow(rootWindow=self.rootWindow, name='Calibration')
 
         if self.position_estimator is not None:
-            while self.position_estimator.count_calibration_frames < 200 and time.time() - starttime < 300:
-                self.position_estimator.intr= self.intr
-                _, color_image, depth_image, _ = self.get_frame()
-                success = self.position_estimator.calibrate(color_image, depth_image, first, calibration_window)
-                first = success if not first else first
+            session = CalibrationSession()
+            while not session.complete and time.time() - starttime < 300:
+                ret, color_image, depth_image, _ = self.get_frame()
+                if ret:
+                    session.add_frame(color_image, depth_image, calibration_window)
                 if self.show_video_feed:
                     self.rootWindow.update()
+            success = session.save()
 
         if success:
             self.position_estimator.compute_camera_to_simulation_transform()
+            if self.roi_workspace is not None:
+                self.set_roi_from_workspace(*self.roi_workspace)
             logger.info(f"Camera {self.camera_serial} successfully calibrated.")
 
         # Close the calibration window
         calibration_window.closed()
+        if restart_display and self.show_video_feed:
+            self.destroy_feed_windows()
+            self.start_display()
 
         self.calibration_status = CalibrationStatusEnum.CALIBRATED if success else CalibrationStatusEnum.NOT_CALIBRATED
         return success
 
 
+    @property
+    def replay_finished(self) -> bool:
+        """
+        True if the frames are replayed from a recording which reached its end.
+        """
+        return self.replay is not None and self.replay.finished
+
+
+    def start_recording(self, path: str):
+        """
+        Record the color and depth frames, the intrinsics and the depth scale in the directory `path`, until `stop_recording` is called.
+        The recording can be replayed with the `replay_path` argument.
+        """
+        recorder = CameraRecorder(path, self.intr, self.depth_scale, self.fps, self.camera_serial)
+        with self._recorder_lock:
+            previous, self.recorder = self.recorder, recorder
+        if previous is not None:
+            previous.close()
+
+
+    def stop_recording(self):
+        with self._recorder_lock:
+            recorder, self.recorder = self.recorder, None
+            # Closed under the lock, so that a frame being written by the capture thread is complete
+            if recorder is not None:
+                recorder.close()
+
+
     def get_frame(self):
+        if self.replay is not None:
+            frames = self.replay.get_frame()
+            self.received_time = self.capture_time = time.perf_counter()
+            self.timestamp = self.replay.timestamp
+            self.hardware_frame_number = self.replay.index
+            return frames
+
         # Wait for a coherent pair of frames: depth and color
 
         frames = self.pipeline.wait_for_frames()
+        self.received_time = time.perf_counter()
 
         depth_frame = frames.get_depth_frame()
         color_frame = frames.get_color_frame()
 
         if not depth_frame or not color_frame:
-            return False, color_frame, depth_frame
+            return False, None, None, None
+        self.hardware_frame_number = color_frame.get_frame_number()
+        self.timer.count_hardware_frame(self.hardware_frame_number)
+        self.timestamp = color_frame.get_timestamp() / 1000.0
+        self.capture_time = self.received_time
+        if color_frame.get_frame_timestamp_domain() in (rs.timestamp_domain.global_time, rs.timestamp_domain.system_time):
+            # The timestamp is in the host system clock: the time elapsed since the capture is moved to the perf_counter clock
+            self.capture_time -= max(0.0, time.time() - self.timestamp)
 
         # Convert images to numpy arrays
         depth_image = np.asanyarray(depth_frame.get_data())
         color_image = np.asanyarray(color_frame.get_data())
+
+        with self._recorder_lock:
+            if self.recorder is not None:
+                self.recorder.write(color_image, depth_image, self.capture_time)
         return True, color_image, depth_image, depth_frame
 
 
-    def update(self):
+    def update(self, refresh_windows: bool=True):
+        """
+        Grab the next frames and process them.
+
+        Args:
+            refresh_windows: bool: If True, the feed windows are refreshed. Set it to False when updating from another thread than the GUI thread, and call `refresh_windows` from the GUI thread.
+
+        Returns:
+            True if a new frame was processed, else False.
+        """
+        timer = self.timer
+        timer.start()
         ret, self.frame, self.depth_frame, depth_rsframe = self.get_frame()
+        timer.lap("wait")
 
         if ret is False:
-            return
+            return False
+        self.depth_rsframe = depth_rsframe
         # if frame is read correctly ret is True
 
-        self.hsvFrame = cv.cvtColor(self.frame, cv.COLOR_BGR2HSV)
+        # The segmentation works on views of the region of interest, written in full size frames which are black outside of it
+        # The arrays are taken from the buffer pool, see `result` for how long they stay valid
+        scale = self.segmentation_scale
+        x0, y0, w, h = self.roi if self.roi is not None else (0, 0, self.frame.shape[1], self.frame.shape[0])
+        w, h = w - w % scale, h - h % scale
+        if (x0, y0, w, h) != self._pool_roi:
+            self._pool_roi = (x0, y0, w, h)
+            self.buffers.clear() # the published frames must be black outside of the new region
+        self.buffers.next_frame()
+        pool = self.buffers
+        mask = pool.published("mask", self.frame.shape[:2])
+        if scale == 1:
+            frame_seg = self.frame[y0:y0 + h, x0:x0 + w]
+            depth_seg = self.depth_frame[y0:y0 + h, x0:x0 + w]
+            mask_seg = mask[y0:y0 + h, x0:x0 + w]
+        else:
+            # Pyramid mode: the blobs are found in the downscaled region, and refined at full resolution around each of them
+            size = (w // scale, h // scale)
+            frame_seg = cv.resize(self.frame[y0:y0 + h, x0:x0 + w], size, dst=pool.scratch("frame_seg", (size[1], size[0], 3)),
+                                  interpolation=cv.INTER_LINEAR)
+            depth_seg = cv.resize(self.depth_frame[y0:y0 + h, x0:x0 + w], size, dst=pool.scratch("depth_seg", (size[1], size[0]), np.uint16),
+                                  interpolation=cv.INTER_NEAREST) # no averaging with the invalid depths
+            mask_seg = pool.scratch("mask_seg", (size[1], size[0]))
+            mask[y0:y0 + h, x0:x0 + w] = 0 # the windows of the markers of an older frame
 
         # color definition
-        red_lower = np.array([self.parameter['hue_l'], self.parameter['sat_l'], self.parameter['value_l']])
-        red_upper = np.array([self.parameter['hue_h'], self.parameter['sat_h'], self.parameter['value_h']])
+        red_lower, red_upper = self._color_bounds()
 
         # red color mask (sort of thresholding, actually segmentation)
-        mask = cv.inRange(self.hsvFrame, red_lower, red_upper)
-        mask2 = cv.inRange(self.depth_frame, self.depth_min, self.depth_max)
-
-        mask = cv.bitwise_and(mask, mask2, mask=mask)
-
-        erosion_shape = cv.MORPH_RECT
-        erosion_size = self.parameter['erosion_size']
-        element = cv.getStructuringElement(erosion_shape, (2 * erosion_size + 1, 2 * erosion_size + 1),
-                                           (erosion_size, erosion_size))
-
-        mask = cv.erode(mask, element, iterations=3)
-        mask = cv.dilate(mask, element, iterations=3)
-
-        self.maskFrame = cv.bitwise_and(self.frame, self.frame, mask=mask)
-
+        if self.color_classifier == "lut":
+            self.hsvFrame = None # Only computed for the feed windows
+            mask_seg = self._lut_classifier.classify(frame_seg, dst=mask_seg)
+        else:
+            if scale == 1:
+                self.hsvFrame = pool.published("hsv", self.frame.shape)
+                hsv_seg = cv.cvtColor(frame_seg, cv.COLOR_BGR2HSV, dst=self.hsvFrame[y0:y0 + h, x0:x0 + w])
+            else:
+                self.hsvFrame = None # Only computed for the feed windows
+                hsv_seg = cv.cvtColor(frame_seg, cv.COLOR_BGR2HSV, dst=pool.scratch("hsv_seg", frame_seg.shape))
+            timer.lap("hsv")
+            mask_seg = cv.inRange(hsv_seg, red_lower, red_upper, dst=mask_seg)
+        mask2 = cv.inRange(depth_seg, self.depth_min, self.depth_max, dst=pool.scratch("depth_mask", mask_seg.shape))
+
+        cv.bitwise_and(mask_seg, mask2, dst=mask_seg, mask=mask_seg)
+        timer.lap("threshold")
+
+        element = self._structuring_element(self.parameter['erosion_size'] // scale)
+        cv.erode(mask_seg, element, dst=mask_seg, iterations=3)
+        cv.dilate(mask_seg, element, dst=mask_seg, iterations=3)
+        if scale != 1 and not self.tracking:
+            # When tracking, the mask is only written at full resolution in the windows of the markers, see `_refine_contours`
+            cv.resize(mask_seg, (w, h), dst=mask[y0:y0 + h, x0:x0 + w], interpolation=cv.INTER_NEAREST)
+        self.mask = mask
+        timer.lap("morphology")
+
+        markers_count = None
         if self.tracking:
-            contours, _ = cv.findContours(mask, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+            if scale == 1:
+                contours, _ = cv.findContours(mask_seg, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE, offset=(x0, y0))
+            else:
+                candidates, _ = cv.findContours(mask_seg, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+                contours = self._refine_contours(candidates, (x0, y0, w, h), red_lower, red_upper)
+            timer.lap("contours")
+            markers_count = 0
+            # Cleared even without contours, so that a frame without blobs does not republish the previous detections
+            self.trackers_pos = []
+            self.markers = []
             if len(contours) != 0:
                 areas = [cv.contourArea(cnt) for cnt in contours]
 
-                self.trackers_pos = []
+                markers = [] # (contour index, x, y, depth) of the markers, converted to the Emio frame in one pass
                 for i, a in enumerate(areas):
                     if a > self.parameter['area']:
                         x, y = compute_contour_center(contours[i])
-                        marker_mask = np.zeros_like(mask)
+                        depth = self.depth_estimator.estimate(contours[i], self.depth_frame) if self.depth_frame[y, x] == 0 else self.depth_frame[y, x]
+                        markers.append((i, x, y, depth))
+
+                if markers:
+                    pixels = np.array([marker[1:] for marker in markers], dtype=np.float64)
+                    self.trackers_pos = self.position_estimator.camera_image_to_simulation_batch(pixels).tolist()
+                    # The annotations are drawn from these by the overlay, only for the feed windows
+                    self.markers = [MarkerObservation(i, x, y, depth, tuple(position), contours[i])
+                                    for (i, x, y, depth), position in zip(markers, self.trackers_pos)]
+                markers_count = len(markers)
+                timer.lap("depth")
 
-                        depth = compute_median_depth(contours[i], self.depth_frame) if self.depth_frame[y, x] == 0 else self.depth_frame[y, x]
-                        worldx, worldy, worldz = self.position_estimator.camera_image_to_simulation(x, y, depth)
-                        self.trackers_pos.append([worldx, worldy, worldz])
+        if self.compute_point_cloud:
+            if depth_rsframe is not None:
+                points = self.pc.calculate(depth_rsframe)
+                v = points.get_vertices()
+                vertices = np.asanyarray(v).view(np.float32).reshape(-1, 3)  # xyz
+            else:
+                vertices = self._deprojector.calculate(self.depth_frame, out=pool.published("vertices", (self.depth_frame.size, 3), np.float32))
+            timer.lap("deprojection")
+            if self.point_cloud_in_simulation_frame:
+                # The vertices are in meters, the Emio frame is in mm
+                self.point_cloud = self.position_estimator.camera_points_to_simulation(vertices, scale=1000.0,
+                                                                                       out=pool.published("point_cloud", vertices.shape, np.float32),
+                                                                                       box=self.workspace_box)
+            else:
+                self.point_cloud = vertices
+            timer.lap("point_cloud")
+
+        self.frame_number += 1
+        self.completed_time = time.perf_counter()
+        timer.count_frame(markers_count)
+
+        if refresh_windows:
+            self.refresh_windows(self.result())
+
+        return True
+
+
+    def _color_bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The lower and upper HSV bounds of the segmentation from the parameters.
+        They are only rebuilt, and the lookup table of the classifier compiled, when the parameters change.
+        """
+        bounds = (self.parameter['hue_l'], self.parameter['sat_l'], self.parameter['value_l'],
+                  self.parameter['hue_h'], self.parameter['sat_h'], self.parameter['value_h'])
+        if bounds != self._bounds:
+            self._bounds = bounds
+            self._bounds_arrays = (np.array(bounds[:3]), np.array(bounds[3:]))
+        if self.color_classifier == "lut":
+            self._lut_classifier.update(bounds[:3], bounds[3:])
+        return self._bounds_arrays
 
-                        cv.drawContours(marker_mask, [contours[i]], -1, color=255, thickness=-1)
-                        for frame in [self.hsvFrame, self.frame]:
-                            cv.circle(frame, (x, y), 2, color=255, thickness=-1)
-                            cv.putText(frame, f"{i} ({x}, {y}, {depth})", (x, y), cv.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
-                            cv.putText(frame, f"{i} ({worldx:.2f}, {worldy:.2f}, {worldz:.2f})", (x, y + 15), cv.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
 
-                        if self.show_video_feed:
-                            cv.drawContours(self.frame, [contours[i]], -1, (255, 255, 0), 3)
+    def _color_mask(self, frame: np.ndarray, lower: np.ndarray, upper: np.ndarray, dst: np.ndarray=None) -> np.ndarray:
+        """
+        Segment the pixels of a BGR frame within the HSV bounds, with the selected color classifier.
+        """
+        if self.color_classifier == "lut":
+            return self._lut_classifier.classify(frame, dst=dst)
+        return cv.inRange(cv.cvtColor(frame, cv.COLOR_BGR2HSV), lower, upper, dst=dst)
 
-        if self.compute_point_cloud:
-            points = self.pc.calculate(depth_rsframe)
-            v = points.get_vertices()
-            self.point_cloud = np.asanyarray(v).view(np.float32).reshape(-1, 3)  # xyz
 
-        if self.show_video_feed:
-            if self.rootWindow is None:
-                self.create_feed_windows()
+    def _structuring_element(self, erosion_size: int) -> np.ndarray:
+        """
+        The rectangular structuring element of the morphology, of size 2 * erosion_size + 1, cached per size.
+        """
+        element = self._structuring_elements.get(erosion_size)
+        if element is None:
+            element = self._structuring_elements[erosion_size] = cv.getStructuringElement(cv.MORPH_RECT, (2 * erosion_size + 1, 2 * erosion_size + 1),
+                                                                                         (erosion_size, erosion_size))
+        return element
+
+
+    def _refine_contours(self, candidates: tuple, roi: tuple, lower: np.ndarray, upper: np.ndarray) -> list:
+        """
+        Segment the full resolution frames in a small window around each blob found in the downscaled frames.
+        The refined segmentation is written in `self.mask`.
+
+        Args:
+            candidates: The contours of the blobs in the downscaled region of interest.
+            roi: (x, y, w, h): The region of interest in the full resolution frames.
+            lower, upper: The HSV thresholds.
 
-            if self.maskWindow is not None and self.maskWindow.running:
-                self.maskWindow.set_frame(self.maskFrame)
+        Returns:
+            The contours larger than the area threshold found in the windows, in full resolution frame coordinates.
+            A window can hold several markers, and a marker can be in several overlapping windows: it is only returned once.
+        """
+        scale = self.segmentation_scale
+        x0, y0, w, h = roi
+        min_area = self.parameter['area'] / (2 * scale * scale) # the downscaled blobs are only filtered loosely, the final test is at full resolution
+        element = self._structuring_element(self.parameter['erosion_size'])
+
+        found = [] # (area, contour) of all the windows
+        for candidate in candidates:
+            if cv.contourArea(candidate) <= min_area:
+                continue
+            bx, by, bw, bh = cv.boundingRect(candidate)
+            # Window of the blob in the full resolution frames, with one downscaled pixel of margin
+            wx0, wy0 = x0 + max((bx - 1) * scale, 0), y0 + max((by - 1) * scale, 0)
+            wx1, wy1 = x0 + min((bx + bw + 1) * scale, w), y0 + min((by + bh + 1) * scale, h)
+
+            window_mask = self._color_mask(self.frame[wy0:wy1, wx0:wx1], lower, upper, dst=self.mask[wy0:wy1, wx0:wx1])
+            depth_mask = cv.inRange(self.depth_frame[wy0:wy1, wx0:wx1], self.depth_min, self.depth_max)
+            cv.bitwise_and(window_mask, depth_mask, dst=window_mask, mask=window_mask)
+            cv.erode(window_mask, element, dst=window_mask, iterations=3)
+            cv.dilate(window_mask, element, dst=window_mask, iterations=3)
+
+            refined, _ = cv.findContours(window_mask, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE, offset=(wx0, wy0))
+            for contour in refined:
+                area = cv.contourArea(contour)
+                if area > self.parameter['area']:
+                    found.append((area, contour))
+
+        # The largest contours first, so that a marker cut by the border of a window is replaced by its whole contour from another window
+        contours = []
+        for _, contour in sorted(found, key=lambda item: item[0], reverse=True):
+            x, y = compute_contour_center(contour)
+            if not any(cv.pointPolygonTest(kept, (float(x), float(y)), False) >= 0 for kept in contours):
+                contours.append(contour)
+        return contours
+
+
+    @property
+    def maskFrame(self) -> np.ndarray:
+        """
+        The color frame masked by the segmentation mask of the last processed frame, computed on first access.
+        """
+        return self.result().mask_frame
+
+
+    def result(self) -> FrameResult:
+        """
+        Get the products of the last processed frame.
+        The result is created once per frame, so that the products computed on demand (mask frame) are cached for the frame.
+        Its HSV frame, mask and point cloud are arrays of the buffer pool: they stay valid until `FrameBufferPool.slots - 1` (2) more frames are processed.
+        """
+        if self._result is None or self._result.frame_number != self.frame_number:
+            self._result = FrameResult(frame_number=self.frame_number,
+                                       completed_time=self.completed_time,
+                                       timestamp=self.timestamp,
+                                       hardware_frame_number=self.hardware_frame_number,
+                                       capture_time=self.capture_time,
+                                       received_time=self.received_time,
+                                       trackers_pos=self.trackers_pos,
+                                       point_cloud=self.point_cloud if self.compute_point_cloud else None,
+                                       frame=self.frame,
+                                       depth_frame=self.depth_frame,
+                                       mask=self.mask,
+                                       depth_rsframe=self.depth_rsframe,
+                                       markers=self.markers,
+                                       _hsv_frame=self.hsvFrame)
+        return self._result
+
+
+    def refresh_windows(self, result: FrameResult):
+        """
+        Show the frames of a processed frame in the feed windows, if the video feed is shown.
+        With `threaded_display`, the result is only posted to the display thread, and this can be called from any thread.
+        Else, it must be called from the thread that created the windows.
+        """
+        if self.show_video_feed and result.frame is not None:
+            start = time.perf_counter_ns()
+            if self.threaded_display:
+                self.start_display()
+                self.display.post(result)
+            else:
+                if self.rootWindow is None:
+                    self.create_feed_windows()
+
+                # The frames are rendered at most at the overlay rate, the events of the windows are processed at each call
+                if self.overlay.due():
+                    self.render_windows(result)
+                self.rootWindow.update()
+            self.timer.record("gui", time.perf_counter_ns() - start)
+
+
+    def render_windows(self, result: FrameResult):
+        """
+        Render a processed frame in the open feed windows.
+        Must be called from the thread that created the windows.
+        """
+        # All the images are copied or converted before the windows are updated, so that the buffers of the result
+        # are read as soon as possible, before the buffer pool reuses them (see `result`)
+        images = []
+        if self.maskWindow is not None and self.maskWindow.running:
+            images.append((self.maskWindow, result.mask_frame))
 
-            if self.frameWindow is not None and self.frameWindow.running:
-                self.frameWindow.set_frame(self.frame)
+        if self.frameWindow is not None and self.frameWindow.running:
+            images.append((self.frameWindow, self.overlay.draw("frame", result.frame, result.markers)))
 
-            if self.hsvWindow is not None and self.hsvWindow.running:
-                self.hsvWindow.set_frame(self.hsvFrame)
+        if self.hsvWindow is not None and self.hsvWindow.running:
+            images.append((self.hsvWindow, self.overlay.draw("hsv", result.hsv_frame, result.markers, contours=False)))
 
-            if self.depthWindow is not None and self.depthWindow.running:
-                colorized = np.asanyarray(rs.colorizer().colorize(depth_rsframe).get_data())
-                self.depthWindow.set_frame(colorized)
+        if self.depthWindow is not None and self.depthWindow.running:
+            if result.depth_rsframe is not None:
+                if self._colorizer is None:
+                    self._colorizer = rs.colorizer()
+                colorized = np.asanyarray(self._colorizer.colorize(result.depth_rsframe).get_data())
+            else:
+                colorized = cv.applyColorMap(cv.convertScaleAbs(result.depth_frame, alpha=255.0 / self.depth_max), cv.COLORMAP_JET)
+            images.append((self.depthWindow, colorized))
 
-            self.rootWindow.update()
+        for window, image in images:
+            window.set_frame(image)
 
 
     def close(self):
         try:
             self.initialized = False
+            self.stop_recording()
+            if self.replay:
+                self.replay.close()
             if self.pipeline:
                 self.pipeline.stop()
-            if self.rootWindow:
-                self.rootWindow.destroy()
+            self.stop_display()
+            self.destroy_feed_windows()
         except:
             pass
 
 
     def run_loop(self):
         while True:
-            if self.rootWindow is None or not self.rootWindow.winfo_exists():
+            if self.threaded_display:
+                if not self.show_video_feed:
+                    break
+            elif self.rootWindow is None or not self.rootWindow.winfo_exists():
                 break
-            if self.show_video_feed:
+            elif self.show_video_feed:
                 self.rootWindow.update()
             self.update()
 
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from emioapi._logging_config import logger
+
+
+class FrameMailbox:
+    """
+    Single slot mailbox between the tracking and the display.
+
+    `post` never blocks: a new item replaces the one which was not taken yet, which is counted as dropped.
+    `take` returns the latest item, at most once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+        self.posted = 0
+        self.dropped = 0
+
+
+    def post(self, item):
+        with self._lock:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self.posted += 1
+
+
+    def take(self):
+        """
+        Get the latest posted item and empty the mailbox.
+
+        Returns:
+            The item, or None if nothing was posted since the last call.
+        """
+        with self._lock:
+            item, self._item = self._item, None
+        return item
+
+
+class DisplayThread(threading.Thread):
+    """
+    Thread owning the feed windows of a DepthCamera (tkinter must be used from a single thread).
+
+    The tracking posts its results with `post`, which never blocks. The thread renders the latest one at most
+    `max_rate` times per second and processes the events of the windows in between. The results posted while it
+    renders are dropped, so the tracking rate does not depend on the windows.
+    It stops when the windows are closed, when the video feed is hidden, or with `stop`.
+
+    Args:
+        camera: DepthCamera: The camera whose `create_feed_windows`, `render_windows` and `destroy_feed_windows` are called from this thread.
+        max_rate: float: The maximum number of renderings per second.
+    """
+
+    def __init__(self, camera, max_rate: float=30.0):
+        super().__init__(name="EmioCameraDisplay", daemon=True)
+        self._camera = camera
+        self.max_rate = max_rate
+        self.mailbox = FrameMailbox()
+        self._running = threading.Event()
+
+
+    def start(self):
+        self._running.set()
+        super().start()
+
+
+    def post(self, result):
+        """
+        Give the result of a processed frame to the display.
+        """
+        self.mailbox.post(result)
+
+
+    def run(self):
+        camera = self._camera
+        try:
+            camera.create_feed_windows()
+            while self._running.is_set() and camera.show_video_feed and camera.rootWindow is not None:
+                start = time.perf_counter()
+                result = self.mailbox.take()
+                if result is not None:
+                    camera.render_windows(result)
+                if camera.rootWindow is not None: # the windows may be closed by the events
+                    camera.rootWindow.update()
+                time.sleep(max(0.0, 1.0 / self.max_rate - (time.perf_counter() - start)))
+        except Exception as e:
+            logger.exception(f"Error in the camera display thread, the video feed is hidden: {e}")
+            camera.show_video_feed = False
+        finally:
+            camera.destroy_feed_windows()
+            self._running.clear()
+
+
+    def stop(self, timeout: float=2.0):
+        """
+        Stop the thread, which closes the windows.
+        """
+        self._running.clear()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import numpy as np
+
+from emioapi._motorbus import angles_to_pulses
+from emioapi._logging_config import logger
+
+
+class GoalWriter:
+    """
+    Command path of the goal angles of the motors, which only writes the goals that change the goal position of a motor.
+
+    The goal angles are quantized to pulses, as the motors do, and a goal which would not change the goal pulse of any motor
+    (the same angles, or a difference smaller than the resolution of the encoders) is suppressed. With a `period`, the writes
+    are also coalesced: a goal submitted less than `period` after the last write is kept pending, replaced by the next ones,
+    and only the latest is written when the period has elapsed, so there is at most one write per period.
+
+    Args:
+        write: The function writing goal angles in rad to the motors.
+        pulse_center: int: The pulse of the 0 rad angle.
+        period: float: The minimum time between two writes in seconds, 0 to write the changes immediately.
+    """
+
+    def __init__(self, write, pulse_center: int, period: float=0.0):
+        if period < 0:
+            raise ValueError("The write period must be positive or zero")
+        self.pulse_center = pulse_center
+        self.period = period
+        self._write = write
+        self._lock = threading.Lock()
+        self._written = None  # goal pulses of the last write
+        self._pending = None  # (angles, pulses) waiting for the end of the period
+        self._timer = None
+        self._last_write = -np.inf
+        self.submitted = 0
+        self.issued = 0
+        self.suppressed = 0
+        self.coalesced = 0
+
+
+    def submit(self, angles) -> bool:
+        """
+        Submit new goal angles in rad.
+
+        Returns:
+            bool: True if the goals were written, False if they were suppressed or are pending.
+        """
+        angles = list(angles)  # copied, the caller may reuse its array while the goals are pending
+        pulses = angles_to_pulses(angles, self.pulse_center)
+        with self._lock:
+            self.submitted += 1
+            target = self._pending[1] if self._pending is not None else self._written
+            if target is not None and np.array_equal(pulses, target):
+                self.suppressed += 1
+                return False
+            if self._pending is not None:
+                self.coalesced += 1
+            elif time.perf_counter() - self._last_write >= self.period:
+                self._issue(angles, pulses)
+                return True
+
+            self._pending = (angles, pulses)
+            if self._timer is None:
+                delay = max(self._last_write + self.period - time.perf_counter(), 0.0)
+                self._timer = threading.Timer(delay, self._write_pending)
+                self._timer.daemon = True
+                self._timer.start()
+            return False
+
+
+    def flush(self):
+        """
+        Write the pending goals now, if any.
+        """
+        with self._lock:
+            self._flush()
+
+
+    def reset(self):
+        """
+        Drop the pending goals and forget the last goals written, so the next goals are always written.
+        To use when the goals of the motors were changed by another path, for instance after a reconnection.
+        """
+        with self._lock:
+            self._cancel_timer()
+            self._pending = None
+            self._written = None
+
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the goals.
+
+        Returns:
+            A dict with the number of goals `submitted`, of writes `issued`, and of goals `suppressed` (no change of the goal pulses)
+            and `coalesced` (replaced by a newer goal before being written).
+        """
+        return {"submitted": self.submitted,
+                "issued": self.issued,
+                "suppressed": self.suppressed,
+                "coalesced": self.coalesced}
+
+
+    def _write_pending(self):
+        with self._lock:
+            if self._timer is not threading.current_thread():
+                return  # cancelled while waiting for the lock
+            self._timer = None
+            try:
+                self._flush()
+            except Exception as e:
+                logger.error(f"Failed to write the pending goals of the motors: {e}")
+
+
+    def _flush(self):
+        self._cancel_timer()
+        if self._pending is None:
+            return
+        angles, pulses = self._pending
+        self._pending = None
+        if self._written is not None and np.array_equal(pulses, self._written):
+            self.suppressed += 1
+            return
+        self._issue(angles, pulses)
+
+
+    def _issue(self, angles, pulses):
+        self._write(angles)
+        self._written = pulses
+        self._last_write = time.perf_counter()
+        self.issued += 1
+
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
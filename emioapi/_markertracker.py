@@ -0,0 +1,153 @@
+import numpy as np
+
+from emioapi._logging_config import logger
+
+
+class MarkerTracker:
+    """
+    Give stable identities to the markers detected by the camera, from one frame to the next.
+
+    Each identity (track) has a constant velocity filter (alpha-beta filter). At each frame, the tracks are predicted to the time of the
+    frame, and the detections are assigned to the tracks by increasing distance to the prediction (global nearest neighbour), within
+    the `gate` distance. The detections which are not assigned start a new track, and the tracks which are not detected for more than
+    `max_missed` frames are dropped, their identity can then be reused.
+
+    Args:
+        gate: float: The maximum distance in mm between a prediction and a detection to assign them.
+        max_missed: int: The number of consecutive frames a track is kept while it is not detected.
+        alpha: float: The position gain of the filter, in [0, 1]. 1 follows the detections exactly.
+        beta: float: The velocity gain of the filter, in [0, 1]. 0 disables the velocity estimation.
+    """
+
+    def __init__(self, gate: float=15.0, max_missed: int=5, alpha: float=0.8, beta: float=0.3):
+        self.gate = gate
+        self.max_missed = max_missed
+        self.alpha = alpha
+        self.beta = beta
+        self.reset()
+
+
+    def reset(self):
+        """
+        Drop all the tracks.
+        """
+        self.positions = np.zeros((0, 3))
+        self.velocities = np.zeros((0, 3))
+        self.active = np.zeros(0, dtype=bool)   # True while the identity is used by a marker
+        self.valid = np.zeros(0, dtype=bool)    # True if the marker was detected in the last frame
+        self.missed = np.zeros(0, dtype=np.int64)
+        self.timestamp = None
+
+
+    @property
+    def count(self) -> int:
+        """
+        The number of identities, including the inactive ones. The identities are the indices in [0, count).
+        """
+        return len(self.active)
+
+
+    def predict(self, timestamp: float) -> np.ndarray:
+        """
+        Get the positions of the tracks extrapolated at `timestamp` with their velocity.
+
+        Args:
+            timestamp: float: The time in seconds, in the same clock as the timestamps given to `update`.
+
+        Returns:
+            numpy.ndarray: The (count, 3) positions in identity order. The rows of the inactive identities are NaN.
+        """
+        dt = 0.0 if self.timestamp is None else timestamp - self.timestamp
+        positions = self.positions + self.velocities * dt
+        positions[~self.active] = np.nan
+        return positions
+
+
+    def update(self, detections: np.ndarray, timestamp: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Assign the detections of a frame to the tracks and update their filters.
+
+        Args:
+            detections: numpy.ndarray: The (N, 3) positions of the markers detected in the frame, in any order.
+            timestamp: float: The time of the frame in seconds.
+
+        Returns:
+            (positions, valid): the (count, 3) filtered positions in identity order, NaN for the inactive identities,
+            and the (count,) flags which are True for the identities detected in this frame.
+        """
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 3)
+        dt = 0.0 if self.timestamp is None else max(timestamp - self.timestamp, 0.0)
+        self.timestamp = timestamp
+
+        predicted = self.positions + self.velocities * dt
+        tracks, assigned = self._assign(predicted, detections)
+
+        # Update the filters of the assigned tracks
+        residuals = detections[assigned] - predicted[tracks]
+        self.positions = predicted
+        self.positions[tracks] += self.alpha * residuals
+        if dt > 0:
+            self.velocities[tracks] += (self.beta / dt) * residuals
+
+        # The tracks which were not detected coast on their velocity, and are dropped after max_missed frames
+        self.valid = np.zeros(self.count, dtype=bool)
+        self.valid[tracks] = True
+        self.missed[self.valid] = 0
+        self.missed[~self.valid & self.active] += 1
+        self.active &= self.missed <= self.max_missed
+
+        # The detections which were not assigned start new tracks, in the free identities first
+        new = np.ones(len(detections), dtype=bool)
+        new[assigned] = False
+        if new.any():
+            self._start_tracks(detections[new])
+
+        return self.predict(timestamp), self.valid.copy()
+
+
+    def _assign(self, predicted: np.ndarray, detections: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Assign the detections to the active tracks by increasing distance, within the gate.
+
+        Returns:
+            The indices of the assigned tracks and of their detections.
+        """
+        active = np.flatnonzero(self.active)
+        if len(active) == 0 or len(detections) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        distances = np.linalg.norm(predicted[active, None, :] - detections[None, :, :], axis=2)
+        rows, cols = np.nonzero(distances <= self.gate)
+        order = np.argsort(distances[rows, cols], kind="stable")
+
+        tracks, assigned = [], []
+        used_rows = np.zeros(len(active), dtype=bool)
+        used_cols = np.zeros(len(detections), dtype=bool)
+        for row, col in zip(rows[order], cols[order]):
+            if not used_rows[row] and not used_cols[col]:
+                used_rows[row] = used_cols[col] = True
+                tracks.append(active[row])
+                assigned.append(col)
+        return np.array(tracks, dtype=np.int64), np.array(assigned, dtype=np.int64)
+
+
+    def _start_tracks(self, detections: np.ndarray):
+        """
+        Start a track for each detection, reusing the inactive identities before creating new ones.
+        """
+        free = np.flatnonzero(~self.active)[:len(detections)]
+        added = len(detections) - len(free)
+        if added > 0:
+            self.positions = np.vstack((self.positions, np.zeros((added, 3))))
+            self.velocities = np.vstack((self.velocities, np.zeros((added, 3))))
+            self.active = np.concatenate((self.active, np.zeros(added, dtype=bool)))
+            self.valid = np.concatenate((self.valid, np.zeros(added, dtype=bool)))
+            self.missed = np.concatenate((self.missed, np.zeros(added, dtype=np.int64)))
+            free = np.concatenate((free, np.arange(self.count - added, self.count)))
+            logger.debug(f"Marker tracker: {added} new identities, {self.count} in total")
+
+        self.positions[free] = detections
+        self.velocities[free] = 0.0
+        self.active[free] = True
+        self.valid[free] = True
+        self.missed[free] = 0
@@ -0,0 +1,195 @@
+import threading
+import time
+from math import pi
+
+import numpy as np
+from dynamixel_sdk import PacketHandler, GroupSyncRead, GroupSyncWrite, COMM_SUCCESS
+
+
+# Control table of the XM430 motors (protocol 2.0)
+ADDR_GOAL_POSITION = 116
+LEN_GOAL_POSITION = 4
+GOAL_POSITION_MIN, GOAL_POSITION_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+ADDR_STATE = 122  # Start of the span from `Moving` to `Present Temperature`, read in one sync read
+LEN_STATE = 25
+
+# Layout of the state span, little endian as on the bus
+STATE_DTYPE = np.dtype([("moving", "u1"),               # 122 Moving
+                        ("moving_status", "u1"),        # 123 Moving Status
+                        ("pwm", "<i2"),                 # 124 Present PWM
+                        ("current", "<i2"),             # 126 Present Current
+                        ("velocity", "<i4"),            # 128 Present Velocity
+                        ("position", "<i4"),            # 132 Present Position
+                        ("velocity_trajectory", "<i4"), # 136 Velocity Trajectory
+                        ("position_trajectory", "<i4"), # 140 Position Trajectory
+                        ("voltage", "<u2"),             # 144 Present Input Voltage
+                        ("temperature", "u1")])         # 146 Present Temperature
+
+PULSES_PER_TURN = 4096
+RAD_TO_PULSE = PULSES_PER_TURN / (2 * pi)
+VELOCITY_UNIT = 0.229 * 2 * pi / 60  # rad/s per unit of Present Velocity (0.229 rpm)
+CURRENT_UNIT = 2.69  # mA per unit of Present Current
+PWM_UNIT = 100 / 885  # % per unit of Present PWM
+VOLTAGE_UNIT = 0.1  # V per unit of Present Input Voltage
+
+
+def snapshot_dtype(count: int) -> np.dtype:
+    """
+    The dtype of the state of `count` motors sampled at once, see `decode_state`.
+    The angles are in rad, the velocities in rad/s, the currents in mA, the PWM in % and the voltages in V.
+    """
+    return np.dtype([("timestamp", np.float64),
+                     ("position", np.float64, (count,)),
+                     ("velocity", np.float64, (count,)),
+                     ("current", np.float64, (count,)),
+                     ("pwm", np.float64, (count,)),
+                     ("voltage", np.float64, (count,)),
+                     ("temperature", np.uint8, (count,)),
+                     ("moving", np.bool_, (count,)),
+                     ("position_pulse", np.int32, (count,))])
+
+
+def angles_to_pulses(angles, pulse_center: int) -> np.ndarray:
+    """
+    Convert angles in rad to goal positions in pulses, rounded to the nearest pulse.
+
+    Raises:
+        ValueError: If an angle is not finite, or out of the range of the goal positions (int32).
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    if not np.isfinite(angles).all():
+        raise ValueError(f"The angles must be finite, got {angles}")
+    pulses = pulse_center - np.rint(angles * RAD_TO_PULSE)
+    if pulses.size and (pulses.min() < GOAL_POSITION_MIN or pulses.max() > GOAL_POSITION_MAX):
+        raise ValueError(f"The angles are out of the range of the goal positions, got {angles}")
+    return pulses.astype(np.int64)
+
+
+def pulses_to_angles(pulses, pulse_center: int) -> np.ndarray:
+    """
+    Convert positions in pulses to angles in rad.
+    """
+    return (pulse_center - np.asarray(pulses, dtype=np.float64)) / RAD_TO_PULSE
+
+
+def decode_state(raw: np.ndarray, pulse_center: int, timestamp: float, out: np.ndarray=None) -> np.ndarray:
+    """
+    Convert the state span read from the motors to physical units.
+
+    Args:
+        raw: numpy.ndarray: The (count, LEN_STATE) bytes read from ADDR_STATE, one row per motor.
+        pulse_center: int: The pulse of the 0 rad angle.
+        timestamp: float: The time of the sample.
+        out: numpy.ndarray: Optional array of `snapshot_dtype(count)` with a single element (shape () or (1,)) to write the sample in.
+
+    Returns:
+        numpy.ndarray: The sample, `out` if given.
+    """
+    state = np.ascontiguousarray(raw, dtype=np.uint8).view(STATE_DTYPE)[:, 0]
+    if out is None:
+        out = np.zeros((), dtype=snapshot_dtype(len(state)))
+    # The velocities are signed like the angles, which decrease when the pulses increase
+    out["timestamp"] = timestamp
+    out["position"] = pulses_to_angles(state["position"], pulse_center)
+    out["velocity"] = -VELOCITY_UNIT * state["velocity"]
+    out["current"] = CURRENT_UNIT * state["current"]
+    out["pwm"] = PWM_UNIT * state["pwm"]
+    out["voltage"] = VOLTAGE_UNIT * state["voltage"]
+    out["temperature"] = state["temperature"]
+    out["moving"] = state["moving"] != 0
+    out["position_pulse"] = state["position"]
+    return out
+
+
+class DynamixelBus:
+    """
+    Sync reads and sync writes of the control table of a group of Dynamixel motors (protocol 2.0) on an open serial port.
+
+    A sync read or a sync write is a single transaction on the bus for all the motors, instead of one per motor.
+    The transactions are serialized by `lock`, so the bus can be used from several threads.
+
+    Args:
+        port_handler: The open `dynamixel_sdk.PortHandler` of the motors.
+        ids: list[int]: The ids of the motors, in the order of the rows of the data.
+        lock: The lock of the port, to share with the other users of the port. A new lock if None.
+    """
+
+    def __init__(self, port_handler, ids: list, lock=None):
+        self.port_handler = port_handler
+        self.packet_handler = PacketHandler(2.0)
+        self.ids = list(ids)
+        self.lock = lock if lock is not None else threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self._readers = {}
+        self._writers = {}
+
+
+    def sync_read(self, address: int, length: int) -> np.ndarray:
+        """
+        Read `length` bytes from `address` of the control table of all the motors.
+
+        Returns:
+            numpy.ndarray: The (len(ids), length) bytes, one row per motor.
+
+        Raises:
+            ConnectionError: If the transaction failed.
+        """
+        with self.lock:
+            reader = self._readers.get((address, length))
+            if reader is None:
+                reader = self._readers[(address, length)] = GroupSyncRead(self.port_handler, self.packet_handler, address, length)
+                for motor_id in self.ids:
+                    reader.addParam(motor_id)
+            result = reader.txRxPacket()
+            self.reads += 1
+            if result != COMM_SUCCESS:
+                raise ConnectionError(f"Sync read of the motors failed: {self.packet_handler.getTxRxResult(result)}")
+            return np.array([reader.data_dict[motor_id] for motor_id in self.ids], dtype=np.uint8).reshape(len(self.ids), length)
+
+
+    def sync_write(self, address: int, data: np.ndarray):
+        """
+        Write bytes at `address` of the control table of all the motors.
+
+        Args:
+            address: int: The address of the first byte.
+            data: numpy.ndarray: The (len(ids), length) bytes to write, one row per motor.
+
+        Raises:
+            ConnectionError: If the transaction failed.
+        """
+        data = np.asarray(data, dtype=np.uint8).reshape(len(self.ids), -1)
+        length = data.shape[1]
+        with self.lock:
+            writer = self._writers.get((address, length))
+            if writer is None:
+                writer = self._writers[(address, length)] = GroupSyncWrite(self.port_handler, self.packet_handler, address, length)
+                for motor_id, row in zip(self.ids, data):
+                    writer.addParam(motor_id, row.tolist())
+            else:
+                for motor_id, row in zip(self.ids, data):
+                    writer.changeParam(motor_id, row.tolist())
+            result = writer.txPacket()
+            self.writes += 1
+            if result != COMM_SUCCESS:
+                raise ConnectionError(f"Sync write of the motors failed: {self.packet_handler.getTxRxResult(result)}")
+
+
+    def write_goal_pulses(self, pulses):
+        """
+        Write the goal positions of all the motors, in pulses.
+        """
+        self.sync_write(ADDR_GOAL_POSITION, np.asarray(pulses, dtype="<i4").view(np.uint8).reshape(len(self.ids), LEN_GOAL_POSITION))
+
+
+    def read_state(self) -> tuple[np.ndarray, float]:
+        """
+        Read the state span (position, velocity, current, PWM, voltage, temperature and moving flags) of all the motors.
+
+        Returns:
+            The (len(ids), LEN_STATE) bytes and the time.perf_counter() at the middle of the transaction.
+        """
+        start = time.perf_counter()
+        raw = self.sync_read(ADDR_STATE, LEN_STATE)
+        return raw, (start + time.perf_counter()) / 2
@@ -0,0 +1,209 @@
+import threading
+import time
+
+import numpy as np
+
+from emioapi._motorbus import DynamixelBus, angles_to_pulses, decode_state, snapshot_dtype
+from emioapi._logging_config import logger
+
+
+JITTER_EDGES_US = (0, 50, 100, 200, 500, 1000, 2000, 5000)  # Lower edges of the bins of the jitter histogram, the last bin is unbounded
+
+
+class SetpointMailbox:
+    """
+    Single slot mailbox of the goal angles of the motors.
+
+    The writer replaces the slot with a new (sequence, pulses) tuple, and the reader reads the slot: both are a single
+    reference assignment or read, which is atomic in Python, so neither side ever waits for the other.
+    """
+
+    def __init__(self):
+        self._slot = (0, None)
+
+
+    def post(self, pulses: np.ndarray):
+        self._slot = (self._slot[0] + 1, pulses)
+
+
+    def latest(self) -> tuple[int, np.ndarray | None]:
+        """
+        Returns:
+            The sequence number of the latest setpoint (0 if none was posted) and its goal pulses.
+        """
+        return self._slot
+
+
+class MotorControlLoop(threading.Thread):
+    """
+    Thread driving the motors at a fixed period.
+
+    Each tick is scheduled on a fixed grid of deadlines (`start + k * period`, so the rate does not drift). At each tick, the thread
+    writes the latest setpoint of the mailbox with one sync write if it changes the goal pulses of a motor, then reads the state of the motors
+    with one sync read. So the setpoints posted between two ticks are coalesced into at most one write, and the unchanged ones are suppressed. The application posts setpoints with `set_angles` and reads the latest state with `state`, which never wait for the bus.
+
+    A tick which starts after the next deadline is an overrun, and the deadlines missed entirely are skipped rather than executed in a burst.
+    The lateness of the ticks (jitter) is counted in a histogram, see `stats`.
+
+    A failed transaction (`ConnectionError`) is counted in `errors` and retried at the next tick. Any other error stops the thread
+    and is kept in `error`, then `set_angles` and `state` raise it.
+
+    Args:
+        bus: DynamixelBus: The bus of the motors.
+        pulse_center: int: The pulse of the 0 rad angle.
+        period: float: The period of the ticks in seconds.
+    """
+
+    def __init__(self, bus: DynamixelBus, pulse_center: int, period: float=0.002):
+        super().__init__(name="EmioMotorsControlLoop", daemon=True)
+        if period <= 0:
+            raise ValueError("The period of the control loop must be positive")
+        self.bus = bus
+        self.pulse_center = pulse_center
+        self.period = period
+        self.mailbox = SetpointMailbox()
+        self._states = np.zeros(2, dtype=snapshot_dtype(len(bus.ids))) # double buffer, the thread writes the one which is not published
+        self._front = 0
+        self._running = threading.Event()
+        self.error: Exception | None = None  # The error which stopped the thread, if any
+        self.reset_stats()
+
+
+    def reset_stats(self):
+        """
+        Clear the counters and the jitter histogram.
+        """
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped_ticks = 0
+        self.errors = 0
+        self.writes = 0
+        self.suppressed = 0
+        self.coalesced = 0
+        self._jitter_counts = np.zeros(len(JITTER_EDGES_US), dtype=np.int64)
+        self._max_jitter = 0.0
+        self._sum_jitter = 0.0
+
+
+    @property
+    def state(self) -> np.ndarray:
+        """
+        The state of the motors read at the last tick, a copy of a record of `snapshot_dtype` (its timestamp is 0 before the first tick).
+
+        Raises:
+            Exception: The error which stopped the thread, if any.
+        """
+        self._check_error()
+        return self._states[self._front].copy()
+
+
+    def set_angles(self, angles):
+        """
+        Post new goal angles in rad, written at the next tick.
+
+        Raises:
+            ValueError: If an angle is not finite or out of the range of the goal positions.
+            Exception: The error which stopped the thread, if any.
+        """
+        self._check_error()
+        self.mailbox.post(angles_to_pulses(angles, self.pulse_center))
+
+
+    def start(self):
+        # The state is read once before the first tick, so that it is valid as soon as the loop starts
+        raw, timestamp = self.bus.read_state()
+        decode_state(raw, self.pulse_center, timestamp, self._states[self._front])
+        self._running.set()
+        super().start()
+
+
+    def run(self):
+        written = 0
+        written_pulses = None
+        next_tick = time.perf_counter()
+        while self._running.is_set():
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.perf_counter()
+            self._count_jitter(now - next_tick)
+
+            try:
+                sequence, pulses = self.mailbox.latest()
+                if sequence != written:
+                    self.coalesced += sequence - written - 1
+                    if written_pulses is not None and np.array_equal(pulses, written_pulses):
+                        self.suppressed += 1
+                    else:
+                        self.bus.write_goal_pulses(pulses)
+                        written_pulses = pulses
+                        self.writes += 1
+                    written = sequence
+                raw, timestamp = self.bus.read_state()
+                back = 1 - self._front
+                decode_state(raw, self.pulse_center, timestamp, self._states[back])
+                self._front = back
+            except ConnectionError as e:
+                if self.errors == 0:
+                    logger.error(f"Motors control loop: {e}")
+                self.errors += 1
+            except Exception as e:
+                logger.error(f"Motors control loop stopped: {e}")
+                self.error = e
+                self._running.clear()
+                break
+            self.ticks += 1
+
+            next_tick += self.period
+            now = time.perf_counter()
+            if now > next_tick:
+                self.overruns += 1
+                missed = int((now - next_tick) / self.period)
+                self.skipped_ticks += missed
+                next_tick += missed * self.period
+
+
+    def _check_error(self):
+        if self.error is not None:
+            raise self.error
+
+
+    def _count_jitter(self, jitter: float):
+        jitter_us = max(jitter, 0.0) * 1e6
+        self._jitter_counts[np.searchsorted(JITTER_EDGES_US, jitter_us, side="right") - 1] += 1
+        self._max_jitter = max(self._max_jitter, jitter)
+        self._sum_jitter += max(jitter, 0.0)
+
+
+    def stats(self) -> dict:
+        """
+        Get the statistics of the loop.
+
+        Returns:
+            A dict with the counters `ticks`, `writes`, `suppressed` (setpoints which did not change the goal pulses), `coalesced`
+            (setpoints replaced before the next tick), `overruns` (ticks which ended after the next deadline), `skipped_ticks`
+            (deadlines missed entirely) and `errors` (failed transactions), the `mean_jitter_ms` and `max_jitter_ms` lateness
+            of the ticks, and the `jitter_histogram`: the counts of the lateness in the bins starting at `jitter_edges_us`.
+        """
+        ticks = max(self.ticks, 1)
+        return {"period_ms": self.period * 1e3,
+                "ticks": self.ticks,
+                "writes": self.writes,
+                "suppressed": self.suppressed,
+                "coalesced": self.coalesced,
+                "overruns": self.overruns,
+                "skipped_ticks": self.skipped_ticks,
+                "errors": self.errors,
+                "mean_jitter_ms": self._sum_jitter / ticks * 1e3,
+                "max_jitter_ms": self._max_jitter * 1e3,
+                "jitter_edges_us": list(JITTER_EDGES_US),
+                "jitter_histogram": self._jitter_counts.tolist()}
+
+
+    def stop(self, timeout: float=1.0):
+        """
+        Stop the loop after its current tick.
+        """
+        self._running.clear()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
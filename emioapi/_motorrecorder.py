@@ -0,0 +1,124 @@
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from emioapi._motorbus import snapshot_dtype
+from emioapi._logging_config import logger
+
+
+def recording_dtype(count: int) -> np.dtype:
+    """
+    The dtype of the records of a motor recording: a `sequence` number (0 for an empty or partially written record) followed by the fields of `snapshot_dtype`.
+    """
+    return np.dtype([("sequence", np.int64)] + snapshot_dtype(count).descr)
+
+
+def read_motor_recording(path: str) -> np.ndarray:
+    """
+    Read a recording made by `MotorTelemetryRecorder`, including while it is still recording or after a crash.
+
+    Returns:
+        numpy.ndarray: The complete records, in chronological order.
+    """
+    ring = np.load(path, mmap_mode="r")
+    records = np.array(ring)
+    # A record overwritten while it was copied is marked as empty in the copy, or its sequence number changed since
+    records = records[(records["sequence"] > 0) & (records["sequence"] == ring["sequence"])]
+    return records[np.argsort(records["sequence"], kind="stable")]
+
+
+class MotorTelemetryRecorder(threading.Thread):
+    """
+    Thread sampling the state of the motors at a fixed period into a ring of records in a memory mapped `.npy` file.
+
+    The file is preallocated with `capacity` records, so the memory and disk footprint are bounded: when it is full, the oldest records are overwritten.
+    Each record is written in place with its sequence number set to 0 first and to its final value last, so a record is either complete or marked
+    as empty, even if the process crashes while writing it. The file can be opened with `numpy.load(path, mmap_mode="r")` at any time,
+    and `read_motor_recording` returns its complete records in chronological order.
+
+    A failed transaction (`ConnectionError`) is counted in `errors` and the sampling goes on. Any other error stops the recording
+    and is kept in `error`, after the records are flushed.
+
+    Args:
+        sample: The function writing a sample of the state of the motors in the record given as argument, for instance `EmioMotors.snapshot`.
+        path: str: The path of the `.npy` file. An existing file is overwritten.
+        count: int: The number of motors.
+        capacity: int: The number of records of the ring.
+        period: float: The sampling period in seconds.
+        flush_period: float: The period in seconds at which the records are flushed to the disk.
+    """
+
+    def __init__(self, sample, path: str, count: int, capacity: int=360000, period: float=0.005, flush_period: float=1.0):
+        super().__init__(name="EmioMotorsRecorder", daemon=True)
+        if capacity <= 0 or period <= 0:
+            raise ValueError("The capacity and the period of the recording must be positive")
+        self.path = Path(path)
+        self.period = period
+        self.flush_period = flush_period
+        self.samples = 0
+        self.errors = 0
+        self.overruns = 0
+        self.error: Exception | None = None  # The error which stopped the recording, if any
+        self._sample = sample
+        self._ring = np.lib.format.open_memmap(self.path, mode="w+", dtype=recording_dtype(count), shape=(capacity,))
+        self._running = threading.Event()
+
+
+    @property
+    def capacity(self) -> int:
+        return len(self._ring)
+
+
+    def start(self):
+        self._running.set()
+        super().start()
+        logger.info(f"Recording the motors in {self.path}")
+
+
+    def run(self):
+        next_sample = time.perf_counter()
+        next_flush = next_sample + self.flush_period
+        while self._running.is_set():
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            index = self.samples % self.capacity
+            record = self._ring[index:index + 1]
+            record["sequence"] = 0
+            try:
+                self._sample(record)
+                self.samples += 1
+                record["sequence"] = self.samples
+            except ConnectionError as e:
+                if self.errors == 0:
+                    logger.error(f"Motors recorder: {e}")
+                self.errors += 1
+            except Exception as e:
+                logger.error(f"Motors recorder stopped: {e}")
+                self.error = e
+                self._running.clear()
+                break
+
+            now = time.perf_counter()
+            if now >= next_flush:
+                self._ring.flush()
+                next_flush = now + self.flush_period
+            next_sample += self.period
+            if now > next_sample:
+                self.overruns += 1
+                next_sample = now
+
+        self._ring.flush()
+        logger.info(f"Recorded {self.samples} samples of the motors in {self.path}")
+
+
+    def stop(self, timeout: float=1.0):
+        """
+        Stop the recording and flush the file.
+        """
+        self._running.clear()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
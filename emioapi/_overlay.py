@@ -0,0 +1,78 @@
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import cv2 as cv
+
+
+@dataclass
+class MarkerObservation:
+    """
+    A marker found in a camera frame.
+    """
+    index: int  # Index of the contour of the marker in the frame
+    x: int  # Pixel coordinates of the center of the marker
+    y: int
+    depth: float  # Depth of the marker in depth units
+    position: tuple  # (x, y, z) position of the marker in the Emio frame, in mm
+    contour: np.ndarray = None  # Contour of the marker in the frame
+
+
+class OverlayRenderer:
+    """
+    Draw the annotations of the tracked markers (contour, center, pixel and Emio coordinates) for the feed windows.
+
+    The annotations are drawn on copies of the frames, from the markers of a `FrameResult`, so that the frames returned to the
+    users are never modified and the tracking does not depend on the number of labels. The copies are reused from one call to the next.
+
+    Args:
+        max_rate: float: The maximum number of renderings per second, see `due`.
+    """
+
+    def __init__(self, max_rate: float=30.0):
+        self.max_rate = max_rate
+        self._last_time = None
+        self._buffers = {}
+
+
+    def due(self, now: float=None) -> bool:
+        """
+        Check if it is time to render the windows again, and if so, start a new period.
+
+        Returns:
+            True if at least 1 / `max_rate` seconds elapsed since the last rendering.
+        """
+        now = time.perf_counter() if now is None else now
+        if self._last_time is not None and now - self._last_time < 1.0 / self.max_rate:
+            return False
+        self._last_time = now
+        return True
+
+
+    def draw(self, name: str, image: np.ndarray, markers: list, contours: bool=True) -> np.ndarray:
+        """
+        Draw the markers on a copy of an image.
+
+        Args:
+            name: str: The name of the copy, an annotated image is reused for each name.
+            image: numpy.ndarray: The BGR or HSV image to annotate. It is not modified.
+            markers: list[MarkerObservation]: The markers to draw.
+            contours: bool: Whether to draw the contours of the markers.
+
+        Returns:
+            numpy.ndarray: The annotated copy, valid until the next call with the same name.
+        """
+        annotated = self._buffers.get(name)
+        if annotated is None or annotated.shape != image.shape or annotated.dtype != image.dtype:
+            annotated = self._buffers[name] = np.empty_like(image)
+        np.copyto(annotated, image)
+
+        for marker in markers:
+            x, y = int(marker.x), int(marker.y)
+            cv.circle(annotated, (x, y), 2, color=255, thickness=-1)
+            cv.putText(annotated, f"{marker.index} ({x}, {y}, {marker.depth})", (x, y), cv.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+            cv.putText(annotated, f"{marker.index} ({marker.position[0]:.2f}, {marker.position[1]:.2f}, {marker.position[2]:.2f})", (x, y + 15),
+                       cv.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+            if contours and marker.contour is not None:
+                cv.drawContours(annotated, [marker.contour], -1, (255, 255, 0), 3)
+        return annotated
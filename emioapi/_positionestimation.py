@@ -3,6 +3,7 @@ import cv2 as cv
 import json
 import os
 import csv
+import tempfile
 from pathlib import Path
 from shutil import copyfile
 
@@ -28,6 +29,18 @@ if not CALIBRATION_FILENAME.exists():
 
 
 COUNT_POINTS = 9 # Number of points in the calibration board (4 corners + 4 middle points + 1 center)
+CALIBRATION_FRAMES = 200 # Number of frames accumulated during a calibration
+ARUCO_MARKER_ID = 672 # ID of the Aruco marker provided with Emio
+# Volume in which the markers on the legs of Emio move, ((xmin, ymin, zmin), (xmax, ymax, zmax)) in mm in the Emio frame.
+# It goes from the platform up to 100 mm under the motors, the top of the legs being too close to the camera to be tracked.
+DEFAULT_WORKSPACE_BOX = ((-120.0, -303.0, -120.0), (120.0, -100.0, 120.0))
+
+# For the moment, the calibration is always performed in extended mode.
+# When in compact mode, this rotation is applied to the camera
+# TODO: find a way to calibrate the camera when in compact configuration
+COMPACT_ROTATION = np.array([[0.5000000,  -0.7071068, -0.5000000],
+                             [0.7071068,  0.0000000, 0.7071068],
+                             [-0.5000000,  -0.7071068,  0.5000000]])
 
 
 def compute_transform_from_pointclouds(image_cloud:np.ndarray, absolute_cloud:np.ndarray)  -> tuple[np.ndarray, np.ndarray]:
@@ -71,6 +84,31 @@ def compute_transform_from_pointclouds(image_cloud:np.ndarray, absolute_cloud:np
     t = centroid_B.T - R @ centroid_A.T
     return R, t
 
+def write_calibration_file(rows: list, filename: Path=CALIBRATION_FILENAME):
+    """
+    Write the calibration points in the CSV file atomically: the file is written next to the destination and then renamed,
+    so that a reader never sees a partially written file.
+
+    Args:
+        rows: list
+            The rows (X, Y, Depth, id) of the calibration points
+
+        filename: Path
+            The CSV file
+    """
+    filename = Path(filename)
+    fd, tmp_filename = tempfile.mkstemp(dir=filename.parent, prefix=filename.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['X', 'Y', 'Depth', 'id'])
+            writer.writerows(rows)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+
+
 def image_pixel_to_mm(depth: float, pixel_x: int, pixel_y: int, camera_intrinsics:object) -> list[float]:
     """
     Convert the depth and image point information to metric coordinates in camera space.
@@ -103,6 +141,30 @@ def image_pixel_to_mm(depth: float, pixel_x: int, pixel_y: int, camera_intrinsic
     X = ((pixel_x - camera_intrinsics.ppx) / camera_intrinsics.fx) * depth
     Y = ((pixel_y - camera_intrinsics.ppy) / camera_intrinsics.fy) * depth
     return [X, Y, depth]
+
+
+def image_pixels_to_mm(pixels: np.ndarray, camera_intrinsics: object) -> np.ndarray:
+    """
+    Vectorized version of `image_pixel_to_mm`: convert N image points with their depth to metric coordinates in camera space.
+
+    Args:
+        pixels: numpy.ndarray
+            The (N, 3) array of image points as (x, y, depth)
+
+        camera_intrinsics : object
+            The intrinsic values of the realsesnse camera See https://intelrealsense.github.io/librealsense/python_docs/_generated/pyrealsense2.intrinsics.html
+
+    Return:
+        points: numpy.ndarray
+            The (N, 3) array of (X, Y, Z) values in mm
+    """
+    pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 3)
+    points = np.empty_like(pixels)
+    depth = pixels[:, 2]
+    np.multiply((pixels[:, 0] - camera_intrinsics.ppx) / camera_intrinsics.fx, depth, out=points[:, 0])
+    np.multiply((pixels[:, 1] - camera_intrinsics.ppy) / camera_intrinsics.fy, depth, out=points[:, 1])
+    points[:, 2] = depth
+    return points
    
 
 class PositionEstimation:
@@ -118,11 +180,13 @@ class PositionEstimation:
         self.calibration_points=np.zeros((COUNT_POINTS, 3))
         self.R=np.zeros((9,3))
         self.t=np.zeros((3))
+        self.camera_to_simulation = np.eye(4) # Homogeneous transform from the camera space (mm) to the Emio frame, including the compact rotation
         self.intr= cameraintrinsinc if cameraintrinsinc else None
         self.points = []
         self.trackers_pos = []
         self.initialized = False
         self.count_calibration_frames = 0
+        self.calibration_session = None
         elevator = 70
         arucoThickness = 3
         platformY = -303
@@ -216,6 +280,11 @@ class PositionEstimation:
         
         self.trackers_pos = np.array(self.trackers_pos)
         self.R, self.t = compute_transform_from_pointclouds( self.trackers_pos, self.calibration_points)
+
+        rotation = COMPACT_ROTATION @ self.R if self.configuration == "compact" else self.R
+        self.camera_to_simulation = np.eye(4)
+        self.camera_to_simulation[:3, :3] = rotation
+        self.camera_to_simulation[:3, 3] = self.t
         
         self.initialized = True
         return True
@@ -224,7 +293,8 @@ class PositionEstimation:
     def calibrate(self, frame, depth_image, aggregate, window=None)-> bool:
         """
         Calibrate the camera by detecting a single marker and calculating the rotation matrix and translation vector.
-        This method averages the corners positions of the marker and stores them in a CSV file.
+        This method accumulates the positions of the marker points in a `CalibrationSession`, and writes them in the CSV file
+        once `CALIBRATION_FRAMES` frames were accumulated.
 
         Args:
             frame: numpy.ndarray
@@ -241,108 +311,14 @@ class PositionEstimation:
         Return:
             True if the calibration process is successful, False otherwise
         """
-        dictionary = cv.aruco.getPredefinedDictionary(cv.aruco.DICT_ARUCO_ORIGINAL)
-        parameters =  cv.aruco.DetectorParameters()
-        detector = cv.aruco.ArucoDetector(dictionary, parameters)
-        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-        _,thresh_image = cv.threshold(gray,95,255,cv.THRESH_TOZERO)
+        if not aggregate or self.calibration_session is None:
+            self.calibration_session = CalibrationSession()
 
-        (corners, ids, rejected) = detector.detectMarkers(thresh_image)
-
-        if ids is None:
-            logger.error(f"Frame {self.count_calibration_frames}: No Aruco markers detected")
-            return False
-        if len(ids)>1:
-            logger.error(f"Frame {self.count_calibration_frames}: More than one Aruco marker detected")
-            return False
-        if ids[0] != 672: # ID of the Aruco marker provided with Emio
-            logger.error(f"Frame {self.count_calibration_frames}: Aruco marker ID is not 672: {ids}")
-            return False
-        
-        if not aggregate:
-            self.trackers_pos = np.zeros((COUNT_POINTS, 3))
-            self.points = np.zeros((COUNT_POINTS, 2))  # Initialize points array with 5 points and 2 coordinates (x, y)
-            self.count_calibration_frames = 0
-
-        # Add the corners positions of the marker to the 2D points and trackers_pos lists
-        temp_points = np.zeros((COUNT_POINTS, 2))
-        temp_trackers_pos = np.zeros((COUNT_POINTS, 3))
-        for i in range(len(corners[0][0])):
-            corner=corners[0][0][i]
-            depth = depth_image[int(corner[1])][int(corner[0])]
-            if depth == 0:
-                logger.debug(f"Skipping frame: Depth value is 0 for corner {i} at position ({corner[0]}, {corner[1]})")
-                return False
-
-            temp_points[i] = [corner[0], corner[1]]
-            temp_trackers_pos[i] = image_pixel_to_mm(depth, corner[0], corner[1], self.intr)
-        
-        # Add the the middle points between the corners
-        for i in range(4):
-            next_i = (i + 1) % 4
-            temp_points[4 + i] = [
-            (temp_points[i][0] + temp_points[next_i][0]) / 2,
-            (temp_points[i][1] + temp_points[next_i][1]) / 2
-            ]
-            temp_trackers_pos[4 + i] = [
-            (temp_trackers_pos[i][0] + temp_trackers_pos[next_i][0]) / 2,
-            (temp_trackers_pos[i][1] + temp_trackers_pos[next_i][1]) / 2,
-            (temp_trackers_pos[i][2] + temp_trackers_pos[next_i][2]) / 2
-            ]
-        
-        # Replace the last dimension with the actual depth
-        for i in range(4, 8):
-            depth = depth_image[int(temp_points[i][1])][int(temp_points[i][0])]
-            if depth == 0:
-                logger.debug(f"Skipping frame: Depth value is 0 for corner {i} at position ({temp_points[i][0]}, {temp_points[i][1]})")
-                return False
-            temp_trackers_pos[i][2] = depth
-
-        # Average the corners positions
-        x, y = np.mean(corners[0][0], axis=0)
-        x = int(x)
-        y = int(y)
-
-        # Adds the center of the marker to the points and trackers_pos lists
-        depth= depth_image[y][x]
-        if depth == 0:
-                logger.debug(f"Skipping frame: Depth value is 0 for corner {i} at position ({corner[0]}, {corner[1]})")
-                return False
-        temp_points[-1] = [x, y]
-        temp_trackers_pos[-1] = image_pixel_to_mm(depth, x, y, self.intr)
-
-
-        # If the calibration is not aggregated, reset the points and trackers_pos lists, else add the new points and trackers_pos to the existing lists
-        self.points = temp_points if not aggregate else self.points + temp_points
-        self.trackers_pos = temp_trackers_pos if not aggregate else self.trackers_pos + temp_trackers_pos
-
-        self.count_calibration_frames += 1
-
-        # Write the information in a CSV file for the next calibration processes
-        points_2d = [(int(self.points[i][0]/self.count_calibration_frames), int(self.points[i][1]/self.count_calibration_frames), self.trackers_pos[i][2]/self.count_calibration_frames, ids[0][0]) for i in range(len(self.points))]
-        with open(CALIBRATION_FILENAME, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['X', 'Y', 'Depth', 'id'])  # En-tête
-            writer.writerows(points_2d)
-            logger.debug(f"Calibration data written to {CALIBRATION_FILENAME}: {points_2d}")
-
-         # Draw the detected markers and the corners on the frame
-        cv.aruco.drawDetectedMarkers(frame, corners, ids, borderColor=(255, 0, 0))
-        cv.circle(frame, (int(corners[0][0][1][0]), int(corners[0][0][1][1])), 2, (0, 0, 255), -1)
-        cv.circle(frame, (int(corners[0][0][2][0]), int(corners[0][0][2][1])), 2, (0, 255, 0), -1)
-        cv.circle(frame, (int(corners[0][0][3][0]), int(corners[0][0][3][1])), 2, (0, 255, 255), -1)
-        # draw 2D points on the frame
-        [cv.circle(frame, (int(points_2d[i][0]), int(points_2d[i][1])), 5, (0, 0, 255), 1) for i in range(len(points_2d))]
-        [cv.putText(frame, f"{i} ({int(corners[0][0][i][0])}, {int(corners[0][0][i][1])}, {depth_image[int(corners[0][0][i][1]),int(corners[0][0][i][0])]}) ", 
-                        (int(corners[0][0][i][0]), int(corners[0][0][i][1])), 
-                        cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1) for i in range(len(corners[0][0]))]
-        frame = cv.putText(frame, f"Calibration progress: {self.count_calibration_frames}/200", (10, 30), 
-                            cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
-
-        if window:
-            window.set_frame(frame)
-
-        return True
+        success = self.calibration_session.add_frame(frame, depth_image, window)
+        self.count_calibration_frames = self.calibration_session.count
+        if success and self.calibration_session.complete:
+            return self.calibration_session.save()
+        return success
 
     
     def camera_image_to_simulation(self, x: int, y: int, depth: float) -> list[float]:
@@ -360,17 +336,287 @@ class PositionEstimation:
             position: numpy.ndarray
                 The real world coordinates of the object in the Emio frame space
         """
-        position=np.zeros((3))
         p = image_pixel_to_mm(depth, x, y, self.intr)
-        position = self.R@p 
-        if self.configuration == "compact": # For the moment, the calibration is always performed in extended mode. 
-            # When in compact mode, apply a rotation to the camera
-            # TODO: find a way to calibrate the camera when in compact configuration 
-            R = np.array([  [0.5000000,  -0.7071068, -0.5000000],
-                            [0.7071068,  0.0000000, 0.7071068],
-                            [-0.5000000,  -0.7071068,  0.5000000] ])
-            position = R@position 
-        position += self.t
+        position = self.camera_to_simulation[:3, :3] @ p + self.camera_to_simulation[:3, 3]
         return [position[0], position[1], position[2]]
 
 
+    def camera_image_to_simulation_batch(self, pixels: np.ndarray) -> np.ndarray:
+        """
+        Calculate the positions of several image points in our frame space in one vectorized pass.
+
+        Args
+        pixels: numpy.ndarray
+            The (N, 3) array of image points as (x, y, depth)
+
+        Return:
+            positions: numpy.ndarray
+                The (N, 3) array of the real world coordinates in the Emio frame space
+        """
+        points = image_pixels_to_mm(pixels, self.intr)
+        positions = points @ self.camera_to_simulation[:3, :3].T
+        positions += self.camera_to_simulation[:3, 3]
+        return positions
+
+
+    def simulation_to_camera_image(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Project positions of our frame space in the camera image, the inverse of `camera_image_to_simulation_batch`.
+
+        Args
+        positions: numpy.ndarray
+            The (N, 3) array of positions in the Emio frame space, in mm
+
+        Return:
+            pixels: numpy.ndarray
+                The (N, 3) array of image points as (x, y, depth). The points behind the camera have a negative depth.
+        """
+        simulation_to_camera = np.linalg.inv(self.camera_to_simulation)
+        points = np.asarray(positions, dtype=np.float64).reshape(-1, 3) @ simulation_to_camera[:3, :3].T
+        points += simulation_to_camera[:3, 3]
+        pixels = np.empty_like(points)
+        pixels[:, 0] = points[:, 0] / points[:, 2] * self.intr.fx + self.intr.ppx
+        pixels[:, 1] = points[:, 1] / points[:, 2] * self.intr.fy + self.intr.ppy
+        pixels[:, 2] = points[:, 2]
+        return pixels
+
+
+    def workspace_roi(self, width: int, height: int, box: tuple=DEFAULT_WORKSPACE_BOX, margin: int=20) -> tuple | None:
+        """
+        Compute the region of the image in which the workspace volume is seen, by projecting the corners of the volume in the image.
+
+        Args
+        width, height: int
+            The size of the image
+
+        box: tuple
+            The workspace volume ((xmin, ymin, zmin), (xmax, ymax, zmax)) in mm in the Emio frame
+
+        margin: int
+            The number of pixels added around the projection
+
+        Return:
+            roi: tuple
+                The region (x, y, w, h) in pixels, or None if the volume is not entirely in front of the camera
+        """
+        (xmin, ymin, zmin), (xmax, ymax, zmax) = box
+        corners = np.array([[x, y, z] for x in (xmin, xmax) for y in (ymin, ymax) for z in (zmin, zmax)])
+        pixels = self.simulation_to_camera_image(corners)
+        if (pixels[:, 2] <= 0).any():
+            return None
+        x0, y0 = np.floor(pixels[:, :2].min(axis=0)).astype(int) - margin
+        x1, y1 = np.ceil(pixels[:, :2].max(axis=0)).astype(int) + margin
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, width), min(y1, height)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+
+
+    def camera_points_to_simulation(self, points: np.ndarray, scale: float=1.0, out: np.ndarray=None, box: tuple=None) -> np.ndarray:
+        """
+        Transform a point cloud from the camera space to our frame space in one vectorized pass.
+
+        Args
+        points: numpy.ndarray
+            The (N, 3) float32 array of points in the camera space
+
+        scale: float
+            The factor to convert the points to mm, 1000 if the points are in meters
+
+        out: numpy.ndarray
+            Optional (N, 3) float32 array in which the transformed points are written, to avoid allocating a new array on each call
+
+        box: tuple
+            Optional workspace box ((xmin, ymin, zmin), (xmax, ymax, zmax)) in mm in the Emio frame. The points outside of the box are dropped.
+
+        The points without depth (z = 0 in the camera space) are invalid: they are set to NaN, or dropped with a box.
+
+        Return:
+            positions: numpy.ndarray
+                The (M, 3) float32 array of the points in the Emio frame space, in mm.
+                Without box, this is `out` if given.
+        """
+        transform = self.camera_to_simulation[:3].astype(np.float32)
+        transform[:, :3] *= scale
+        if out is None:
+            out = np.empty((points.shape[0], 3), dtype=np.float32)
+        # cv.transform applies the affine transform in a single pass, much faster than numpy matmul on (N, 3) arrays
+        cv.transform(points.reshape(-1, 1, 3), transform, dst=out.reshape(-1, 1, 3))
+        # Without depth, the vertices are at the origin of the camera, which is not a measured point
+        invalid = points.reshape(-1, 3)[:, 2] == 0
+        out[invalid] = np.nan
+        if box is None:
+            return out
+
+        inside = cv.inRange(out.reshape(-1, 1, 3), np.asarray(box[0], dtype=np.float64), np.asarray(box[1], dtype=np.float64))
+        return out[inside.ravel().astype(bool) & ~invalid]
+
+
+
+class CalibrationSession:
+    """
+    Accumulate the positions of the calibration marker over several frames, and write the calibration file once at the end.
+
+    The marker points (4 corners, 4 middle points of the edges and the center) are stored in preallocated arrays, one row per accepted frame.
+    When saving, the frames with a point further than `outlier_threshold` scaled median absolute deviations from the median are
+    rejected, and the remaining frames are averaged.
+
+    Args:
+        frames: int: The number of frames to accumulate.
+        outlier_threshold: float: The outlier rejection threshold in scaled MADs. None to average all the frames.
+        min_deviation: float: The deviation (in pixels or depth units) under which a sample is never rejected, so that a point
+            which did not move in most frames does not reject all the others.
+    """
+
+    def __init__(self, frames: int=CALIBRATION_FRAMES, outlier_threshold: float | None=3.5, min_deviation: float=1.0):
+        self.frames = frames
+        self.outlier_threshold = outlier_threshold
+        self.min_deviation = min_deviation
+        self.detector = cv.aruco.ArucoDetector(cv.aruco.getPredefinedDictionary(cv.aruco.DICT_ARUCO_ORIGINAL),
+                                               cv.aruco.DetectorParameters())
+        self.samples = np.zeros((frames, COUNT_POINTS, 3)) # (x, y, depth) of the points for each accepted frame
+        self.count = 0
+        self.attempts = 0
+        self._gray = None
+        self._thresh = None
+
+
+    @property
+    def complete(self) -> bool:
+        """
+        True when all the frames were accumulated.
+        """
+        return self.count >= self.frames
+
+
+    def detect_marker(self, frame: np.ndarray) -> np.ndarray | None:
+        """
+        Detect the calibration marker in a color frame.
+
+        Return:
+            The (4, 2) corners of the marker, or None if the marker is not found alone in the frame.
+        """
+        self._gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY, dst=self._gray)
+        _, self._thresh = cv.threshold(self._gray, 95, 255, cv.THRESH_TOZERO, dst=self._thresh)
+
+        corners, ids, _ = self.detector.detectMarkers(self._thresh)
+
+        if ids is None:
+            logger.error(f"Frame {self.attempts}: No Aruco markers detected")
+            return None
+        if len(ids) > 1:
+            logger.error(f"Frame {self.attempts}: More than one Aruco marker detected")
+            return None
+        if ids[0][0] != ARUCO_MARKER_ID:
+            logger.error(f"Frame {self.attempts}: Aruco marker ID is not {ARUCO_MARKER_ID}: {ids}")
+            return None
+        return corners[0][0]
+
+
+    def add_frame(self, frame: np.ndarray, depth_image: np.ndarray, window=None) -> bool:
+        """
+        Detect the marker in the frames and accumulate the positions of its points.
+
+        Args:
+            frame: numpy.ndarray
+                The color image returned by the camera
+
+            depth_image: numpy.ndarray
+                The depth image returned by the camera
+
+            window: CameraFeedWindow
+                If given, the detection is drawn on the frame and displayed in the window
+        Return:
+            True if the frame was accepted, False otherwise
+        """
+        self.attempts += 1
+        if self.complete:
+            return False
+
+        corners = self.detect_marker(frame)
+        if corners is None:
+            return False
+
+        sample = self.samples[self.count]
+        sample[:4, :2] = corners
+        sample[4:8, :2] = (corners + np.roll(corners, -1, axis=0)) / 2.0
+        sample[8, :2] = corners.mean(axis=0)
+
+        pixels = sample[:, :2].astype(np.int32)
+        np.clip(pixels, 0, [depth_image.shape[1] - 1, depth_image.shape[0] - 1], out=pixels)
+        sample[:, 2] = depth_image[pixels[:, 1], pixels[:, 0]]
+        if not sample[:, 2].all():
+            logger.debug(f"Skipping frame: Depth value is 0 for the points {np.flatnonzero(sample[:, 2] == 0)}")
+            return False
+
+        self.count += 1
+
+        if window:
+            self.draw(frame, corners, pixels, depth_image)
+            window.set_frame(frame)
+
+        return True
+
+
+    def draw(self, frame: np.ndarray, corners: np.ndarray, pixels: np.ndarray, depth_image: np.ndarray):
+        """
+        Draw the detected marker, its corners and the current average of the points on the frame.
+        """
+        cv.aruco.drawDetectedMarkers(frame, [corners.reshape(1, 4, 2)], np.array([[ARUCO_MARKER_ID]]), borderColor=(255, 0, 0))
+        for (x, y), color in zip(pixels[1:4], [(0, 0, 255), (0, 255, 0), (0, 255, 255)]):
+            cv.circle(frame, (int(x), int(y)), 2, color, -1)
+        for x, y in self.samples[:self.count, :, :2].mean(axis=0).astype(np.int32):
+            cv.circle(frame, (int(x), int(y)), 5, (0, 0, 255), 1)
+        for i, (x, y) in enumerate(pixels[:4]):
+            cv.putText(frame, f"{i} ({x}, {y}, {depth_image[y, x]}) ", (int(x), int(y)), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        cv.putText(frame, f"Calibration progress: {self.count}/{self.frames}", (10, 30), cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+
+
+    def inliers(self) -> np.ndarray:
+        """
+        Get the mask of the accumulated frames kept for the calibration.
+
+        Return:
+            The boolean array of length `count`, True for the frames whose points are all within `outlier_threshold` scaled MADs of the median.
+        """
+        samples = self.samples[:self.count]
+        if self.outlier_threshold is None or self.count < 3:
+            return np.ones(self.count, dtype=bool)
+        deviation = np.abs(samples - np.median(samples, axis=0))
+        mad = 1.4826 * np.median(deviation, axis=0) # scaled to the standard deviation of a normal distribution
+        threshold = np.maximum(self.outlier_threshold * mad, self.min_deviation)
+        return (deviation <= threshold).all(axis=(1, 2))
+
+
+    def result(self) -> np.ndarray:
+        """
+        Get the calibration points averaged over the inlier frames.
+
+        Return:
+            The (COUNT_POINTS, 3) array of (x, y, depth) of the points, or None if no frame was accumulated.
+        """
+        if self.count == 0:
+            return None
+        inliers = self.inliers()
+        if not inliers.any():
+            logger.warning("All the calibration frames were rejected as outliers, averaging all of them.")
+            inliers[:] = True
+        logger.info(f"Calibration from {np.count_nonzero(inliers)}/{self.count} frames, {self.count - np.count_nonzero(inliers)} rejected as outliers.")
+        return self.samples[:self.count][inliers].mean(axis=0)
+
+
+    def save(self, filename: Path=CALIBRATION_FILENAME) -> bool:
+        """
+        Write the calibration points in the CSV file.
+
+        Return:
+            True if the file was written, False if no frame was accumulated.
+        """
+        points = self.result()
+        if points is None:
+            return False
+        rows = [(int(x), int(y), float(depth), ARUCO_MARKER_ID) for x, y, depth in points]
+        write_calibration_file(rows, filename)
+        logger.debug(f"Calibration data written to {filename}: {rows}")
+        return True
@@ -0,0 +1,211 @@
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+HEADER_ALIGNMENT = 64  # Frames start on a cache line boundary after the header
+LATEST_SLOT = 0  # Index in the header of the last committed slot
+SEQUENCE_OFFSET = 1  # Index in the header of the first per-slot sequence number
+WRITING = -1  # Sequence number of a slot that is being written
+
+
+class SharedFrameRingBuffer:
+    """
+    Ring buffer of fixed size frames stored in a `multiprocessing.shared_memory` block.
+
+    The memory block is made of an int64 header followed by `slots` preallocated frames:
+        - header[0]: index of the last committed slot (-1 if nothing was written yet)
+        - header[1 + i]: sequence number of the frame in slot i (-1 while it is being written)
+        - header[1 + slots + i]: hardware frame number of the frame in slot i
+        - header[1 + 2 * slots + i]: timestamp of the frame in slot i, a float64
+    The frame number and the timestamp of a slot identify the camera frame it was computed from, see `info`.
+
+    One process writes the frames (the camera process), the other processes read the latest one as a
+    numpy view on the shared memory, without any copy nor pickling.
+    The writer never writes in the latest committed slot, so a reader has `slots - 1` frame periods
+    to use a view before it gets overwritten. Use `is_valid` or `latest(copy=True)` if you need to
+    keep a frame longer.
+
+    The object can be pickled and sent to another process: the shared memory is attached by name.
+    Only the creator process unlinks the shared memory when closing.
+
+    Args:
+        shape: tuple: The shape of one frame.
+        dtype: The numpy dtype of the frames.
+        slots: int: The number of preallocated frames. Must be at least 2.
+    """
+
+    def __init__(self, shape: tuple, dtype=np.uint8, slots: int=3):
+        if slots < 2:
+            raise ValueError("slots must be greater than or equal to 2")
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self._owner_pid = os.getpid()  # A forked child inherits the object but must not unlink the memory
+        self._sequence = 0
+        self._shm = shared_memory.SharedMemory(create=True, size=self._header_size() + self.slots * self._frame_size())
+        self._map()
+        self._header[:] = WRITING
+        self._header[LATEST_SLOT] = -1
+        self._frame_numbers[:] = 0
+        self._timestamps[:] = 0.0
+
+
+    def _header_size(self) -> int:
+        size = (SEQUENCE_OFFSET + 3 * self.slots) * np.dtype(np.int64).itemsize
+        return -(-size // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+
+
+    def _frame_size(self) -> int:
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+
+    def _map(self):
+        self._header = np.ndarray((SEQUENCE_OFFSET + 3 * self.slots,), dtype=np.int64, buffer=self._shm.buf)
+        self._sequences = self._header[SEQUENCE_OFFSET:SEQUENCE_OFFSET + self.slots]
+        self._frame_numbers = self._header[SEQUENCE_OFFSET + self.slots:SEQUENCE_OFFSET + 2 * self.slots]
+        self._timestamps = self._header[SEQUENCE_OFFSET + 2 * self.slots:].view(np.float64)
+        self._frames = np.ndarray((self.slots, *self.shape), dtype=self.dtype, buffer=self._shm.buf, offset=self._header_size())
+
+
+    def __getstate__(self):
+        return {"name": self._shm.name, "shape": self.shape, "dtype": self.dtype.str, "slots": self.slots}
+
+
+    def __setstate__(self, state):
+        self.shape = state["shape"]
+        self.dtype = np.dtype(state["dtype"])
+        self.slots = state["slots"]
+        self._owner_pid = None
+        self._sequence = 0
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._map()
+        self._sequence = int(self._sequences.max(initial=0))
+
+
+    @property
+    def sequence(self) -> int:
+        """
+        The sequence number of the latest committed frame, 0 if nothing was written yet.
+        """
+        slot = int(self._header[LATEST_SLOT])
+        return int(self._header[SEQUENCE_OFFSET + slot]) if slot >= 0 else 0
+
+
+    def acquire(self) -> tuple[int, np.ndarray]:
+        """
+        Get the next slot to write in, so that the producer can write the frame directly in the shared
+        memory (for instance using the `dst` argument of OpenCV functions).
+        The slot must then be published with `commit`.
+
+        Returns:
+            The slot index and the numpy view on the slot.
+        """
+        slot = (int(self._header[LATEST_SLOT]) + 1) % self.slots
+        self._header[SEQUENCE_OFFSET + slot] = WRITING
+        return slot, self._frames[slot]
+
+
+    def commit(self, slot: int, frame_number: int=0, timestamp: float=0.0) -> int:
+        """
+        Publish a slot previously returned by `acquire` as the latest frame.
+
+        Args:
+            slot: int: The slot index.
+            frame_number: int: The hardware frame number of the camera frame the frame was computed from.
+            timestamp: float: The timestamp of this camera frame.
+
+        Returns:
+            The sequence number of the published frame.
+        """
+        self._frame_numbers[slot] = frame_number
+        self._timestamps[slot] = timestamp
+        self._sequence += 1
+        self._header[SEQUENCE_OFFSET + slot] = self._sequence
+        self._header[LATEST_SLOT] = slot
+        return self._sequence
+
+
+    def write(self, frame: np.ndarray, frame_number: int=0, timestamp: float=0.0) -> int:
+        """
+        Copy a frame in the next slot and publish it.
+
+        Args:
+            frame: numpy.ndarray: The frame, it must have the size of the buffer frames.
+            frame_number: int: The hardware frame number of the camera frame the frame was computed from.
+            timestamp: float: The timestamp of this camera frame.
+
+        Returns:
+            The sequence number of the published frame.
+        """
+        slot, view = self.acquire()
+        np.copyto(view, np.reshape(frame, self.shape), casting="unsafe")
+        return self.commit(slot, frame_number, timestamp)
+
+
+    def is_valid(self, sequence: int) -> bool:
+        """
+        Check that the frame with the given sequence number was not overwritten since it was read.
+        """
+        return sequence > 0 and sequence in self._sequences
+
+
+    def info(self, sequence: int) -> tuple[int, float] | None:
+        """
+        Get the hardware frame number and the timestamp written with the frame of the given sequence number.
+
+        Returns:
+            The frame number and the timestamp, or None if the frame was overwritten.
+        """
+        slots = np.flatnonzero(self._sequences == sequence) if sequence > 0 else []
+        if len(slots) == 0:
+            return None
+        slot = slots[0]
+        frame_number, timestamp = int(self._frame_numbers[slot]), float(self._timestamps[slot])
+        if self._sequences[slot] != sequence:
+            return None
+        return frame_number, timestamp
+
+
+    def latest(self, copy: bool=False) -> tuple[int, np.ndarray | None]:
+        """
+        Get the latest committed frame.
+
+        Args:
+            copy: bool: If False (default), the frame is a read-only view on the shared memory. If True, the frame is copied and the copy is guaranteed not to be torn.
+
+        Returns:
+            The sequence number of the frame and the frame, or (0, None) if nothing was written yet.
+        """
+        while True:
+            slot = int(self._header[LATEST_SLOT])
+            if slot < 0:
+                return 0, None
+            sequence = int(self._header[SEQUENCE_OFFSET + slot])
+            if sequence == WRITING:
+                continue
+            if not copy:
+                frame = self._frames[slot]
+                frame.flags.writeable = False
+                return sequence, frame
+            frame = self._frames[slot].copy()
+            if self._header[SEQUENCE_OFFSET + slot] == sequence:
+                return sequence, frame
+
+
+    def close(self):
+        """
+        Release the shared memory. The creator process also unlinks it.
+        """
+        if self._shm is None:
+            return
+        self._header = self._sequences = self._frame_numbers = self._timestamps = None
+        self._frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass # views returned by `latest` are still alive, the memory is unmapped when they are released
+        if self._owner_pid == os.getpid():
+            self._shm.unlink()
+        self._shm = None
@@ -0,0 +1,436 @@
+import threading
+import time
+from collections import deque
+from math import exp
+
+import numpy as np
+from dynamixel_sdk import (PortHandler, PacketHandler, BROADCAST_ID, INST_PING, INST_READ, INST_WRITE, INST_REBOOT,
+                           INST_SYNC_READ, INST_SYNC_WRITE, INST_BULK_READ, INST_BULK_WRITE, INST_STATUS)
+
+from emioapi._logging_config import logger
+
+
+# Errors of the status packets (protocol 2.0)
+ERRNUM_INSTRUCTION = 2
+ERRNUM_CRC = 3
+ERRNUM_DATA_RANGE = 4
+ERRNUM_ACCESS = 7
+
+# Control table of the XM430 motors: (address, size, default value) of the emulated entries
+CONTROL_TABLE_SIZE = 148  # up to Backup Ready, the indirect addresses are not emulated
+MODEL_NUMBER = (0, 2, 1030)  # XM430-W210
+FIRMWARE_VERSION = (6, 1, 45)
+ID = (7, 1, 1)
+BAUD_RATE = (8, 1, 3)
+RETURN_DELAY_TIME = (9, 1, 250)  # in 2 µs
+OPERATING_MODE = (11, 1, 3)  # 3: position, 4: extended position (multi-turn)
+PROTOCOL_TYPE = (13, 1, 2)
+MOVING_THRESHOLD = (24, 4, 10)  # in 0.229 rpm
+TEMPERATURE_LIMIT = (31, 1, 80)
+MAX_VOLTAGE_LIMIT = (32, 2, 160)
+MIN_VOLTAGE_LIMIT = (34, 2, 95)
+PWM_LIMIT = (36, 2, 885)
+CURRENT_LIMIT = (38, 2, 1193)
+VELOCITY_LIMIT = (44, 4, 330)
+MAX_POSITION_LIMIT = (48, 4, 4095)
+MIN_POSITION_LIMIT = (52, 4, 0)
+SHUTDOWN = (63, 1, 52)
+TORQUE_ENABLE = (64, 1, 0)
+STATUS_RETURN_LEVEL = (68, 1, 2)
+VELOCITY_I_GAIN = (76, 2, 1920)
+VELOCITY_P_GAIN = (78, 2, 100)
+POSITION_D_GAIN = (80, 2, 0)
+POSITION_I_GAIN = (82, 2, 0)
+POSITION_P_GAIN = (84, 2, 800)
+GOAL_PWM = (100, 2, 885)
+PROFILE_VELOCITY = (112, 4, 0)
+GOAL_POSITION = (116, 4, 2048)
+REALTIME_TICK = (120, 2, 0)
+MOVING = (122, 1, 0)
+MOVING_STATUS = (123, 1, 0)
+PRESENT_PWM = (124, 2, 0)
+PRESENT_CURRENT = (126, 2, 0)
+PRESENT_VELOCITY = (128, 4, 0)
+PRESENT_POSITION = (132, 4, 2048)
+VELOCITY_TRAJECTORY = (136, 4, 0)
+POSITION_TRAJECTORY = (140, 4, 2048)
+PRESENT_INPUT_VOLTAGE = (144, 2, 120)
+PRESENT_TEMPERATURE = (146, 1, 35)
+
+EEPROM_ENTRIES = (MODEL_NUMBER, FIRMWARE_VERSION, ID, BAUD_RATE, RETURN_DELAY_TIME, OPERATING_MODE, PROTOCOL_TYPE, MOVING_THRESHOLD,
+                  TEMPERATURE_LIMIT, MAX_VOLTAGE_LIMIT, MIN_VOLTAGE_LIMIT, PWM_LIMIT, CURRENT_LIMIT, VELOCITY_LIMIT, MAX_POSITION_LIMIT,
+                  MIN_POSITION_LIMIT, SHUTDOWN)
+RAM_ENTRIES = (TORQUE_ENABLE, STATUS_RETURN_LEVEL, VELOCITY_I_GAIN, VELOCITY_P_GAIN, POSITION_D_GAIN, POSITION_I_GAIN, POSITION_P_GAIN,
+               GOAL_PWM, PROFILE_VELOCITY, GOAL_POSITION, PRESENT_POSITION, POSITION_TRAJECTORY, PRESENT_INPUT_VOLTAGE, PRESENT_TEMPERATURE)
+EEPROM_END = 64  # the EEPROM area can only be written while the torque is disabled
+READ_ONLY = ((0, 7), (70, 71), (120, CONTROL_TABLE_SIZE))  # [start, end) spans of the read only entries
+
+BAUD_RATES = {0: 9600, 1: 57600, 2: 115200, 3: 1000000, 4: 2000000, 5: 3000000, 6: 4000000, 7: 4500000}
+PULSES_PER_VELOCITY_UNIT = 0.229 * 4096 / 60  # pulse/s per unit of velocity (0.229 rpm)
+BITS_PER_BYTE = 10  # 8 data bits, a start bit and a stop bit
+
+
+class SimulatedMotor:
+    """
+    Emulation of the control table and of the dynamics of a Dynamixel XM430 motor.
+
+    With the torque enabled, the position follows the goal position with a first order response of time constant `time_constant`.
+    The present entries (position, velocity, PWM, current, moving flags, ...) are computed from this response when they are read,
+    the PWM and the current are only indicative. The voltage and the temperature are constant. The other entries (I and D gains, goal PWM,
+    profile velocity) are stored but do not change the response, and the position follows the goal position in every operating mode.
+
+    Args:
+        motor_id: int: The id of the motor.
+        time_constant: float: The time constant of the position response in seconds.
+        return_delay: float: The return delay of the status packets in seconds, written in the control table.
+    """
+
+    def __init__(self, motor_id: int, time_constant: float=0.05, return_delay: float=0.0005):
+        self.time_constant = time_constant
+        self.position = float(PRESENT_POSITION[2])  # in pulses
+        self.velocity = 0.0  # in pulse/s
+        self._time = None
+        self.table = bytearray(CONTROL_TABLE_SIZE)
+        for entry in EEPROM_ENTRIES:
+            self.set(entry, entry[2])
+        self.set(ID, motor_id)
+        self.set(RETURN_DELAY_TIME, min(round(return_delay / 2e-6), 254))
+        self.reboot()
+
+
+    def reboot(self):
+        """
+        Set the entries of the RAM area of the control table to their default value, the motor keeps its position.
+        """
+        for entry in RAM_ENTRIES:
+            self.set(entry, entry[2])
+        self.set(GOAL_POSITION, round(self.position))
+        self.set(PRESENT_POSITION, round(self.position))
+
+
+    @property
+    def id(self) -> int:
+        return self.get(ID)
+
+
+    @property
+    def return_delay(self) -> float:
+        return self.get(RETURN_DELAY_TIME) * 2e-6
+
+
+    @property
+    def baud_rate(self) -> int:
+        return BAUD_RATES.get(self.get(BAUD_RATE), 0)
+
+
+    def get(self, entry: tuple) -> int:
+        address, size, _ = entry
+        return int.from_bytes(self.table[address:address + size], "little", signed=size > 1)
+
+
+    def set(self, entry: tuple, value: int):
+        address, size, _ = entry
+        self.table[address:address + size] = int(value).to_bytes(size, "little", signed=size > 1)
+
+
+    def read(self, address: int, length: int, now: float) -> tuple[int, bytes]:
+        """
+        Read `length` bytes from `address` of the control table at the time `now`.
+
+        Returns:
+            The error of the status packet (0 on success) and the bytes read.
+        """
+        if address < 0 or length <= 0 or address + length > CONTROL_TABLE_SIZE:
+            return ERRNUM_DATA_RANGE, b""
+        self.update(now)
+        return 0, bytes(self.table[address:address + length])
+
+
+    def write(self, address: int, data: bytes, now: float) -> int:
+        """
+        Write bytes at `address` of the control table at the time `now`.
+
+        Returns:
+            The error of the status packet, 0 on success.
+        """
+        end = address + len(data)
+        if address < 0 or end > CONTROL_TABLE_SIZE:
+            return ERRNUM_DATA_RANGE
+        if any(address < stop and start < end for start, stop in READ_ONLY):
+            return ERRNUM_ACCESS
+        if address < EEPROM_END and self.get(TORQUE_ENABLE):
+            return ERRNUM_ACCESS
+        self.update(now)
+        torque = self.get(TORQUE_ENABLE)
+        self.table[address:end] = data
+        if not torque and self.get(TORQUE_ENABLE):
+            # The motor holds its position when the torque is enabled
+            self.set(GOAL_POSITION, round(self.position))
+        return 0
+
+
+    def update(self, now: float):
+        """
+        Advance the response of the motor to the time `now` and update the present entries of the control table.
+        """
+        if self._time is None:
+            self._time = now
+        dt = now - self._time
+        if dt > 0:
+            self._time = now
+            if self.get(TORQUE_ENABLE):
+                goal = self.goal()
+                self.position = goal + (self.position - goal) * exp(-dt / self.time_constant)
+                self.velocity = (goal - self.position) / self.time_constant
+            else:
+                self.velocity = 0.0
+
+        goal = self.goal()
+        error = goal - self.position
+        velocity = round(self.velocity / PULSES_PER_VELOCITY_UNIT)
+        pwm_limit = self.get(PWM_LIMIT)
+        pwm = int(np.clip(error * self.get(POSITION_P_GAIN) / 128, -pwm_limit, pwm_limit)) if self.get(TORQUE_ENABLE) else 0
+        moving = abs(velocity) > self.get(MOVING_THRESHOLD)
+        self.set(PRESENT_POSITION, round(self.position))
+        self.set(PRESENT_VELOCITY, velocity)
+        self.set(PRESENT_PWM, pwm)
+        self.set(PRESENT_CURRENT, pwm * self.get(CURRENT_LIMIT) // max(pwm_limit, 1))
+        self.set(MOVING, moving)
+        self.set(MOVING_STATUS, (0x02 if moving else 0) | (0x01 if abs(error) < 1 else 0))
+        self.set(POSITION_TRAJECTORY, goal)
+        self.set(REALTIME_TICK, int(now * 1000) % 32768)
+
+
+    def goal(self) -> int:
+        """
+        The goal position in pulses, limited by the position limits in position mode.
+        """
+        goal = self.get(GOAL_POSITION)
+        if self.get(OPERATING_MODE) == 3:
+            goal = min(max(goal, self.get(MIN_POSITION_LIMIT)), self.get(MAX_POSITION_LIMIT))
+        return goal
+
+
+class SimulatedPortHandler(PortHandler):
+    """
+    Serial port of a simulated chain of Dynamixel XM430 motors, to use the motors without the hardware.
+
+    The port implements the `dynamixel_sdk.PortHandler` interface, so the packets of the SDK (ping, read, write, sync and bulk
+    transactions, protocol 2.0) are decoded and answered by the simulated motors (see `SimulatedMotor`) as the real ones would.
+    The serial timing is emulated at `baud_rate`: each packet takes 10 bits per byte on the bus, the status packets are sent after the
+    return delay of the motors, and they can be read once they are received. With `realtime` False, the packets are answered
+    immediately and their duration is only accounted in `stats`, to run faster than real time.
+
+    Args:
+        ids: list[int]: The ids of the motors.
+        baud_rate: int: The baud rate of the port and of the motors.
+        time_constant: float: The time constant of the position response of the motors in seconds.
+        return_delay: float: The return delay of the status packets in seconds.
+        latency: float: The additional delay in seconds before a status packet can be read, for instance the latency timer of a USB adapter.
+        realtime: bool: Whether the transactions take the time they would take on the bus.
+        port_name: str: The name of the port.
+    """
+
+    def __init__(self, ids: list, baud_rate: int=1000000, time_constant: float=0.05, return_delay: float=0.0005, latency: float=0.0,
+                 realtime: bool=True, port_name: str="simulated"):
+        super().__init__(port_name)
+        self.motors = {motor_id: SimulatedMotor(motor_id, time_constant, return_delay) for motor_id in ids}
+        baud_index = {rate: index for index, rate in BAUD_RATES.items()}.get(baud_rate)
+        if baud_index is None:
+            raise ValueError(f"Unsupported baud rate {baud_rate}, the motors support {sorted(BAUD_RATES.values())}")
+        for motor in self.motors.values():
+            motor.set(BAUD_RATE, baud_index)
+        self.baudrate = baud_rate
+        self.latency = latency
+        self.realtime = realtime
+        self.packet_handler = PacketHandler(2.0)
+        self._lock = threading.Lock()
+        self._received = deque()  # (time at which the packet can be read, bytes)
+        self._bus_free = 0.0
+        self.reset_stats()
+
+
+    def reset_stats(self):
+        """
+        Clear the counters of the bus.
+        """
+        self.packets = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.bus_time = 0.0
+
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the bus.
+
+        Returns:
+            A dict with the number of instruction `packets` sent, the `bytes_sent` and `bytes_received`, and the `bus_time`
+            in seconds during which the bus was busy.
+        """
+        return {"packets": self.packets,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "bus_time": self.bus_time}
+
+
+    def openPort(self):
+        return self.setBaudRate(self.baudrate)
+
+
+    def closePort(self):
+        self.is_open = False
+        self.clearPort()
+
+
+    def clearPort(self):
+        with self._lock:
+            self._received.clear()
+
+
+    def setBaudRate(self, baudrate):
+        if self.getCFlagBaud(baudrate) <= 0:
+            return False
+        self.baudrate = baudrate
+        self.tx_time_per_byte = 1000.0 / baudrate * BITS_PER_BYTE  # in ms, as in PortHandler
+        self.is_open = True
+        return True
+
+
+    def getBytesAvailable(self):
+        now = time.perf_counter()
+        with self._lock:
+            return sum(len(data) for available, data in self._received if available <= now)
+
+
+    def readPort(self, length):
+        now = time.perf_counter()
+        data = bytearray()
+        with self._lock:
+            while self._received and len(data) < length and self._received[0][0] <= now:
+                available, packet = self._received.popleft()
+                count = length - len(data)
+                data += packet[:count]
+                if len(packet) > count:
+                    self._received.appendleft((available, packet[count:]))
+        return bytes(data)
+
+
+    def writePort(self, packet):
+        packet = bytes(packet)
+        byte_time = BITS_PER_BYTE / self.baudrate
+        with self._lock:
+            now = time.perf_counter()
+            if self.realtime and self._bus_free > now:
+                # The port sends the packet once the previous transaction is over
+                time.sleep(self._bus_free - now)
+                now = time.perf_counter()
+            start = max(now, self._bus_free) if self.realtime else now
+            end = start + len(packet) * byte_time
+            for motor, status in self._process(packet, end):
+                end += motor.return_delay + len(status) * byte_time
+                self._received.append((end + self.latency if self.realtime else 0.0, status))
+                self.bytes_received += len(status)
+            self._bus_free = end
+            self.packets += 1
+            self.bytes_sent += len(packet)
+            self.bus_time += end - start
+        return len(packet)
+
+
+    def _process(self, packet: bytes, now: float) -> list:
+        """
+        Execute an instruction packet on the motors.
+
+        Returns:
+            The list of (motor, status packet) of the motors which answer, in the order of their answers.
+        """
+        if len(packet) < 10 or packet[:4] != b"\xff\xff\xfd\x00":
+            return []
+        length = packet[5] | packet[6] << 8
+        if len(packet) != length + 7:
+            return []
+        motors = {motor.id: motor for motor in self.motors.values() if motor.baud_rate == self.baudrate}
+        target = packet[4]
+        crc = packet[-2] | packet[-1] << 8
+        if self.packet_handler.updateCRC(0, packet, len(packet) - 2) != crc:
+            motor = motors.get(target)
+            return [(motor, self._status(motor, ERRNUM_CRC))] if motor is not None else []
+
+        packet = bytes(self.packet_handler.removeStuffing(list(packet)))
+        length = packet[5] | packet[6] << 8
+        instruction = packet[7]
+        params = packet[8:7 + length - 2]
+        answers = []
+
+        def answer(motor, error, data=b"", read=False):
+            level = motor.get(STATUS_RETURN_LEVEL)
+            if instruction == INST_PING or level == 2 or (read and level == 1):
+                answers.append((motor, self._status(motor, error, data)))
+
+        if instruction == INST_PING:
+            for motor in (motors.values() if target == BROADCAST_ID else [motors[target]] if target in motors else []):
+                answer(motor, 0, motor.table[0:2] + motor.table[6:7])  # model number and firmware version
+
+        elif instruction == INST_READ and target in motors:
+            error, data = motors[target].read(int.from_bytes(params[0:2], "little"), int.from_bytes(params[2:4], "little"), now)
+            answer(motors[target], error, data, read=True)
+
+        elif instruction in (INST_WRITE, INST_REBOOT) and (target in motors or target == BROADCAST_ID):
+            for motor in (motors.values() if target == BROADCAST_ID else [motors[target]]):
+                if instruction == INST_WRITE:
+                    answer(motor, motor.write(int.from_bytes(params[0:2], "little"), params[2:], now))
+                else:
+                    motor.update(now)
+                    motor.reboot()
+                    answer(motor, 0)
+
+        elif instruction == INST_SYNC_READ and target == BROADCAST_ID:
+            address, size = int.from_bytes(params[0:2], "little"), int.from_bytes(params[2:4], "little")
+            for motor_id in params[4:]:
+                if motor_id in motors:
+                    error, data = motors[motor_id].read(address, size, now)
+                    answer(motors[motor_id], error, data, read=True)
+
+        elif instruction == INST_SYNC_WRITE and target == BROADCAST_ID:
+            address, size = int.from_bytes(params[0:2], "little"), int.from_bytes(params[2:4], "little")
+            for i in range(4, len(params) - size, size + 1):
+                if params[i] in motors:
+                    motors[params[i]].write(address, params[i + 1:i + 1 + size], now)
+
+        elif instruction == INST_BULK_READ and target == BROADCAST_ID:
+            for i in range(0, len(params) - 4, 5):
+                if params[i] in motors:
+                    error, data = motors[params[i]].read(int.from_bytes(params[i + 1:i + 3], "little"),
+                                                         int.from_bytes(params[i + 3:i + 5], "little"), now)
+                    answer(motors[params[i]], error, data, read=True)
+
+        elif instruction == INST_BULK_WRITE and target == BROADCAST_ID:
+            i = 0
+            while i + 5 <= len(params):
+                size = int.from_bytes(params[i + 3:i + 5], "little")
+                if params[i] in motors:
+                    motors[params[i]].write(int.from_bytes(params[i + 1:i + 3], "little"), params[i + 5:i + 5 + size], now)
+                i += 5 + size
+
+        elif target in motors:
+            answer(motors[target], ERRNUM_INSTRUCTION)
+
+        else:
+            logger.debug(f"Simulated motors: no answer to the instruction {instruction:#x} for the id {target}")
+
+        if target == BROADCAST_ID and instruction != INST_PING and instruction not in (INST_SYNC_READ, INST_BULK_READ):
+            return []  # the broadcast instructions are not answered
+        return answers
+
+
+    def _status(self, motor: SimulatedMotor, error: int, data: bytes=b"") -> bytes:
+        """
+        Build the status packet of a motor, with its byte stuffing and its CRC.
+        """
+        length = len(data) + 4  # instruction, error and CRC
+        packet = [0xFF, 0xFF, 0xFD, 0x00, motor.id, length & 0xFF, length >> 8, INST_STATUS, error] + list(data) + [0, 0]
+        packet = self.packet_handler.addStuffing(packet)
+        crc = self.packet_handler.updateCRC(0, packet, len(packet) - 2)
+        packet[-2:] = [crc & 0xFF, crc >> 8]
+        return bytes(packet)
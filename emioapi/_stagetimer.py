@@ -0,0 +1,120 @@
+import time
+
+import numpy as np
+
+
+STAGES = ("wait", "hsv", "threshold", "morphology", "contours", "depth", "deprojection", "point_cloud", "gui")
+
+
+class StageTimer:
+    """
+    Low overhead timers of the stages of the camera pipeline.
+
+    The durations are stored in fixed size ring buffers, one per stage, so recording a stage is a clock read and an
+    array write. The percentiles are only computed when the statistics are read. The timer is disabled by default,
+    in which case every method returns immediately.
+
+    Args:
+        window: int: The number of durations kept per stage for the rolling statistics.
+        enabled: bool: Whether the timer records the durations and counters.
+    """
+
+    def __init__(self, window: int=512, enabled: bool=False):
+        self.enabled = enabled
+        self.window = window
+        self._index = {stage: i for i, stage in enumerate(STAGES)}
+        self._durations = [np.zeros(window, dtype=np.int64) for _ in STAGES]
+        self._counts = [0] * len(STAGES) # Python ints, indexing numpy scalars is several times slower
+        self._last = 0
+        self.reset()
+
+
+    def reset(self):
+        """
+        Clear the durations and counters.
+        """
+        self._counts = [0] * len(STAGES)
+        self.frames = 0
+        self.zero_marker_frames = 0
+        self.dropped_frames = 0
+        self._last_hardware_frame = None
+
+
+    def start(self):
+        """
+        Start timing the first stage of a frame.
+        """
+        if self.enabled:
+            self._last = time.perf_counter_ns()
+
+
+    def lap(self, stage: str):
+        """
+        Record the time elapsed since the last call to `start` or `lap` as the duration of the stage.
+        """
+        if self.enabled:
+            now = time.perf_counter_ns()
+            self.record(stage, now - self._last)
+            self._last = now
+
+
+    def record(self, stage: str, duration_ns: int):
+        """
+        Record a duration of the stage, in nanoseconds.
+        """
+        if self.enabled:
+            i = self._index[stage]
+            count = self._counts[i]
+            self._durations[i][count % self.window] = duration_ns
+            self._counts[i] = count + 1
+
+
+    def count_frame(self, markers: int=None):
+        """
+        Count a processed frame.
+
+        Args:
+            markers: int: The number of markers found in the frame, None if the markers are not tracked.
+        """
+        if self.enabled:
+            self.frames += 1
+            if markers == 0:
+                self.zero_marker_frames += 1
+
+
+    def count_hardware_frame(self, frame_number: int):
+        """
+        Count the frames dropped before this one, from the gap in the frame numbers of the camera.
+        """
+        if self.enabled:
+            if self._last_hardware_frame is not None and frame_number > self._last_hardware_frame + 1:
+                self.dropped_frames += frame_number - self._last_hardware_frame - 1
+            self._last_hardware_frame = frame_number
+
+
+    def stats(self) -> dict:
+        """
+        Get the rolling statistics of the stages and the counters.
+
+        Returns:
+            A dict with the counters `frames`, `zero_marker_frames` and `dropped_frames`, and for each stage which was recorded,
+            a dict with `count`, `mean_ms`, `p50_ms`, `p95_ms`, `p99_ms` and `max_ms` over the last `window` durations.
+        """
+        stats = {"enabled": self.enabled,
+                 "frames": self.frames,
+                 "zero_marker_frames": self.zero_marker_frames,
+                 "dropped_frames": self.dropped_frames,
+                 "stages": {}}
+        for stage, i in self._index.items():
+            count = self._counts[i]
+            if count == 0:
+                continue
+            durations = self._durations[i][:min(count, self.window)] / 1e6
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+            stats["stages"][stage] = {"count": count,
+                                      "mean_ms": float(durations.mean()),
+                                      "p50_ms": float(p50),
+                                      "p95_ms": float(p95),
+                                      "p99_ms": float(p99),
+                                      "max_ms": float(durations.max())}
+        return stats
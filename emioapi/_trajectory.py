@@ -0,0 +1,194 @@
+import threading
+import time
+
+import numpy as np
+
+from emioapi._motorbus import DynamixelBus, angles_to_pulses, decode_state, snapshot_dtype
+from emioapi._motorcontrolloop import MotorControlLoop
+from emioapi._logging_config import logger
+
+
+def trajectory_times(angles: np.ndarray, timestamps=None, dt: float=None) -> np.ndarray:
+    """
+    Check a trajectory and get the times of its samples, relative to its first sample.
+
+    Args:
+        angles: numpy.ndarray: The (T, N) angles of the N motors.
+        timestamps: The (T,) increasing times of the samples in seconds, or None to use `dt`.
+        dt: float: The fixed time between two samples in seconds, when `timestamps` is None.
+
+    Returns:
+        numpy.ndarray: The (T,) times, starting at 0.
+    """
+    if angles.ndim != 2 or len(angles) == 0:
+        raise ValueError(f"The trajectory must be a (T, motors) array, got the shape {angles.shape}")
+    if (timestamps is None) == (dt is None):
+        raise ValueError("Give either the timestamps of the samples or their fixed dt")
+    if timestamps is None:
+        if dt <= 0:
+            raise ValueError("dt must be positive")
+        return np.arange(len(angles)) * float(dt)
+    times = np.asarray(timestamps, dtype=np.float64)
+    if times.shape != (len(angles),):
+        raise ValueError(f"Expected {len(angles)} timestamps, got the shape {times.shape}")
+    if np.any(np.diff(times) <= 0):
+        raise ValueError("The timestamps must be strictly increasing")
+    return times - times[0]
+
+
+def interpolate_trajectory(times: np.ndarray, angles: np.ndarray, t: float, out: np.ndarray=None) -> np.ndarray:
+    """
+    Linearly interpolate the angles of a trajectory at time `t`, clamped to its first and last samples.
+
+    Returns:
+        numpy.ndarray: The angles of the motors, `out` if given.
+    """
+    if out is None:
+        out = np.empty(angles.shape[1], dtype=np.float64)
+    i = int(np.searchsorted(times, t, side="right")) - 1
+    if i < 0 or i >= len(times) - 1:
+        out[:] = angles[0] if i < 0 else angles[-1]
+        return out
+    alpha = (t - times[i]) / (times[i + 1] - times[i])
+    np.subtract(angles[i + 1], angles[i], out=out)
+    out *= alpha
+    out += angles[i]
+    return out
+
+
+class TrajectoryHandle(threading.Thread):
+    """
+    Thread streaming a trajectory to the motors, returned by `EmioMotors.play_trajectory`.
+
+    The ticks are scheduled on a fixed grid of deadlines from the start of the trajectory (the deadlines which are missed are skipped,
+    so the trajectory is not slowed down). At each tick, the goal angles are interpolated at the time elapsed since the start and sent to
+    the motors, and the tracking error (measured angles minus goal angles of the tick) is recorded.
+    When the control loop of the motors is running, the goals are posted to it and the measured angles are the state of its last tick,
+    else the thread writes the goals and reads the state itself, with one sync write and one sync read per tick.
+    An error (a failed transaction, or the error which stopped the control loop) stops the trajectory and is kept in `error`.
+
+    Args:
+        bus: DynamixelBus: The bus of the motors.
+        pulse_center: int: The pulse of the 0 rad angle.
+        angles: numpy.ndarray: The (T, N) angles of the trajectory in rad.
+        times: numpy.ndarray: The (T,) times of the samples in seconds, starting at 0 (see `trajectory_times`).
+        period: float: The period of the ticks in seconds.
+        control_loop: MotorControlLoop: The running control loop of the motors, if any.
+    """
+
+    def __init__(self, bus: DynamixelBus, pulse_center: int, angles: np.ndarray, times: np.ndarray, period: float=0.005,
+                 control_loop: MotorControlLoop=None):
+        super().__init__(name="EmioMotorsTrajectory", daemon=True)
+        if period <= 0:
+            raise ValueError("The period of the trajectory must be positive")
+        self.bus = bus
+        self.pulse_center = pulse_center
+        self.angles = np.asarray(angles, dtype=np.float64)
+        self.times = times
+        self.period = period
+        self.duration = float(times[-1])
+        self.control_loop = control_loop
+        count = int(np.ceil(self.duration / period - 1e-9)) + 1  # the last tick is at the end of the trajectory
+        self._tick_times = np.zeros(count)
+        self._errors = np.zeros((count, self.angles.shape[1]))
+        self._ticks = 0
+        self.skipped_ticks = 0
+        self.cancelled = False
+        self.error = None  # The exception which stopped the trajectory, if any
+        self._cancel = threading.Event()
+
+
+    @property
+    def progress(self) -> float:
+        """
+        The fraction of the trajectory which was played, in [0, 1].
+        """
+        if self._ticks == 0:
+            return 0.0
+        return min(self._tick_times[self._ticks - 1] / self.duration, 1.0) if self.duration > 0 else 1.0
+
+
+    @property
+    def done(self) -> bool:
+        """
+        True when the trajectory is finished, cancelled or failed.
+        """
+        return self.ident is not None and not self.is_alive()
+
+
+    @property
+    def tick_times(self) -> np.ndarray:
+        """
+        The (ticks,) times of the played ticks in seconds since the start of the trajectory.
+        """
+        return self._tick_times[:self._ticks]
+
+
+    @property
+    def tracking_errors(self) -> np.ndarray:
+        """
+        The (ticks, N) measured minus goal angles in rad of the played ticks.
+        """
+        return self._errors[:self._ticks]
+
+
+    def cancel(self, wait: bool=True):
+        """
+        Stop the trajectory at its next tick. The motors keep the last goal sent.
+        """
+        self._cancel.set()
+        if wait:
+            self.wait()
+
+
+    def wait(self, timeout: float=None) -> bool:
+        """
+        Wait for the end of the trajectory.
+
+        Returns:
+            bool: True if the trajectory is over, False if the timeout expired.
+        """
+        if threading.current_thread() is not self:
+            self.join(timeout)
+        return not self.is_alive()
+
+
+    def run(self):
+        goal = np.zeros(self.angles.shape[1])
+        state = np.zeros((), dtype=snapshot_dtype(len(self.bus.ids)))
+        start = time.perf_counter()
+        tick = 0
+        try:
+            while tick < len(self._tick_times):
+                deadline = start + tick * self.period
+                delay = deadline - time.perf_counter()
+                if delay > 0 and self._cancel.wait(delay):
+                    break
+                if self._cancel.is_set():
+                    break
+
+                t = min(tick * self.period, self.duration)
+                interpolate_trajectory(self.times, self.angles, t, out=goal)
+                if self.control_loop is not None:
+                    self.control_loop.set_angles(goal)
+                    position = self.control_loop.state["position"]
+                else:
+                    self.bus.write_goal_pulses(angles_to_pulses(goal, self.pulse_center))
+                    raw, timestamp = self.bus.read_state()
+                    position = decode_state(raw, self.pulse_center, timestamp, state)["position"]
+
+                self._tick_times[self._ticks] = t
+                np.subtract(position, goal, out=self._errors[self._ticks])
+                self._ticks += 1
+
+                # The ticks whose deadline passed are skipped, except the last one which sends the end of the trajectory
+                tick += 1
+                late = int((time.perf_counter() - start) / self.period) - tick
+                if late > 0:
+                    skipped = min(late, len(self._tick_times) - 1 - tick)
+                    self.skipped_ticks += max(skipped, 0)
+                    tick += max(skipped, 0)
+        except Exception as e:
+            logger.error(f"Trajectory stopped: {e}")
+            self.error = e
+        self.cancelled = self._cancel.is_set()
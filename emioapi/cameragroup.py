@@ -0,0 +1,167 @@
+import time
+
+from emioapi.emiocamera import EmioCamera
+from emioapi._depthcamera import FrameResult
+from emioapi._logging_config import logger
+
+
+POLICIES = ("latest", "strict")
+
+
+class CameraGroup:
+    """
+    A class to capture and process the frames of several Emio cameras in parallel.
+
+    Each camera grabs and processes its frames in its own background capture thread (OpenCV and librealsense release the GIL,
+    so the cameras are processed concurrently), and `update` returns a bundle with one result per camera:
+    - with the "latest" policy, the latest result of each camera, once every camera has processed a new frame;
+    - with the "strict" policy, results whose timestamps (see `FrameResult.timestamp`) are within `tolerance` of each other.
+      The cameras whose frames are too old wait for their next frames until the bundle matches.
+
+    The HSV frame, mask and point cloud of a result are reused by its camera after 2 more frames (see `DepthCamera.result`),
+    copy them if they are needed longer.
+
+    Example:
+        ```python
+        from emioapi import EmioCamera, CameraGroup
+
+        cameras = [EmioCamera(track_markers=True, background_capture=True) for _ in EmioCamera.listCameras()]
+        group = CameraGroup(cameras, policy="strict")
+
+        if group.open(EmioCamera.listCameras()):
+            try:
+                while group.is_running:
+                    bundle = group.update(timeout=1.0)
+                    if bundle is not None:
+                        print("Trackers positions:", [result.trackers_pos for result in bundle])
+            finally:
+                group.close()
+        ```
+    """
+
+    def __init__(self, cameras: list[EmioCamera], policy: str="latest", tolerance: float=None):
+        """
+        Initialize the group.
+        Args:
+            cameras: list[EmioCamera]: The cameras of the group, created with `background_capture=True`.
+            policy: str: "latest" (default) or "strict", see the class description.
+            tolerance: float: The maximum difference in seconds between the timestamps of the results of a "strict" bundle.
+                Defaults to half the frame period of the slowest camera.
+        """
+        if not cameras:
+            raise ValueError("A camera group needs at least one camera")
+        for camera in cameras:
+            if not camera.background_capture:
+                raise ValueError("The cameras of a group must be created with background_capture=True")
+        self.cameras = list(cameras)
+        self.policy = policy
+        self.tolerance = tolerance if tolerance is not None else 0.5 / min(camera.fps for camera in self.cameras)
+        self._frame_numbers = [0] * len(self.cameras)
+
+
+    @property
+    def policy(self) -> str:
+        """
+        Get the matching policy of the bundles, "latest" or "strict".
+        """
+        return self._policy
+
+
+    @policy.setter
+    def policy(self, value: str):
+        if value not in POLICIES:
+            raise ValueError(f"The policy must be one of {POLICIES}, got {value}")
+        self._policy = value
+
+
+    @property
+    def is_running(self) -> bool:
+        """
+        Get whether all the cameras of the group are running.
+        """
+        return all(camera.is_running for camera in self.cameras)
+
+
+    @property
+    def skew(self) -> float | None:
+        """
+        Get the difference in seconds between the oldest and the newest timestamps of the last bundle, None if no bundle was returned yet.
+        """
+        results = [camera.result for camera in self.cameras]
+        if any(result is None for result in results):
+            return None
+        timestamps = [result.timestamp for result in results]
+        return max(timestamps) - min(timestamps)
+
+
+    def open(self, camera_serials: list[str]=None) -> bool:
+        """
+        Open the cameras of the group, which starts their capture threads.
+
+        Args:
+            camera_serials: list[str]: The serial numbers of the cameras to open, in the order of `cameras`. If None, each camera opens the camera given at its creation.
+
+        Returns:
+            bool: True if all the cameras were opened. Otherwise the cameras which were opened are closed.
+        """
+        if camera_serials is not None and len(camera_serials) != len(self.cameras):
+            raise ValueError(f"Expected {len(self.cameras)} camera serials, got {len(camera_serials)}")
+
+        for i, camera in enumerate(self.cameras):
+            if not camera.open(camera_serials[i] if camera_serials is not None else None):
+                logger.error(f"Could not open the camera {i} of the group")
+                self.close()
+                return False
+        self._frame_numbers = [0] * len(self.cameras)
+        return True
+
+
+    def update(self, timeout: float=None) -> list[FrameResult] | None:
+        """
+        Wait for a new bundle of results, one per camera, according to the `policy`.
+        The cameras are also updated with their result, so their properties (`trackers_pos`, `point_cloud`...) match the bundle.
+
+        Args:
+            timeout: float: The maximum time to wait in seconds. None to wait forever.
+
+        Returns:
+            list[FrameResult] | None: The results in the order of `cameras`, or None if the timeout expired or a camera stopped.
+
+        Raises:
+            Exception: The error which stopped the capture thread of a camera.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+
+        # Every camera must have processed a frame newer than in the last bundle, then the latest frame of each is taken
+        for camera, frame_number in zip(self.cameras, self._frame_numbers):
+            if camera.frame_number <= frame_number and not camera.wait_for_next(self._remaining(deadline)):
+                return None
+        for camera in self.cameras:
+            camera.update()
+
+        if self._policy == "strict":
+            while True:
+                timestamps = [camera.result.timestamp for camera in self.cameras]
+                oldest = min(range(len(self.cameras)), key=timestamps.__getitem__)
+                if max(timestamps) - timestamps[oldest] <= self.tolerance:
+                    break
+                if not self.cameras[oldest].wait_for_next(self._remaining(deadline)):
+                    return None
+
+        self._frame_numbers = [camera.frame_number for camera in self.cameras]
+        return [camera.result for camera in self.cameras]
+
+
+    def close(self):
+        """
+        Close all the cameras of the group.
+        """
+        for camera in self.cameras:
+            camera.close()
+
+
+    @staticmethod
+    def _remaining(deadline: float | None) -> float | None:
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.perf_counter())
@@ -24,7 +24,8 @@ from dataclasses import field
 from threading import Lock
 
 from dynamixelmotorsapi import listFTDIDevices, listUnusedFTDIDevices, listUsedFTDIDevices
-from emioapi import EmioMotors
+from emioapi import EmioMotors, SimulatedPortHandler
+from emioapi.emiomotors import MOTOR_IDS
 from emioapi import MultiprocessEmioCamera
 from emioapi import EmioCamera, emiocamera
 from emioapi._logging_config import logger
@@ -45,6 +46,7 @@ class EmioAPI:
         > All the data sent to the motors are list of *4 values* for the *4 motors* of the emio device. The order in the list corresponds to the motor ID's in the emio device.
         > Motor 0 is the first motor in the list, motor 1 is the second motor, etc.
         > You can open a connection directly to the motors using the [`open`](#opendevice_name-str--none) method of the `motors` object.
+        > With `EmioAPI(simulated_motors=True)`, the motors are simulated (see `SimulatedPortHandler`), so the motors can be used without the device.
         > 
         > :::warning 
         > 
@@ -125,9 +127,9 @@ class EmioAPI:
 
 
 
-    def __init__(self, multiprocess_camera=False):
+    def __init__(self, multiprocess_camera=False, simulated_motors=False):
         self._lock = Lock()
-        self.motors = EmioMotors()
+        self.motors = EmioMotors(simulation=SimulatedPortHandler(MOTOR_IDS) if simulated_motors else None)
         self.camera = MultiprocessEmioCamera() if multiprocess_camera else EmioCamera()
 
 
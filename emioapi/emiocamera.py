@@ -1,7 +1,10 @@
 import threading
+import time
 import numpy as np
 
 from emioapi._depthcamera import *
+from emioapi._capturethread import CaptureThread
+from emioapi._markertracker import MarkerTracker
 from emioapi._logging_config import logger
 
 
@@ -62,8 +65,11 @@ class EmioCamera:
     _parameter: dict = None
     _trackers_pos: list = []
     _point_cloud: np.ndarray = None
-    _hsv_frame: np.ndarray = None
-    _mask_frame: np.ndarray = None
+    _result: FrameResult = None
+    _capture_thread: CaptureThread = None
+    _marker_tracker: MarkerTracker = None
+    _tracked_positions: np.ndarray = np.zeros((0, 3))
+    _tracked_valid: np.ndarray = np.zeros(0, dtype=bool)
 
     camera_serial: str = None
 
@@ -74,7 +80,14 @@ class EmioCamera:
                  show: bool=False,
                  track_markers: bool=False,
                  compute_point_cloud: bool=False,
-                 configuration: str="extended"):
+                 configuration: str="extended",
+                 background_capture: bool=False,
+                 replay: str=None,
+                 replay_realtime: bool=False,
+                 collect_stats: bool=False,
+                 stable_marker_ids: bool=False,
+                 segmentation_scale: int=1,
+                 color_classifier: str="hsv"):
         """
         Initialize the camera.
         Args:
@@ -84,8 +97,16 @@ class EmioCamera:
             track_markers: bool:  Whether to track objects or not.
             compute_point_cloud: bool: Whether to compute the point cloud or not.
             configuration: str: Configuration of Emio, either "extended" (default) or "compact"
+            background_capture: bool: Whether to grab and process the frames in a background thread. If True, `update` does not wait for the camera and returns immediately with the latest processed frame.
+            replay: str: The directory of a recording made with `start_recording`. If set, the frames are read from the recording instead of a camera, and the camera stops at the end of the recording.
+            replay_realtime: bool: Whether to replay the recording at the pace it was recorded. If False (default), the frames are replayed as fast as possible.
+            collect_stats: bool: Whether to time the stages of the processing of the frames, see `stats`.
+            stable_marker_ids: bool: Whether to give stable identities to the tracked markers from one frame to the next, see `tracked_markers`.
+            segmentation_scale: int: 1 (default), 2 or 4. Above 1, the markers are searched in frames downscaled by this factor, then their contour and depth are refined at full resolution in a small window around each of them. This divides the cost of the segmentation by up to the square of the factor, for high frame rates.
+            color_classifier: str: "hsv" (default) to segment the markers on the HSV frame, or "lut" to classify the BGR colors with a lookup table compiled from the HSV parameters. The lookup table skips the HSV conversion (the HSV frame is then only computed when it is read), at the cost of a quantization of the colors to 5-6 bits per channel.
         """
         self.camera_serial = camera_serial
+        self._background_capture = background_capture
         self._tracking = track_markers
         self._show = show
         self._compute_point_cloud = compute_point_cloud
@@ -98,7 +119,14 @@ class EmioCamera:
                                        compute_point_cloud=self._compute_point_cloud,
                                        show_video_feed=self._show,
                                        tracking=self._tracking,
-                                       configuration=self.configuration)
+                                       configuration=self.configuration,
+                                       replay_path=replay,
+                                       replay_realtime=replay_realtime,
+                                       segmentation_scale=segmentation_scale,
+                                       color_classifier=color_classifier)
+        self._camera.timer.enabled = collect_stats
+        if stable_marker_ids:
+            self._marker_tracker = MarkerTracker()
 
 
 
@@ -116,8 +144,8 @@ class EmioCamera:
         Returns:
             numpy.ndarray: the latest depth frame
         """
-        if self.is_running:
-            return self._camera.depth_frame
+        if self.is_running and self._result is not None:
+            return self._result.depth_frame
         return None
 
     @property
@@ -127,10 +155,133 @@ class EmioCamera:
         Returns:
             numpy.ndarray: the latest color frame
         """
-        if self.is_running:
-            return self._camera.frame
+        if self.is_running and self._result is not None:
+            return self._result.frame
         return None
 
+    @property
+    def background_capture(self) -> bool:
+        """
+        Get whether the frames are grabbed and processed in a background thread.
+        Returns:
+            bool: True if the frames are processed in a background thread, else False.
+        """
+        return self._background_capture
+
+    @property
+    def frame_number(self) -> int:
+        """
+        Get the number of the frame returned by the last `update`, starting at 1. 0 if no frame was processed yet.
+        Returns:
+            int: The frame number.
+        """
+        return self._result.frame_number if self._result is not None else 0
+
+    @property
+    def frame_age(self) -> float | None:
+        """
+        Get the time elapsed since the processing of the frame returned by the last `update` completed.
+        Returns:
+            float | None: The age of the frame in seconds, None if no frame was processed yet.
+        """
+        if self._result is None:
+            return None
+        return time.perf_counter() - self._result.completed_time
+
+    @property
+    def timestamp(self) -> float | None:
+        """
+        Get the capture timestamp of the frame returned by the last `update`, given by the camera (see `FrameResult.timestamp`).
+        Returns:
+            float | None: The timestamp in seconds, None if no frame was processed yet.
+        """
+        return self._result.timestamp if self._result is not None else None
+
+    @property
+    def hardware_frame_number(self) -> int:
+        """
+        Get the number given by the camera to the frame returned by the last `update`. A gap with the previous frame means that frames were dropped,
+        the same number means that the frame was returned twice (see `update` with `background_capture`).
+        Returns:
+            int: The hardware frame number, 0 if no frame was processed yet.
+        """
+        return self._result.hardware_frame_number if self._result is not None else 0
+
+    @property
+    def latency(self) -> float | None:
+        """
+        Get the time from the capture of the frame returned by the last `update` to the end of its processing.
+        The capture time is estimated from the camera timestamp when the camera clock is synchronized with the host, else the reception time of the frame is used.
+        Returns:
+            float | None: The latency in seconds, None if no frame was processed yet.
+        """
+        return self._result.latency if self._result is not None else None
+
+    @property
+    def result(self) -> FrameResult | None:
+        """
+        Get all the products of the frame returned by the last `update`.
+        Returns:
+            FrameResult | None: The result of the frame, None if no frame was processed yet.
+        """
+        return self._result
+
+    @property
+    def segmentation_scale(self) -> int:
+        """
+        Get the downscaling factor of the segmentation, chosen at construction.
+        Returns:
+            int: 1, 2 or 4.
+        """
+        return self._camera.segmentation_scale
+
+    @property
+    def color_classifier(self) -> str:
+        """
+        Get the classifier of the colors of the markers.
+        Returns:
+            str: "hsv" or "lut".
+        """
+        return self._camera.color_classifier
+
+    @color_classifier.setter
+    def color_classifier(self, value: str):
+        """
+        Set the classifier of the colors of the markers, "hsv" to segment the HSV frame, or "lut" to classify the BGR frame with a lookup table.
+        Args:
+            value: str: "hsv" or "lut".
+        """
+        self._camera.set_color_classifier(value)
+
+    @property
+    def collect_stats(self) -> bool:
+        """
+        Get whether the stages of the processing of the frames are timed.
+        Returns:
+            bool: True if the statistics are collected, else False.
+        """
+        return self._camera.timer.enabled
+
+    @collect_stats.setter
+    def collect_stats(self, value: bool):
+        """
+        Enable or disable the timing of the stages of the processing of the frames.
+        The overhead is a clock read per stage, so it can be left enabled under load.
+        Args:
+            value: bool: True to collect the statistics.
+        """
+        self._camera.timer.enabled = value
+
+    @property
+    def stats(self) -> dict:
+        """
+        Get the rolling statistics of the processing of the frames, collected when `collect_stats` is enabled.
+        Returns:
+            dict: The counters `frames`, `zero_marker_frames` and `dropped_frames`, and in `stages` the `p50_ms`, `p95_ms`, `p99_ms`, `mean_ms` and `max_ms`
+            durations of the stages (`wait`, `hsv`, `threshold`, `morphology`, `contours`, `depth`, `deprojection`, `point_cloud`, `gui`) over the last frames.
+        """
+        return self._camera.timer.stats()
+
     @property
     def is_running(self) -> bool:
         """
@@ -261,6 +412,26 @@ class EmioCamera:
             else:
                 return []
 
+    @property
+    def tracked_markers(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the positions of the markers in stable identity order, when the camera was created with `stable_marker_ids=True`.
+        The identity of a marker is its row, it stays the same while the marker is tracked, whatever the order in which the markers are detected.
+        The positions are filtered with a constant velocity model, and the markers which are briefly not detected keep their identity with a predicted position.
+        Returns:
+            (positions, valid): the (N, 3) positions in the Emio frame, NaN for the unused identities,
+            and the (N,) flags which are True for the markers detected in the last frame.
+        """
+        with self._lock:
+            return self._tracked_positions, self._tracked_valid
+
+    @property
+    def marker_tracker(self) -> MarkerTracker | None:
+        """
+        Get the tracker giving the stable identities of the markers, to tune its gate and filter gains. None if `stable_marker_ids` is False.
+        """
+        return self._marker_tracker
+
     @property
     def point_cloud(self) -> np.ndarray:
         """
@@ -278,13 +449,13 @@ class EmioCamera:
     @property
     def hsv_frame(self) -> np.ndarray:
         """
-        Get the HSV frame.
+        Get the HSV frame. It is computed on first access for each frame, and cached for the frame.
         Returns:
             The HSV frame as a numpy array.
         """
         with self._lock:
-            if self._hsv_frame is not None:
-                return self._hsv_frame
+            if self._result is not None:
+                return self._result.hsv_frame
             else:
                 return None
 
@@ -292,13 +463,13 @@ class EmioCamera:
     @property
     def mask_frame(self) -> np.ndarray:
         """
-        Get the mask frame.
+        Get the mask frame. It is computed on first access for each frame, and cached for the frame.
         Returns:
             The mask frame as a numpy array.
         """
         with self._lock:
-            if self._mask_frame is not None:
-                return self._mask_frame
+            if self._result is not None:
+                return self._result.mask_frame
             else:
                 return None
 
@@ -375,6 +546,96 @@ class EmioCamera:
         """
         self._camera.set_depth_min(value)
 
+    @property
+    def marker_depth_statistic(self) -> tuple[str, float | None]:
+        """
+        Get the statistic used to estimate the depth of a marker when there is no depth value at its center.
+        Default is the median of the depth values inside the marker contour.
+        Returns:
+            tuple: The statistic ("median", "trimmed_mean" or "percentile") and its parameter.
+        """
+        return self._camera.depth_estimator.statistic, self._camera.depth_estimator.parameter
+
+    @marker_depth_statistic.setter
+    def marker_depth_statistic(self, value: str | tuple[str, float]):
+        """
+        Set the statistic used to estimate the depth of a marker when there is no depth value at its center.
+        Args:
+            value: str | tuple: One of:
+                - "median"
+                - "trimmed_mean" or ("trimmed_mean", proportion): mean after cutting a proportion of the values at each end (default 0.1)
+                - "percentile" or ("percentile", q): the q-th percentile of the values (default 50)
+        """
+        if isinstance(value, str):
+            self._camera.set_marker_depth_statistic(value)
+        else:
+            self._camera.set_marker_depth_statistic(*value)
+
+    @property
+    def point_cloud_in_simulation_frame(self) -> bool:
+        """
+        Get whether the point cloud is given in the simulation (Emio) frame in millimeters, or in the camera frame in meters.
+        Default is False (camera frame).
+        Returns:
+            bool: True if the point cloud is given in the simulation frame, else False.
+        """
+        return self._camera.point_cloud_in_simulation_frame
+
+    @point_cloud_in_simulation_frame.setter
+    def point_cloud_in_simulation_frame(self, value: bool):
+        """
+        Set whether the point cloud is given in the simulation (Emio) frame in millimeters.
+        The transform is applied in one vectorized pass into a preallocated buffer, reused from one frame to the next.
+
+        :::warning
+        The returned point cloud is overwritten at the next `update`. Copy it if you need to keep it.
+        :::
+
+        Args:
+            value: bool: True to get the point cloud in the simulation frame.
+        """
+        self._camera.point_cloud_in_simulation_frame = value
+
+    @property
+    def workspace_box(self) -> tuple | None:
+        """
+        Get the workspace box used to crop the point cloud in the simulation frame.
+        Returns:
+            tuple | None: ((xmin, ymin, zmin), (xmax, ymax, zmax)) in millimeters in the simulation frame, or None if the point cloud is not cropped.
+        """
+        return self._camera.workspace_box
+
+    @workspace_box.setter
+    def workspace_box(self, value: tuple | None):
+        """
+        Set the workspace box used to crop the point cloud. The points outside of the box are dropped.
+        Only used when `point_cloud_in_simulation_frame` is True.
+        Args:
+            value: tuple | None: ((xmin, ymin, zmin), (xmax, ymax, zmax)) in millimeters in the simulation frame, or None to keep all the points.
+        """
+        if value is not None and (len(value) != 2 or len(value[0]) != 3 or len(value[1]) != 3):
+            raise ValueError("workspace_box must be ((xmin, ymin, zmin), (xmax, ymax, zmax)) or None")
+        self._camera.workspace_box = value
+
+    @property
+    def roi(self) -> tuple | None:
+        """
+        Get the region of interest of the segmentation, in which the markers are searched.
+        Returns:
+            tuple | None: The region (x, y, w, h) in pixels, or None if the full frame is processed.
+        """
+        return self._camera.roi
+
+    @roi.setter
+    def roi(self, value: tuple | None):
+        """
+        Set the region of interest of the segmentation. Only this region of the frames is segmented, the HSV and mask frames are black outside of it.
+        See also `set_roi_from_workspace` to compute it from the workspace of Emio.
+        Args:
+            value: tuple | None: The region (x, y, w, h) in pixels, or None to process the full frame.
+        """
+        self._camera.set_roi(value)
+
 #endregion
 
 
@@ -420,6 +681,7 @@ class EmioCamera:
             self._camera.open()
             self.camera_serial = self._camera.camera_serial
             self._running = True
+            self._start_capture_thread()
             logger.info(f"Camera {self.camera_serial} successfully started.")
             return True
         except Exception as e:
@@ -436,7 +698,25 @@ class EmioCamera:
         See the [Emio documentation](https://docs-support.compliance-robotics.com/docs/next/Users/Emio/getting-started-with-emio/).
         """
         if self._camera is not None:
+            restart = self._stop_capture_thread()
             self._camera.calibrate()
+            if restart:
+                self._start_capture_thread()
+
+
+    def set_roi_from_workspace(self, box: tuple=DEFAULT_WORKSPACE_BOX, margin: int=20) -> tuple | None:
+        """
+        Set the region of interest of the segmentation to the region of the image in which a workspace volume is seen, using the calibration of the camera.
+        The region follows the calibration: it is computed again when the camera is opened or calibrated.
+
+        Args:
+            box: tuple: The workspace volume ((xmin, ymin, zmin), (xmax, ymax, zmax)) in mm in the Emio frame. Defaults to the volume in which the legs of Emio move.
+            margin: int: The number of pixels added around the projection of the volume.
+
+        Returns:
+            tuple | None: The region (x, y, w, h) in pixels, or None if the camera is not open yet or the volume could not be projected, in which case the full frame is processed.
+        """
+        return self._camera.set_roi_from_workspace(box, margin)
 
 
     def image_to_simulation(self, x: int, y: int, depth: float = None) -> list[float]:
@@ -451,35 +731,193 @@ class EmioCamera:
         """
         if self.is_running:
             if depth is None:
-                depth = self._camera.depth_frame[y][x]
+                depth = self.depth_frame[y][x]
             return self._camera.position_estimator.camera_image_to_simulation(x, y, depth)
 
         return None
 
 
+    def image_to_simulation_batch(self, pixels: np.ndarray) -> np.ndarray:
+        """
+        Get the 3D points in the simulation reference frame from several pixels in one vectorized pass.
+
+        Args:
+            pixels: numpy.ndarray: (N, 3) array of (x, y, depth), or (N, 2) array of (x, y) to use the depth of the latest depth frame
+
+        Returns:
+            a (N, 3) numpy array of the corresponding 3D points in the simulation reference frame
+        """
+        if self.is_running:
+            pixels = np.asarray(pixels)
+            if pixels.shape[-1] == 2:
+                x = pixels[:, 0].astype(int)
+                y = pixels[:, 1].astype(int)
+                pixels = np.column_stack((x, y, self.depth_frame[y, x]))
+            return self._camera.position_estimator.camera_image_to_simulation_batch(pixels)
+
+        return None
+
+
     def update(self):
         """
             Update the camera frames and tracking elements (markers and point cloud)
+
+            With `background_capture`, this returns immediately with the latest frame processed by the capture thread, which may be the same as for the previous call (see `frame_number`).
+
+            Raises:
+                Exception: The error which stopped the capture thread, with `background_capture`. The camera is then stopped.
+        """
+        if self._camera is not None:
+            if self._capture_thread is not None:
+                self._check_capture_thread()
+                result = self._capture_thread.latest
+                if result is None:
+                    return
+                self._camera.refresh_windows(result)
+            else:
+                if not self._camera.update():
+                    if self._camera.replay_finished:
+                        self._running = False
+                    return
+                result = self._camera.result()
+            self._publish(result)
+
+
+    def wait_for_next(self, timeout: float=None) -> bool:
+        """
+        Block until a frame newer than the one returned by the last `update` is processed, and update the camera frames and tracking elements with it.
+        Without `background_capture`, this is the same as `update`.
+
+        Args:
+            timeout: float: The maximum time to wait in seconds. None to wait forever.
+
+        Returns:
+            bool: True if a new frame was received, False if the timeout expired or the camera stopped.
+
+        Raises:
+            Exception: The error which stopped the capture thread. The camera is then stopped.
+        """
+        if self._capture_thread is None:
+            frame_number = self.frame_number
+            self.update()
+            return self.frame_number > frame_number
+
+        result = self._capture_thread.wait_for_next(self.frame_number, timeout)
+        if result is None:
+            self._check_capture_thread()
+            return False
+        self._camera.refresh_windows(result)
+        self._publish(result)
+        return True
+
+
+    def start_recording(self, path: str):
+        """
+        Record the color and depth frames of the camera, with its intrinsics and depth scale, in the directory `path`.
+        The recording can then be replayed through the same tracking pipeline without a camera, using `EmioCamera(replay=path)`.
+        The camera must be open.
+
+        Args:
+            path: str: The directory of the recording. It is created if needed, and an existing recording in it is overwritten.
+        """
+        if not self.is_running:
+            raise RuntimeError("The camera must be open to start a recording")
+        self._camera.start_recording(path)
+
+
+    def stop_recording(self):
+        """
+        Stop the recording started with `start_recording`.
         """
         if self._camera is not None:
-            self._camera.update()
-            with self._lock:
-                self._hsv_frame = self._camera.hsvFrame
-                self._mask_frame = self._camera.maskFrame
-                if self._tracking:
-                    self._trackers_pos = []
-                    for p_camera in self._camera.trackers_pos:
-                        p_emio = [p_camera[0], p_camera[1], p_camera[2], 0, 0, 0, 1]
-                        self._trackers_pos.append(p_emio[0:3])
-                    logger.debug(f"Trackers positions in camera frame: {self._camera.trackers_pos}, converted to Emio frame: {self._trackers_pos}")
-                if self._compute_point_cloud:
-                        self._point_cloud = self._camera.point_cloud
+            self._camera.stop_recording()
+
+
+    def predict_markers(self, timestamp: float=None) -> np.ndarray:
+        """
+        Extrapolate the positions of the tracked markers with their velocity, for instance to compensate the camera latency in a controller.
+        Requires `stable_marker_ids=True`.
+
+        Args:
+            timestamp: float: The time of the prediction, in seconds of `time.perf_counter`. Defaults to now.
+
+        Returns:
+            numpy.ndarray: The (N, 3) predicted positions in stable identity order, NaN for the unused identities.
+        """
+        if self._marker_tracker is None:
+            raise RuntimeError("The marker identities are not tracked, create the camera with stable_marker_ids=True")
+        with self._lock:
+            return self._marker_tracker.predict(time.perf_counter() if timestamp is None else timestamp)
+
+
+    def reset_stats(self):
+        """
+        Clear the statistics returned by `stats`.
+        """
+        self._camera.timer.reset()
+
+
+    def _publish(self, result: FrameResult):
+        """
+        Expose the products of a processed frame through the properties.
+        """
+        with self._lock:
+            new_frame = self._result is None or result.frame_number != self._result.frame_number
+            self._result = result
+            if self._tracking and self._marker_tracker is not None and new_frame:
+                self._tracked_positions, self._tracked_valid = self._marker_tracker.update(result.trackers_pos, result.capture_time)
+            if self._tracking:
+                self._trackers_pos = []
+                for p_camera in result.trackers_pos:
+                    p_emio = [p_camera[0], p_camera[1], p_camera[2], 0, 0, 0, 1]
+                    self._trackers_pos.append(p_emio[0:3])
+                logger.debug(f"Trackers positions in camera frame: {result.trackers_pos}, converted to Emio frame: {self._trackers_pos}")
+            if self._compute_point_cloud:
+                    self._point_cloud = result.point_cloud
+
+
+    def _check_capture_thread(self):
+        """
+        Stop the camera when the capture thread reached the end of the replayed recording, or raise the error which stopped it.
+        """
+        if self._capture_thread.is_alive():
+            return
+        if self._capture_thread.error is not None:
+            self._running = False
+            raise self._capture_thread.error
+        if self._camera.replay_finished:
+            self._running = False
+
+
+    def _start_capture_thread(self):
+        """
+        Start the background capture thread if the background capture is enabled.
+        """
+        if self._background_capture and self._capture_thread is None:
+            self._capture_thread = CaptureThread(self._camera)
+            self._capture_thread.start()
+
+
+    def _stop_capture_thread(self) -> bool:
+        """
+        Stop the background capture thread if it is running.
+
+        Returns:
+            bool: True if a thread was stopped.
+        """
+        if self._capture_thread is None:
+            return False
+        self._capture_thread.stop()
+        self._capture_thread = None
+        return True
+
 
     def close(self):
         """
         Close the camera and terminate the process. Sets the running status to False.
         """
         self._running = False
+        self._stop_capture_thread()
         if self._camera is not None:
             self._camera.close()
 #endregion
@@ -1,15 +1,57 @@
 from dataclasses import field
-from threading import Lock
+from threading import RLock
 from math import pi
 
+import numpy as np
+
 from dynamixelmotorsapi import DynamixelMotors
+from emioapi._motorbus import DynamixelBus, angles_to_pulses, decode_state, snapshot_dtype
+from emioapi._motorcontrolloop import MotorControlLoop
+from emioapi._trajectory import TrajectoryHandle, trajectory_times
+from emioapi._motorrecorder import MotorTelemetryRecorder, read_motor_recording
+from emioapi._goalwriter import GoalWriter
+from emioapi._simulatedbus import (SimulatedPortHandler, OPERATING_MODE, TORQUE_ENABLE, POSITION_P_GAIN, POSITION_I_GAIN, POSITION_D_GAIN,
+                                   GOAL_PWM, PROFILE_VELOCITY, PRESENT_VELOCITY, MOVING)
 from emioapi._logging_config import logger
 
+
+MOTOR_IDS = [0, 1, 2, 3]
+PULSE_CENTER = 2048
+SNAPSHOT_DTYPE = snapshot_dtype(len(MOTOR_IDS))  # dtype of the samples returned by `EmioMotors.snapshot`
+
+
+def _port_property(name: str, doc: str, entry: tuple, kind=int, read_only: bool=False, resets_goals: bool=False) -> property:
+    """
+    Property of DynamixelMotors whose transactions hold the lock of the port, so they are not interleaved with the ones of the bus.
+    For simulated motors, it reads and writes the raw values of the `entry` of the control table instead, converted to `kind`.
+    With `resets_goals`, setting it resets the goal writer, as it changes what the motors do with their goal positions.
+    """
+    def fget(self):
+        if self._simulation is not None:
+            return [kind(value) for value in self._read_entry(entry)]
+        with self._port_lock:
+            return getattr(DynamixelMotors, name).fget(self)
+
+    def fset(self, value):
+        if read_only:
+            raise AttributeError(f"{name} is read only")
+        if self._simulation is not None:
+            self._write_entry(entry, value)
+        else:
+            with self._port_lock:
+                getattr(DynamixelMotors, name).fset(self, value)
+        if resets_goals:
+            self._goal_writer.reset()
+
+    return property(fget, fset, doc=doc)
+
+
 class EmioMotors(DynamixelMotors):
     """
     Class to control emio motors.
     The class is designed to be used with the emio device.
-    The motors are controlled in position mode. The class is thread-safe and can be used in a multi-threaded environment.
+    The motors are controlled in position mode. The class is thread-safe and can be used in a multi-threaded environment:
+    all the transactions on the port, of DynamixelMotors and of the sync reads and writes, are serialized by the same lock.
 
     Example:
         ```python
@@ -35,19 +77,401 @@ class EmioMotors(DynamixelMotors):
             print("Failed to connect to motors.")
         ```
 
+    Args:
+        write_period: float: The minimum time in seconds between two writes of the goal angles, see `goal_writer`. With 0, the goals
+            which change are written immediately.
+        simulation: SimulatedPortHandler: The port of simulated motors to use instead of the real ones, for instance
+            `SimulatedPortHandler(MOTOR_IDS, realtime=False)` to run faster than real time. Then all the methods and properties of the class
+            (`open`, `angles`, `max_velocity`, `moving`, `printStatus`, `snapshot`, control loop, trajectories, recordings...) are served by
+            the simulated motors through the sync transactions of the bus, and the values other than the angles are the raw values of
+            their control table.
+
     """
+    _bus: DynamixelBus = None
+    _control_loop: MotorControlLoop = None
+    _trajectory: TrajectoryHandle = None
+    _recorder: MotorTelemetryRecorder = None
+
+    velocity = _port_property("velocity", "Get the current velocities of the motors.", PRESENT_VELOCITY, read_only=True)
+    goal_pwm = _port_property("goal_pwm", "Get or set the goal PWM of the motors, in PWM mode.", GOAL_PWM, resets_goals=True)
+    max_velocity = _port_property("max_velocity", "Get or set the maximum velocities of the motors.", PROFILE_VELOCITY)
+    moving = _port_property("moving", "Get whether the motors are moving.", MOVING, kind=bool, read_only=True)
+    position_p_gain = _port_property("position_p_gain", "Get or set the P gains of the position controllers of the motors.", POSITION_P_GAIN)
+    position_i_gain = _port_property("position_i_gain", "Get or set the I gains of the position controllers of the motors.", POSITION_I_GAIN)
+    position_d_gain = _port_property("position_d_gain", "Get or set the D gains of the position controllers of the motors.", POSITION_D_GAIN)
 
 
     #####################
     ###### METHODS ######
     #####################
 
-    def __init__(self):
+    def __init__(self, write_period: float=0.0, simulation: SimulatedPortHandler=None):
         super().__init__([{
-            "id": [0, 1, 2, 3],
+            "id": MOTOR_IDS,
             "model": "XM430-W210",
             "pulley_radius": 20,
-            "pulse_center": 2048,
+            "pulse_center": PULSE_CENTER,
             "max_vel": 1000,
             "baud_rate": 1000000
         }])
+        self._port_lock = RLock()  # serializes the transactions of DynamixelMotors and of the bus on the port
+        self._simulation = simulation
+        self._goal_writer = GoalWriter(self._write_goal_angles, PULSE_CENTER, write_period)
+
+
+    @property
+    def simulation(self) -> SimulatedPortHandler | None:
+        """
+        Get the port of the simulated motors, None when the real motors are used.
+        """
+        return self._simulation
+
+
+    @property
+    def device_name(self) -> str | None:
+        """
+        Get the name of the port of the motors, the name of the simulated port for simulated motors.
+        """
+        if self._simulation is not None:
+            return self._simulation.getPortName()
+        return DynamixelMotors.device_name.fget(self)
+
+
+    @device_name.setter
+    def device_name(self, device_name: str):
+        DynamixelMotors.device_name.fset(self, device_name)
+
+
+    @property
+    def is_connected(self) -> bool:
+        """
+        Check if the motors are connected.
+        """
+        if self._simulation is not None:
+            return self._simulation.is_open
+        return DynamixelMotors.is_connected.fget(self)
+
+
+    def open(self, device_name: str=None, multi_turn: bool=False) -> bool:
+        """
+        Open the connection to the motors and enable their torque.
+
+        Args:
+            device_name: str: The name of the port of the motors, the first one found if None. Ignored for simulated motors.
+            multi_turn: bool: Whether to enable the multi-turn (extended position) mode of the motors.
+
+        Returns:
+            True if the connection is successful, False otherwise.
+        """
+        self._goal_writer.reset()  # the goals of the motors are unknown after a (re)connection
+        if self._simulation is None:
+            with self._port_lock:
+                return super().open(device_name, multi_turn)
+        if not self._simulation.openPort():
+            return False
+        bus = self._get_bus()
+        try:
+            bus.sync_write(TORQUE_ENABLE[0], np.zeros((len(MOTOR_IDS), 1)))
+            bus.sync_write(OPERATING_MODE[0], np.full((len(MOTOR_IDS), 1), 4 if multi_turn else 3))
+            bus.sync_write(TORQUE_ENABLE[0], np.ones((len(MOTOR_IDS), 1)))
+        except ConnectionError as e:
+            logger.error(f"Failed to configure the simulated motors: {e}")
+            self._simulation.closePort()
+            return False
+        logger.info(f"Connected to the simulated motors on {self._simulation.getPortName()}")
+        return True
+
+
+    def findAndOpen(self, device_name: str=None, multi_turn: bool=False) -> int:
+        """
+        Open the connection to the first motors found, or to the motors of `device_name`.
+
+        Returns:
+            The index of the device connected to, -1 if the connection failed.
+        """
+        if self._simulation is None:
+            self._goal_writer.reset()
+            with self._port_lock:
+                return super().findAndOpen(device_name, multi_turn)
+        return 0 if self.open(device_name, multi_turn) else -1
+
+
+    @property
+    def angles(self) -> list:
+        """
+        Get the current angles of the motors in rad.
+        While the control loop runs, these are the angles read at its last tick, without waiting for the bus,
+        and the error which stopped the loop, if any, is raised.
+        """
+        if self._control_loop is not None:
+            return self._control_loop.state["position"].tolist()
+        if self._simulation is not None:
+            return self.snapshot()["position"].tolist()
+        with self._port_lock:
+            return DynamixelMotors.angles.fget(self)
+
+
+    @angles.setter
+    def angles(self, angles: list):
+        """
+        Set the goal angles of the motors in rad.
+        The goals which do not change the goal position in pulses of any motor are not written, and the writes are coalesced
+        to at most one per `goal_writer.period` (see `goal_writer`).
+        While the control loop runs, they are posted to the loop, which writes them at its next tick,
+        and the error which stopped the loop, if any, is raised.
+        """
+        if self._control_loop is not None:
+            self._control_loop.set_angles(angles)
+        else:
+            self._goal_writer.submit(angles)
+
+
+    @property
+    def goal_writer(self) -> GoalWriter:
+        """
+        Get the command path of the goal angles set with `angles` when the control loop is not running.
+        Its `period` is the minimum time between two writes, and `goal_writer.stats()` gives the number of writes issued and suppressed.
+        It is reset by `open`, `enablePWMMode` and `goal_pwm`, after which the next goals are always written. Call `goal_writer.reset()`
+        after changing the goals, the operating mode or the torque of the motors by any other path.
+        """
+        return self._goal_writer
+
+
+    @property
+    def control_loop(self) -> MotorControlLoop | None:
+        """
+        Get the control loop started with `start_control_loop`, None if it is not running.
+        """
+        return self._control_loop
+
+
+    def start_control_loop(self, period: float=0.002) -> MotorControlLoop:
+        """
+        Drive the motors from a thread running at a fixed period: at each tick, the latest goal angles are written with one sync write
+        (if they changed) and the state of the motors is read with one sync read. Then, setting and getting `angles` never wait for the bus,
+        and the statistics of the loop (overruns, jitter histogram) are given by `control_loop.stats()`.
+        The trajectory running before, if any, is cancelled.
+
+        Args:
+            period: float: The period of the loop in seconds, for instance 0.001 to 0.005 (1000 to 200 Hz).
+
+        Returns:
+            MotorControlLoop: The running loop.
+        """
+        self.stop_control_loop()
+        self.cancel_trajectory()  # a trajectory writing directly to the bus would fight with the loop
+        self._goal_writer.flush()
+        self._control_loop = MotorControlLoop(self._get_bus(), PULSE_CENTER, period)
+        self._control_loop.start()
+        return self._control_loop
+
+
+    def stop_control_loop(self):
+        """
+        Stop the control loop, the goal angles are then written directly again.
+        """
+        if self._control_loop is not None:
+            if self._trajectory is not None and self._trajectory.control_loop is self._control_loop:
+                self.cancel_trajectory()
+            self._control_loop.stop()
+            self._control_loop = None
+            self._goal_writer.reset()
+
+
+    def play_trajectory(self, angles: np.ndarray, timestamps: np.ndarray=None, dt: float=None, period: float=0.005) -> TrajectoryHandle:
+        """
+        Stream a trajectory to the motors from a dedicated thread, interpolating linearly between its samples.
+        The trajectory running before, if any, is cancelled.
+
+        Example:
+            ```python
+            t = np.linspace(0, 2, 201)
+            sweep = np.outer(np.sin(np.pi * t), [0.5, 0.5, 0.5, 0.5])
+            handle = motors.play_trajectory(sweep, dt=0.01)
+            handle.wait()
+            print("Max tracking error (rad):", np.abs(handle.tracking_errors).max())
+            ```
+
+        Args:
+            angles: numpy.ndarray: The (T, 4) goal angles in rad.
+            timestamps: numpy.ndarray: The (T,) strictly increasing times of the samples in seconds. Only the differences with the first one matter.
+            dt: float: The fixed time between two samples in seconds, instead of `timestamps`.
+            period: float: The period in seconds at which the interpolated goals are sent to the motors.
+
+        Returns:
+            TrajectoryHandle: The handle of the running trajectory, with its `progress`, `cancel`, `wait` and the recorded `tracking_errors`.
+
+        Raises:
+            ValueError: If the trajectory is invalid, or has angles which are not finite or out of the range of the goal positions.
+        """
+        angles = np.asarray(angles, dtype=np.float64)
+        times = trajectory_times(angles, timestamps, dt)
+        if angles.shape[1] != len(MOTOR_IDS):
+            raise ValueError(f"The trajectory must have {len(MOTOR_IDS)} columns, got {angles.shape[1]}")
+        angles_to_pulses(angles, PULSE_CENTER)  # raises for the angles which cannot be written, before starting
+        self.cancel_trajectory()
+        self._goal_writer.reset()
+        self._trajectory = TrajectoryHandle(self._get_bus(), PULSE_CENTER, angles, times, period, self._control_loop)
+        self._trajectory.start()
+        return self._trajectory
+
+
+    def cancel_trajectory(self):
+        """
+        Cancel the trajectory started with `play_trajectory`, if it is running.
+        """
+        if self._trajectory is not None:
+            self._trajectory.cancel()
+            self._trajectory = None
+
+
+    def start_recording(self, path: str, capacity: int=360000, period: float=0.005) -> MotorTelemetryRecorder:
+        """
+        Record the state of the motors (see `snapshot`) from a background thread into a preallocated ring of records in a memory mapped `.npy` file.
+        When the ring is full, the oldest records are overwritten, so the footprint of the recording is bounded whatever its duration.
+        The file can be read at any time, even during the recording or after a crash, with `read_recording`.
+
+        Args:
+            path: str: The path of the `.npy` file. An existing file is overwritten.
+            capacity: int: The number of records of the ring (about 200 bytes each). The default keeps 30 minutes at 200 Hz.
+            period: float: The sampling period in seconds.
+
+        Returns:
+            MotorTelemetryRecorder: The running recorder, with its `samples`, `errors` and `overruns` counters.
+        """
+        self._get_bus()
+        self.stop_recording()
+        self._recorder = MotorTelemetryRecorder(self.snapshot, path, len(MOTOR_IDS), capacity, period)
+        self._recorder.start()
+        return self._recorder
+
+
+    def stop_recording(self):
+        """
+        Stop the recording started with `start_recording`.
+        """
+        if self._recorder is not None:
+            self._recorder.stop()
+            self._recorder = None
+
+
+    @staticmethod
+    def read_recording(path: str) -> np.ndarray:
+        """
+        Read a recording made with `start_recording`.
+
+        Returns:
+            numpy.ndarray: The records in chronological order, with a `sequence` number and the fields of `SNAPSHOT_DTYPE`.
+        """
+        return read_motor_recording(path)
+
+
+    def close(self):
+        """
+        Stop the recording, the trajectory and the control loop if they are running, and close the connection to the motors.
+        """
+        self.stop_recording()
+        self.cancel_trajectory()
+        self.stop_control_loop()
+        self._goal_writer.reset()
+        if self._simulation is not None:
+            self._simulation.closePort()
+        else:
+            with self._port_lock:
+                super().close()
+
+
+    def printStatus(self):
+        """
+        Print the status of the motors.
+        """
+        if self._simulation is not None:
+            logger.info(f"Simulated motors on {self.device_name}: angles {self.angles}, velocity {self.velocity}, moving {self.moving}")
+            return
+        with self._port_lock:
+            super().printStatus()
+
+
+    def enablePWMMode(self):
+        """
+        Switch the motors to PWM mode, see `goal_pwm`. Simulated motors keep following their goal positions.
+        """
+        if self._simulation is not None:
+            self._write_entry(TORQUE_ENABLE, 0)
+            self._write_entry(OPERATING_MODE, 16)
+            self._write_entry(TORQUE_ENABLE, 1)
+        else:
+            with self._port_lock:
+                super().enablePWMMode()
+        self._goal_writer.reset()
+
+
+    def snapshot(self, out: np.ndarray=None) -> np.ndarray:
+        """
+        Read the full state of the motors in a single sync read of their control table, instead of one transaction per property.
+        While the control loop runs, this is the state read at its last tick, without waiting for the bus.
+
+        Args:
+            out: numpy.ndarray: Optional array of `SNAPSHOT_DTYPE` with a single element (shape () or (1,)) to write the sample in, for instance a row of a preallocated log.
+
+        Returns:
+            numpy.ndarray: A record of `SNAPSHOT_DTYPE`, `out` if given, with the fields:
+                - timestamp: time.perf_counter() at the middle of the transaction
+                - position: the angles in rad, and position_pulse: the positions in pulses
+                - velocity: the velocities in rad/s
+                - current: the currents in mA, and pwm: the PWM in %
+                - voltage: the input voltages in V, and temperature: the temperatures in °C
+                - moving: True for the motors which are moving
+
+        Raises:
+            RuntimeError: If the motors are not connected.
+            ConnectionError: If the sync read failed.
+        """
+        if self._control_loop is not None:
+            state = self._control_loop.state
+            if out is None:
+                return state
+            for name in SNAPSHOT_DTYPE.names:
+                out[name] = state[name]
+            return out
+        raw, timestamp = self._get_bus().read_state()
+        return decode_state(raw, PULSE_CENTER, timestamp, out)
+
+
+    def _write_goal_angles(self, angles):
+        if self._simulation is not None:
+            self._get_bus().write_goal_pulses(angles_to_pulses(angles, PULSE_CENTER))
+        else:
+            with self._port_lock:
+                DynamixelMotors.angles.fset(self, angles)
+
+
+    def _read_entry(self, entry: tuple) -> list:
+        """
+        Read the raw values of an entry (address, length, default) of the control table of the motors.
+        """
+        address, length, _ = entry
+        raw = np.ascontiguousarray(self._get_bus().sync_read(address, length))
+        return raw.view(f"<i{length}").ravel().tolist()
+
+
+    def _write_entry(self, entry: tuple, values):
+        """
+        Write raw values, one per motor or the same for all, to an entry (address, length, default) of the control table of the motors.
+        """
+        address, length, _ = entry
+        values = np.broadcast_to(np.asarray(values, dtype=f"<i{length}"), (len(MOTOR_IDS),))
+        self._get_bus().sync_write(address, np.ascontiguousarray(values).view(np.uint8).reshape(len(MOTOR_IDS), length))
+
+
+    def _get_bus(self) -> DynamixelBus:
+        """
+        Get the bus of the sync reads and writes, on the serial port opened by DynamixelMotors or on the simulated port.
+        """
+        if not self.is_connected:
+            raise RuntimeError("The motors are not connected")
+        # The port of the open connection is the only internal of DynamixelMotors used by the bus
+        port_handler = self._simulation if self._simulation is not None else self._mg.portHandler
+        if self._bus is None or self._bus.port_handler is not port_handler:
+            self._bus = DynamixelBus(port_handler, MOTOR_IDS, self._port_lock)
+        return self._bus
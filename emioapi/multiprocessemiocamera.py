@@ -1,5 +1,5 @@
 from multiprocessing.managers import ListProxy, DictProxy
-from multiprocessing.sharedctypes import Synchronized
+from multiprocessing.sharedctypes import Synchronized, SynchronizedArray
 from multiprocessing.managers import SyncManager
 import multiprocessing.sharedctypes
 from multiprocessing.synchronize import Lock
@@ -11,9 +11,16 @@ from ctypes import c_wchar_p
 import numpy as np
 
 from emioapi._depthcamera import *
+from emioapi._sharedframebuffer import SharedFrameRingBuffer
 from emioapi._logging_config import logger
 
 
+STATS_PUBLISH_PERIOD = 1.0 # seconds between two publications of the statistics by the camera process
+FRAME_SUBSCRIPTION_PERIOD = 1.0  # seconds after the last read of the HSV or mask frame during which the camera process keeps publishing it
+FRAME_REQUEST_TIMEOUT = 1.0  # maximum time in seconds to wait for the first frame published after a new subscription
+FRAME_INFO_FIELDS = ("frame_number", "hardware_frame_number", "timestamp", "capture_time", "received_time", "completed_time")
+
+
 class MultiprocessEmioCamera:
     """
     A class to interface with the realsense camera on Emio.
@@ -55,16 +62,23 @@ class MultiprocessEmioCamera:
     _manager: SyncManager = None
     _lock_camera: Lock  = None
     _trackers_pos: ListProxy = None
-    _point_cloud: ListProxy = None
     _tracking: Synchronized = None
     _running: Synchronized = None
     _parameter: DictProxy = {"hue_h": 90, "hue_l": 36, "sat_h": 255, "sat_l": 138, "value_h": 255, "value_l": 35, "erosion_size": 0, "area": 100}
-    _hsv_frame: ListProxy = None
-    _mask_frame: ListProxy = None
+    _point_cloud: SharedFrameRingBuffer = None
+    _hsv_frame: SharedFrameRingBuffer = None
+    _mask_frame: SharedFrameRingBuffer = None
+    _hsv_requested: Synchronized = None
+    _mask_requested: Synchronized = None
     _camera_serial: Synchronized = None
+    _collect_stats: Synchronized = None
+    _stats: DictProxy = None
+    _frame_info: SynchronizedArray = None
+    _segmentation_scale: int = 1
+    _color_classifier: str = "hsv"
 
 
-    def __init__(self, camera_serial=None, parameter=None, show=False, tracking=True, compute_point_cloud=False):
+    def __init__(self, camera_serial=None, parameter=None, show=False, tracking=True, compute_point_cloud=False, collect_stats=False, segmentation_scale=1, color_classifier="hsv"):
         """
         Initialize the camera.
         Args:
@@ -73,19 +87,31 @@ class MultiprocessEmioCamera:
             show: bool:  Whether to show the camera HSV and Mask frames or not.
             tracking: bool:  Whether to track objects or not.
             compute_point_cloud: bool: Whether to compute the point cloud or not.
-        """
+            collect_stats: bool: Whether to time the stages of the processing of the frames, see `stats`.
+            segmentation_scale: int: 1 (default), 2 or 4. Above 1, the markers are searched in frames downscaled by this factor and refined at full resolution around each of them, see [EmioCamera](#EmioCamera).
+            color_classifier: str: "hsv" (default) or "lut" to classify the colors with a lookup table instead of converting the frames to HSV, see [EmioCamera](#EmioCamera).
+        """
+        if segmentation_scale not in [1, 2, 4]:
+            raise ValueError("segmentation_scale can only be 1, 2 or 4")
+        if color_classifier not in ["hsv", "lut"]:
+            raise ValueError("color_classifier can only be 'hsv' or 'lut'")
+        self._segmentation_scale = segmentation_scale
+        self._color_classifier = color_classifier
         multiprocessing.freeze_support()
         self._manager = multiprocessing.Manager()
         self._lock_camera = multiprocessing.Lock()
         self._trackers_pos = self._manager.list()
-        self._point_cloud = self._manager.list()
-        self._hsv_frame = self._manager.list()
-        self._mask_frame = self._manager.list()
         self._camera_serial = multiprocessing.Value(c_wchar_p, None)
         self._running = multiprocessing.Value('b', False)
         self._tracking = multiprocessing.Value('b', tracking)
         self._show = multiprocessing.Value('b', show)
         self._compute_point_cloud = multiprocessing.Value('b', compute_point_cloud)
+        self._hsv_requested = multiprocessing.Value('d', 0.0) # time.time() of the last read of the HSV frame
+        self._mask_requested = multiprocessing.Value('d', 0.0) # time.time() of the last read of the mask frame
+        self._collect_stats = multiprocessing.Value('b', collect_stats)
+        self._stats = self._manager.dict()
+        self._frame_info = multiprocessing.Array('d', len(FRAME_INFO_FIELDS)) # written with the trackers under _lock_camera
+        self._read_info = {} # frame number and timestamp of the frames last read from the shared memory, see `read_info`
         self._parameter = self._manager.dict()
         if parameter is not None:
             self._parameter.update(parameter)
@@ -238,43 +264,158 @@ class MultiprocessEmioCamera:
     def point_cloud(self) -> np.ndarray:
         """
         Get the point cloud data.
+        The array is a read-only view on the shared memory written by the camera process, it is valid until the camera process publishes two more point clouds.
+        Its camera frame is given by `read_info("point_cloud")`.
         Returns:
             The point cloud data as a numpy array.
         """
-        with self._lock_camera:
-            if self._compute_point_cloud:
-                return self._point_cloud[0]
-            else:
-                return np.array([])
+        if self._compute_point_cloud.value and self._point_cloud is not None:
+            point_cloud = self._read_latest("point_cloud", self._point_cloud)
+            if point_cloud is not None:
+                return point_cloud
+        return np.array([])
 
     
     @property
     def hsv_frame(self) -> np.ndarray | None:
         """
         Get the HSV frame.
+        The camera process only publishes the HSV frame while it is read: after a read, it publishes every frame for `FRAME_SUBSCRIPTION_PERIOD` seconds.
+        The first read, or a read after a longer pause, waits (up to `FRAME_REQUEST_TIMEOUT` seconds) for a frame published after it.
+        The array is a read-only view on the shared memory written by the camera process, it is valid until the camera process publishes two more frames.
         Returns:
-            The HSV frame as a numpy array.
+            The HSV frame as a numpy array, None if no frame was published.
         """
-        with self._lock_camera:
-            if self._hsv_frame:
-                return self._hsv_frame[0]
-            else:
-                return None
+        return self._read_subscribed_frame("hsv_frame", self._hsv_frame, self._hsv_requested)
     
 
     @property
     def mask_frame(self) -> np.ndarray | None:
         """
         Get the mask frame.
+        The camera process only publishes the mask frame while it is read, as the HSV frame (see `hsv_frame`).
+        The array is a read-only view on the shared memory written by the camera process, it is valid until the camera process publishes two more frames.
         Returns:
-            The mask frame as a numpy array.
+            The mask frame as a numpy array, None if no frame was published.
         """
-        with self._lock_camera:
-            if self._mask_frame:
-                return self._mask_frame[0]
-            else:
+        return self._read_subscribed_frame("mask_frame", self._mask_frame, self._mask_requested)
+
+
+    def read_info(self, name: str) -> dict | None:
+        """
+        Get the camera frame of the last `point_cloud`, `hsv_frame` or `mask_frame` read, to match it with `frame_info`.
+
+        Args:
+            name: str: "point_cloud", "hsv_frame" or "mask_frame".
+
+        Returns:
+            dict: The `sequence` number of the publication, and the `hardware_frame_number` and `timestamp` of its camera frame.
+            None if nothing was read.
+        """
+        if name not in ["point_cloud", "hsv_frame", "mask_frame"]:
+            raise ValueError(f"Unknown frame {name}, expected point_cloud, hsv_frame or mask_frame")
+        return self._read_info.get(name)
+
+
+    def _read_latest(self, name: str, buffer: SharedFrameRingBuffer) -> np.ndarray | None:
+        """
+        Read the latest publication of a buffer, and keep the camera frame it belongs to for `read_info`.
+        """
+        while True:
+            sequence, frame = buffer.latest()
+            if frame is None:
+                return None
+            info = buffer.info(sequence)
+            if info is not None: # else overwritten since it was read, the next one is read
+                self._read_info[name] = {"sequence": sequence, "hardware_frame_number": info[0], "timestamp": info[1]}
+                return frame
+
+
+    def _read_subscribed_frame(self, name: str, buffer: SharedFrameRingBuffer, requested: Synchronized) -> np.ndarray | None:
+        """
+        Renew the subscription to a frame published on request, and read its latest publication.
+        When the subscription had expired, wait for a frame published after the renewal, so the frame is never older than the request.
+        """
+        if buffer is None:
+            return None
+        now = time.time()
+        subscribed = now - requested.value < FRAME_SUBSCRIPTION_PERIOD
+        sequence = buffer.sequence
+        requested.value = now
+        if not subscribed:
+            deadline = time.perf_counter() + FRAME_REQUEST_TIMEOUT
+            while buffer.sequence == sequence and self.is_running and time.perf_counter() < deadline:
+                time.sleep(0.001)
+            if buffer.sequence == sequence:
                 return None
-            
+        return self._read_latest(name, buffer)
+
+
+    @property
+    def collect_stats(self) -> bool:
+        """
+        Get whether the stages of the processing of the frames are timed.
+        Returns:
+            bool: True if the statistics are collected, else False.
+        """
+        return self._collect_stats.value
+
+
+    @collect_stats.setter
+    def collect_stats(self, value: bool):
+        """
+        Enable or disable the timing of the stages of the processing of the frames.
+        Args:
+            value: bool: True to collect the statistics.
+        """
+        self._collect_stats.value = value
+
+
+    @property
+    def stats(self) -> dict:
+        """
+        Get the rolling statistics of the processing of the frames, collected when `collect_stats` is enabled.
+        The camera process publishes them every second. See [EmioCamera.stats](#EmioCamera) for the content of the dict.
+        Returns:
+            dict: The statistics, empty until the camera process publishes them.
+        """
+        return dict(self._stats)
+
+
+    @property
+    def frame_info(self) -> dict:
+        """
+        Get the timing of the last frame processed by the camera process, with its trackers positions read at the same time.
+        The times are in seconds of `time.perf_counter`, which is shared by the processes. See [EmioCamera](#EmioCamera) for their meaning.
+        The point cloud, HSV and mask frames read belong to this frame when their `read_info` has the same `hardware_frame_number` and `timestamp`.
+        Returns:
+            dict: `frame_number`, `hardware_frame_number`, `timestamp`, `capture_time`, `received_time`, `completed_time`, `latency` (from the capture to the end of the processing)
+            and `trackers_pos`. The frame numbers are 0 until a frame is processed.
+        """
+        with self._lock_camera:
+            info = dict(zip(FRAME_INFO_FIELDS, self._frame_info[:]))
+            info["trackers_pos"] = list(self._trackers_pos) if self._tracking.value else []
+        info["frame_number"] = int(info["frame_number"])
+        info["hardware_frame_number"] = int(info["hardware_frame_number"])
+        info["latency"] = info["completed_time"] - info["capture_time"]
+        return info
+
+
+    @property
+    def frame_number(self) -> int:
+        """
+        Get the number of the last frame processed by the camera process, starting at 1. 0 if no frame was processed yet.
+        """
+        return int(self._frame_info[0])
+
+
+    @property
+    def latency(self) -> float:
+        """
+        Get the time in seconds from the capture of the last processed frame to the end of its processing.
+        """
+        return self.frame_info["latency"]
+
 
 
     ##########################
@@ -315,6 +456,7 @@ class MultiprocessEmioCamera:
         if camera_serial is not None:
             self._camera_serial.value = camera_serial
 
+        self._create_frame_buffers()
 
         self._camera_process = Process(target=self._processCamera, args=(self._running, 
                                                                             self._tracking, 
@@ -325,7 +467,14 @@ class MultiprocessEmioCamera:
                                                                             self._camera_serial,
                                                                             self._parameter,
                                                                             self._hsv_frame,
-                                                                            self._mask_frame))
+                                                                            self._mask_frame,
+                                                                            self._hsv_requested,
+                                                                            self._mask_requested,
+                                                                            self._collect_stats,
+                                                                            self._stats,
+                                                                            self._segmentation_scale,
+                                                                            self._color_classifier,
+                                                                            self._frame_info))
         self._camera_process.start()
 
         timeout = time.time() + 5
@@ -341,9 +490,36 @@ class MultiprocessEmioCamera:
         return True
 
 
+    def _create_frame_buffers(self):
+        """
+        Allocate the shared memory ring buffers used to publish the frames and the point cloud, sized from the stream profile.
+        """
+        self._release_frame_buffers()
+        height, width = DepthCamera.height, DepthCamera.width
+        self._hsv_frame = SharedFrameRingBuffer((height, width, 3), np.uint8)
+        self._mask_frame = SharedFrameRingBuffer((height, width, 3), np.uint8)
+        self._point_cloud = SharedFrameRingBuffer((height * width, 3), np.float32)
+
+
+    def _release_frame_buffers(self):
+        """
+        Release the shared memory ring buffers.
+        """
+        for buffer in [self._hsv_frame, self._mask_frame, self._point_cloud]:
+            if buffer is not None:
+                buffer.close()
+        self._hsv_frame = None
+        self._mask_frame = None
+        self._point_cloud = None
+
+
     def _processCamera(self, running: Synchronized, tracking: Synchronized, show: Synchronized, 
                        compute_point_cloud: Synchronized, trackers_pos: ListProxy, 
-                       point_cloud: ListProxy, camera_serial: Synchronized=None, parameter: DictProxy=None, hsv_frame: ListProxy=None, mask_frame: ListProxy=None):
+                       point_cloud: SharedFrameRingBuffer, camera_serial: Synchronized=None, parameter: DictProxy=None,
+                       hsv_frame: SharedFrameRingBuffer=None, mask_frame: SharedFrameRingBuffer=None,
+                       hsv_requested: Synchronized=None, mask_requested: Synchronized=None,
+                       collect_stats: Synchronized=None, stats: DictProxy=None, segmentation_scale: int=1,
+                       color_classifier: str="hsv", frame_info: SynchronizedArray=None):
         """
         Process to handle the camera.
         This function runs in a separate process and updates the camera frames.
@@ -352,43 +528,64 @@ class MultiprocessEmioCamera:
             tracking: bool: A boolean indicating whether to track objects or not.
             show: bool: A boolean indicating whether to show the camera frames or not.
             trackers_pos: list: A list to store the positions of the trackers.
-            point_cloud: list: A list to store the point cloud data.
+            point_cloud: SharedFrameRingBuffer: The shared memory buffer to publish the point cloud data.
             parameter: dict: The camera parameters.
-            hsv_frame: list: A list to store the HSV frame.
-            mask_frame: list: A list to store the mask frame.
+            hsv_frame: SharedFrameRingBuffer: The shared memory buffer to publish the HSV frame.
+            mask_frame: SharedFrameRingBuffer: The shared memory buffer to publish the mask frame.
+            hsv_requested: float: The time.time() of the last read of the HSV frame by the parent process.
+            mask_requested: float: The time.time() of the last read of the mask frame by the parent process.
+            collect_stats: bool: Whether to time the stages of the processing of the frames.
+            stats: dict: The dict where the statistics are published.
+            segmentation_scale: int: The downscaling factor of the segmentation.
+            color_classifier: str: The classifier of the colors of the markers, "hsv" or "lut".
+            frame_info: Array: The shared array where the FRAME_INFO_FIELDS of the last processed frame are published.
         """
 
         logger.debug("Starting camera {} process with show: {}, tracking: {}, compute_point_cloud: {}".format(camera_serial.value, show.value, tracking.value, compute_point_cloud.value))
-        camera = depthcamera.DepthCamera(camera_serial=camera_serial.value, parameter=parameter, compute_point_cloud=compute_point_cloud.value, show_video_feed=show.value, tracking=tracking.value)
+        camera = DepthCamera(camera_serial=camera_serial.value, parameter=parameter, compute_point_cloud=compute_point_cloud.value, show_video_feed=show.value, tracking=tracking.value, segmentation_scale=segmentation_scale, color_classifier=color_classifier)
         parameter.update(camera.parameter)
+        camera.open()
         # camera_serial.value = "Test1"
 
         running.value = True
+        next_stats_time = time.perf_counter() + STATS_PUBLISH_PERIOD
         while running.value:
-            with self._lock_camera:
-                camera.compute_point_cloud = compute_point_cloud.value
-                camera.tracking = tracking.value
-
-                camera.update()
-
-                show.value = camera.show_video_feed
-                
-                del hsv_frame[:]
-                hsv_frame.append(camera.hsvFrame)
-                
-                del mask_frame[:]
-                mask_frame.append(camera.maskFrame)
-
-                if tracking:
-                    del trackers_pos[:]
-                    trackers_pos.extend(camera.trackers_pos)
-
-                if compute_point_cloud:
-                    del point_cloud[:]
-                    point_cloud.append(camera.point_cloud)
-                
+            camera.compute_point_cloud = compute_point_cloud.value
+            camera.tracking = tracking.value
+            camera.timer.enabled = collect_stats.value
+
+            updated = camera.update()
+
+            show.value = camera.show_video_feed
+
+            # The frames are only published while the parent process reads them, with the number and timestamp of their camera frame
+            result = camera.result() if updated else None
+            if updated and camera.frame is not None:
+                now = time.time()
+                if now - hsv_requested.value < FRAME_SUBSCRIPTION_PERIOD:
+                    hsv_frame.write(result.hsv_frame, result.hardware_frame_number, result.timestamp)
+                if now - mask_requested.value < FRAME_SUBSCRIPTION_PERIOD:
+                    mask_frame.write(result.mask_frame, result.hardware_frame_number, result.timestamp)
+
+            # A point cloud is only published with its frame, so a new sequence number is always a new point cloud
+            if updated and camera.compute_point_cloud and camera.point_cloud is not None:
+                point_cloud.write(camera.point_cloud, result.hardware_frame_number, result.timestamp)
+
+            if camera.tracking or updated:
+                with self._lock_camera:
+                    if camera.tracking:
+                        del trackers_pos[:]
+                        trackers_pos.extend(camera.trackers_pos)
+                    if updated:
+                        frame_info[:] = [getattr(result, field) for field in FRAME_INFO_FIELDS]
+
+            if camera.timer.enabled and time.perf_counter() >= next_stats_time:
+                next_stats_time = time.perf_counter() + STATS_PUBLISH_PERIOD
+                stats.update(camera.timer.stats())
 
         camera.close()
+        for buffer in [hsv_frame, mask_frame, point_cloud]:
+            buffer.close()
         running.value = False
 
         
@@ -397,5 +594,6 @@ class MultiprocessEmioCamera:
         Close the camera and terminate the process. Sets the running status to False.
         """
         self._running.value = False
-        if self._camera_process.is_alive():
+        if self._camera_process is not None and self._camera_process.is_alive():
             self._camera_process.terminate()
+        self._release_frame_buffers()
@@ -0,0 +1,65 @@
+import numpy as np
+import cv2 as cv
+import pyrealsense2 as rs
+import pytest
+
+from emioapi._camerarecording import CameraRecorder
+
+
+FRAME_COUNT = 10
+MARKER_COUNT = 4
+
+
+def _synthetic_frames(index: int):
+    """Dark frame with green markers at 250 mm in front of a background at 800 mm."""
+    color = np.full((480, 640, 3), 40, dtype=np.uint8)
+    depth = np.full((480, 640), 800, dtype=np.uint16)
+    for k in range(MARKER_COUNT):
+        center = (150 + k * 100, 240 + index)
+        cv.circle(color, center, 10, (60, 200, 60), -1)
+        cv.circle(depth, center, 10, 250, -1)
+    return color, depth
+
+
+def _synthetic_intrinsics() -> rs.intrinsics:
+    """Intrinsics of a 640x480 camera without distortion."""
+    intrinsics = rs.intrinsics()
+    intrinsics.width, intrinsics.height = 640, 480
+    intrinsics.ppx, intrinsics.ppy = 320.0, 240.0
+    intrinsics.fx, intrinsics.fy = 600.0, 600.0
+    intrinsics.model = rs.distortion.brown_conrady
+    intrinsics.coeffs = [0.0] * 5
+    return intrinsics
+
+
+@pytest.fixture
+def frame_count() -> int:
+    """The number of frames of `recording`."""
+    return FRAME_COUNT
+
+
+@pytest.fixture
+def marker_count() -> int:
+    """The number of markers of the synthetic frames."""
+    return MARKER_COUNT
+
+
+@pytest.fixture
+def synthetic_frames():
+    """The function giving the color and depth frames of index `index` of `recording`."""
+    return _synthetic_frames
+
+
+@pytest.fixture
+def synthetic_intrinsics() -> rs.intrinsics:
+    """The intrinsics of the camera of `recording`."""
+    return _synthetic_intrinsics()
+
+
+@pytest.fixture
+def recording(tmp_path):
+    recorder = CameraRecorder(tmp_path, _synthetic_intrinsics(), 0.001, 30, "recorded")
+    for i in range(FRAME_COUNT):
+        recorder.write(*_synthetic_frames(i), timestamp=i / 30)
+    recorder.close()
+    return tmp_path
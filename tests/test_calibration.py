@@ -0,0 +1,61 @@
+import csv
+
+import numpy as np
+import cv2 as cv
+
+from emioapi._positionestimation import CalibrationSession, PositionEstimation, ARUCO_MARKER_ID, COUNT_POINTS
+
+
+def calibration_frames(shift: int=0):
+    """White frame with the Emio Aruco marker, and a flat depth image at 250 mm."""
+    marker = cv.aruco.generateImageMarker(cv.aruco.getPredefinedDictionary(cv.aruco.DICT_ARUCO_ORIGINAL), ARUCO_MARKER_ID, 120)
+    frame = np.full((480, 640, 3), 255, dtype=np.uint8)
+    frame[180 + shift:300 + shift, 260:380] = marker[:, :, None]
+    depth = np.full((480, 640), 250, dtype=np.uint16)
+    return frame, depth
+
+
+def test_calibration_session_rejects_outliers(tmp_path):
+    session = CalibrationSession(frames=20)
+    frame, depth = calibration_frames()
+    for _ in range(18):
+        assert session.add_frame(frame.copy(), depth)
+    shifted, _ = calibration_frames(shift=40)
+    for _ in range(2):
+        assert session.add_frame(shifted, depth)
+    assert session.complete
+    assert not session.add_frame(frame, depth)
+    assert np.count_nonzero(session.inliers()) == 18
+
+    filename = tmp_path.joinpath("camera_2d_points.csv")
+    assert session.save(filename)
+    with open(filename) as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ['X', 'Y', 'Depth', 'id']
+    assert len(rows) == COUNT_POINTS + 1
+    center = rows[-1]
+    assert abs(int(center[0]) - 320) <= 1 and abs(int(center[1]) - 240) <= 1
+    assert float(center[2]) == 250
+    assert list(tmp_path.iterdir()) == [filename]
+
+
+def test_calibration_session_skips_missing_marker_and_depth():
+    session = CalibrationSession(frames=5)
+    frame, depth = calibration_frames()
+    assert not session.add_frame(np.full_like(frame, 255), depth)
+    assert not session.add_frame(frame, np.zeros_like(depth))
+    assert session.count == 0
+    assert session.result() is None
+
+
+def test_point_cloud_drops_points_without_depth():
+    estimator = PositionEstimation(None)
+    estimator.camera_to_simulation = np.eye(4)
+    estimator.camera_to_simulation[:3, 3] = [10.0, 20.0, 30.0]
+    points = np.array([[0.0, 0.0, 0.0], [0.01, 0.02, 0.3]], dtype=np.float32)
+    transformed = estimator.camera_points_to_simulation(points, scale=1000.0)
+    assert np.isnan(transformed[0]).all()
+    assert np.allclose(transformed[1], [20.0, 40.0, 330.0])
+    # The camera origin is inside the box, the invalid point is dropped anyway
+    cropped = estimator.camera_points_to_simulation(points, scale=1000.0, box=((-100, -100, -100), (500, 500, 500)))
+    assert np.allclose(cropped, [[20.0, 40.0, 330.0]])
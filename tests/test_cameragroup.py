@@ -0,0 +1,48 @@
+import pytest
+
+from emioapi import CameraGroup, EmioCamera
+from emioapi._camerarecording import CameraRecorder, CameraReplay
+from emioapi._depthcamera import DEFAULT_CAMERA_PARAMS
+
+
+def make_group(paths, **kwargs):
+    cameras = [EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, background_capture=True,
+                          replay=str(path), replay_realtime=True) for path in paths]
+    return CameraGroup(cameras, **kwargs)
+
+
+@pytest.fixture
+def shifted_recording(tmp_path, recording, frame_count, synthetic_frames):
+    """The frames of `recording`, captured 5 ms later by another camera."""
+    path = tmp_path.joinpath("shifted")
+    replay = CameraReplay(recording)
+    recorder = CameraRecorder(path, replay.intrinsics, replay.depth_scale, replay.fps, "shifted")
+    for i in range(frame_count):
+        recorder.write(*synthetic_frames(i), timestamp=i / 30 + 0.005)
+    recorder.close()
+    return path
+
+
+@pytest.mark.parametrize("policy", ["latest", "strict"])
+def test_group_bundles(recording, shifted_recording, policy, frame_count, marker_count):
+    group = make_group([recording, shifted_recording], policy=policy, tolerance=0.01)
+    assert group.open()
+    bundles = []
+    while (bundle := group.update(timeout=1.0)) is not None:
+        assert len(bundle) == 2
+        assert all(len(result.trackers_pos) == marker_count for result in bundle)
+        if policy == "strict":
+            assert group.skew <= 0.01
+        bundles.append([result.frame_number for result in bundle])
+    group.close()
+
+    assert len(bundles) > frame_count // 2
+    # Each bundle has a new frame of every camera
+    assert all(all(new > old for new, old in zip(b, a)) for a, b in zip(bundles, bundles[1:]))
+
+
+def test_group_requires_background_capture(recording):
+    with pytest.raises(ValueError):
+        CameraGroup([EmioCamera(replay=str(recording))])
+    with pytest.raises(ValueError):
+        make_group([recording], policy="closest")
@@ -0,0 +1,210 @@
+import time
+import tracemalloc
+
+import numpy as np
+import cv2 as cv
+import pytest
+
+from emioapi import EmioCamera
+from emioapi._camerarecording import CameraRecorder, CameraReplay
+from emioapi._capturethread import MAX_CONSECUTIVE_ERRORS
+from emioapi._depthcamera import DepthCamera, DEFAULT_CAMERA_PARAMS
+
+
+def test_replay_reads_recorded_frames(recording, frame_count, synthetic_frames):
+    replay = CameraReplay(recording)
+    assert replay.count == frame_count
+    for i in range(frame_count):
+        ret, color, depth, _ = replay.get_frame()
+        expected_color, expected_depth = synthetic_frames(i)
+        assert ret
+        assert np.array_equal(color, expected_color)
+        assert np.array_equal(depth, expected_depth)
+    assert replay.get_frame()[0] is False
+    assert replay.finished
+
+
+def test_replay_truncated_recording(recording, frame_count):
+    with open(recording.joinpath("color.bin"), "r+b") as file:
+        file.truncate(file.seek(0, 2) - 1000)
+    assert CameraReplay(recording).count == frame_count - 1
+
+
+def test_replay_through_emiocamera(recording, frame_count, marker_count):
+    camera = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, compute_point_cloud=True, replay=str(recording))
+    assert camera.open()
+    assert camera.camera_serial == "recorded"
+
+    frames = 0
+    while camera.is_running:
+        camera.update()
+        if camera.is_running:
+            frames += 1
+            assert len(camera.trackers_pos) == marker_count
+            assert camera.point_cloud.shape == (480 * 640, 3)
+    assert frames == frame_count
+    camera.close()
+
+
+def test_replay_realtime_pacing(recording, frame_count):
+    camera = EmioCamera(replay=str(recording), replay_realtime=True)
+    assert camera.open()
+    start = time.perf_counter()
+    while camera.is_running:
+        camera.update()
+    assert time.perf_counter() - start >= (frame_count - 1) / 30
+    camera.close()
+
+
+def test_stats_collected_on_replay(recording, frame_count):
+    camera = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, compute_point_cloud=True, replay=str(recording), collect_stats=True)
+    assert camera.open()
+    while camera.is_running:
+        camera.update()
+    stats = camera.stats
+    assert stats["frames"] == frame_count
+    assert stats["zero_marker_frames"] == 0
+    assert stats["dropped_frames"] == 0
+    for stage in ["wait", "hsv", "threshold", "morphology", "contours", "depth", "deprojection", "point_cloud"]:
+        assert stats["stages"][stage]["count"] >= frame_count
+        assert 0 <= stats["stages"][stage]["p50_ms"] <= stats["stages"][stage]["p99_ms"]
+    camera.close()
+
+
+def test_roi_segmentation_matches_full_frame(recording, marker_count):
+    full = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, replay=str(recording))
+    cropped = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, replay=str(recording))
+    assert full.open() and cropped.open()
+    cropped.roi = (100, 200, 300, 100) # Contains the first 3 markers
+
+    full.update()
+    cropped.update()
+    assert len(cropped.trackers_pos) == marker_count - 1
+    assert sorted(cropped.trackers_pos) == sorted(full.trackers_pos)[:marker_count - 1]
+    assert not cropped.mask_frame[:200].any()
+
+    with pytest.raises(ValueError):
+        cropped.roi = (600, 0, 100, 100)
+    full.close()
+    cropped.close()
+
+
+@pytest.mark.parametrize("scale, classifier", [(2, "hsv"), (4, "hsv"), (1, "lut"), (2, "lut")])
+def test_fast_segmentation_matches_full_resolution(recording, scale, classifier):
+    full = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, replay=str(recording))
+    pyramid = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, replay=str(recording),
+                         segmentation_scale=scale, color_classifier=classifier)
+    assert full.open() and pyramid.open()
+    while full.is_running and pyramid.is_running:
+        full.update()
+        pyramid.update()
+        assert np.allclose(sorted(pyramid.trackers_pos), sorted(full.trackers_pos))
+    full.close()
+    pyramid.close()
+
+
+@pytest.mark.parametrize("options", [{}, {"segmentation_scale": 2}, {"color_classifier": "lut"}, {"compute_point_cloud": True}])
+def test_update_steady_state_allocations(recording, options, marker_count):
+    camera = DepthCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), tracking=True, replay_path=str(recording), **options)
+    camera.open()
+    # The same frames are processed again and again, so that only the allocations of the processing are measured
+    frames = camera.replay.get_frame()
+    camera.get_frame = lambda: frames
+    for _ in range(5):
+        camera.update(refresh_windows=False)
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for _ in range(20):
+            camera.update(refresh_windows=False)
+        peak = tracemalloc.get_traced_memory()[1] - start
+    finally:
+        tracemalloc.stop()
+    assert len(camera.trackers_pos) == marker_count
+    # A single 640x480 mask is 300 kB, only the contours and marker positions are allocated per frame
+    assert peak < 64 * 1024
+    camera.close()
+
+
+def test_overlay_does_not_modify_frames(recording, marker_count, synthetic_frames):
+    camera = DepthCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), tracking=True, replay_path=str(recording))
+    camera.open()
+    camera.update(refresh_windows=False)
+    result = camera.result()
+    assert sorted((marker.x, marker.y) for marker in result.markers) == [(150 + k * 100, 240) for k in range(marker_count)]
+    assert [list(marker.position) for marker in result.markers] == result.trackers_pos
+
+    annotated = camera.overlay.draw("frame", result.frame, result.markers)
+    assert np.array_equal(result.frame, synthetic_frames(0)[0])
+    assert not np.array_equal(annotated, result.frame)
+    assert camera.overlay.due(now=0.0) and not camera.overlay.due(now=0.01) and camera.overlay.due(now=0.04)
+    camera.close()
+
+
+def test_results_timing(recording, frame_count):
+    camera = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, replay=str(recording))
+    assert camera.open()
+    for i in range(frame_count):
+        camera.update()
+        result = camera.result
+        assert camera.hardware_frame_number == i + 1
+        assert camera.timestamp == pytest.approx(i / 30)
+        assert result.capture_time <= result.received_time <= result.completed_time
+        assert camera.latency >= result.processing_time >= 0
+    camera.close()
+
+
+def test_capture_thread_error_is_raised(recording):
+    camera = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, replay=str(recording), background_capture=True)
+    calls = []
+
+    def failing_update(refresh_windows=True):
+        calls.append(refresh_windows)
+        raise RuntimeError("Frame didn't arrive")
+
+    camera._camera.update = failing_update
+    assert camera.open()
+    with pytest.raises(RuntimeError):
+        camera.wait_for_next(timeout=5.0)
+    assert len(calls) == MAX_CONSECUTIVE_ERRORS
+    assert not camera.is_running
+    camera.close()
+
+
+def test_frame_without_markers_clears_detections(tmp_path, marker_count, synthetic_frames, synthetic_intrinsics):
+    recorder = CameraRecorder(tmp_path, synthetic_intrinsics, 0.001, 30, "recorded")
+    recorder.write(*synthetic_frames(0), timestamp=0.0)
+    recorder.write(np.full((480, 640, 3), 40, dtype=np.uint8), np.full((480, 640), 800, dtype=np.uint16), timestamp=1 / 30)
+    recorder.close()
+
+    camera = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, replay=str(tmp_path))
+    assert camera.open()
+    camera.update()
+    assert len(camera.trackers_pos) == marker_count
+    camera.update()
+    assert camera.trackers_pos == []
+    assert camera.result.markers == []
+    camera.close()
+
+
+def test_fast_segmentation_separates_close_markers(tmp_path, synthetic_intrinsics):
+    color = np.full((480, 640, 3), 40, dtype=np.uint8)
+    depth = np.full((480, 640), 800, dtype=np.uint16)
+    for center in [(300, 240), (322, 240)]:
+        cv.circle(color, center, 10, (60, 200, 60), -1)
+        cv.circle(depth, center, 10, 250, -1)
+    recorder = CameraRecorder(tmp_path, synthetic_intrinsics, 0.001, 30, "recorded")
+    recorder.write(color, depth, timestamp=0.0)
+    recorder.close()
+
+    full = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, replay=str(tmp_path))
+    pyramid = EmioCamera(parameter=dict(DEFAULT_CAMERA_PARAMS), track_markers=True, replay=str(tmp_path), segmentation_scale=4)
+    assert full.open() and pyramid.open()
+    full.update()
+    pyramid.update()
+    assert len(full.trackers_pos) == 2
+    assert np.allclose(sorted(pyramid.trackers_pos), sorted(full.trackers_pos))
+    full.close()
+    pyramid.close()
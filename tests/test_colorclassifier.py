@@ -0,0 +1,35 @@
+import numpy as np
+import cv2 as cv
+
+from emioapi._colorclassifier import HSVLookupClassifier
+
+
+LOWER = (36, 138, 35)
+UPPER = (90, 255, 255)
+
+
+def test_lookup_classifier_matches_hsv_segmentation():
+    frame = np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    classifier = HSVLookupClassifier()
+    assert classifier.update(LOWER, UPPER)
+    assert not classifier.update(LOWER, UPPER)
+
+    expected = cv.inRange(cv.cvtColor(frame, cv.COLOR_BGR2HSV), np.array(LOWER), np.array(UPPER))
+    mask = classifier.classify(frame)
+    assert mask.dtype == np.uint8 and mask.shape == frame.shape[:2]
+    # Only the colors close to the bounds can be classified differently, because of the quantization
+    assert np.mean(mask != expected) < 0.02
+
+    # Uniform marker and background colors are far from the bounds
+    assert classifier.classify(np.full((4, 4, 3), (60, 200, 60), dtype=np.uint8)).all()
+    assert not classifier.classify(np.full((4, 4, 3), 40, dtype=np.uint8)).any()
+
+
+def test_lookup_classifier_writes_in_view():
+    frame = np.full((40, 40, 3), (60, 200, 60), dtype=np.uint8)
+    classifier = HSVLookupClassifier()
+    classifier.update(LOWER, UPPER)
+    mask = np.zeros((40, 40), dtype=np.uint8)
+    classifier.classify(frame[10:20, 5:30], dst=mask[10:20, 5:30])
+    assert mask[10:20, 5:30].all()
+    assert np.count_nonzero(mask) == 10 * 25
@@ -0,0 +1,84 @@
+import threading
+
+from emioapi._depthcamera import DepthCamera
+from emioapi._displaythread import DisplayThread, FrameMailbox
+
+
+def test_mailbox_keeps_latest_and_counts_dropped():
+    mailbox = FrameMailbox()
+    assert mailbox.take() is None
+    for i in range(5):
+        mailbox.post(i)
+    assert mailbox.take() == 4
+    assert mailbox.take() is None
+    assert (mailbox.posted, mailbox.dropped) == (5, 4)
+
+
+def test_mailbox_concurrent_posts():
+    mailbox = FrameMailbox()
+    taken = []
+
+    def reader():
+        while len(taken) == 0 or taken[-1] != 999:
+            item = mailbox.take()
+            if item is not None:
+                taken.append(item)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for i in range(1000):
+        mailbox.post(i)
+    thread.join(5)
+    assert taken == sorted(taken) and taken[-1] == 999
+    assert mailbox.posted - mailbox.dropped == len(taken)
+
+
+class FakeTkObject:
+    """
+    Records the threads which destroy and finalize it, instead of a Tk object.
+    """
+
+    def __init__(self, threads: dict):
+        self.running = True
+        self._threads = threads
+
+    def update(self):
+        pass
+
+    def destroy(self):
+        self._threads.setdefault("destroy", set()).add(threading.get_ident())
+
+    def closed(self):
+        self.destroy()
+        self.running = False
+
+    def __del__(self):
+        self._threads.setdefault("del", set()).add(threading.get_ident())
+
+
+class FakeCamera:
+    show_video_feed = True
+    maskWindow = frameWindow = hsvWindow = depthWindow = rootWindow = None
+    destroy_feed_windows = DepthCamera.destroy_feed_windows
+
+    def __init__(self):
+        self.threads = {}
+
+    def create_feed_windows(self):
+        self.rootWindow = FakeTkObject(self.threads)
+        self.maskWindow, self.frameWindow, self.hsvWindow, self.depthWindow = (FakeTkObject(self.threads) for _ in range(4))
+
+    def render_windows(self, result):
+        pass
+
+
+def test_display_thread_releases_the_windows():
+    camera = FakeCamera()
+    display = DisplayThread(camera)
+    display.start()
+    display.post(object())
+    display.stop()
+    assert not display.is_alive()
+    assert camera.rootWindow is None and camera.maskWindow is None and camera.depthWindow is None
+    # The windows are destroyed and garbage collected in the display thread only
+    assert camera.threads == {"destroy": {display.ident}, "del": {display.ident}}
@@ -1,5 +1,7 @@
 import time
 import logging
+
+import numpy as np
 import pytest
 from emioapi import *
 
@@ -8,40 +10,49 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-emio = EmioAPI()
+emio = EmioAPI(simulated_motors=True)
+
 
-def test_connection():
-    """Setup function to be called before each test."""
+@pytest.fixture
+def connectedMotors():
+    """Connect to the motors before the test, and close the connection after it."""
+    assert emio.motors.open(), "Failed to connect to the motors."
+    yield emio.motors
+    emio.motors.close()
 
-    emio.connectToMotors()
 
-    assert EmioAPI.listUnusedEmioDevices() == EmioAPI.listEmioDevices-EmioAPI.listUsedEmioDevices(), "Unused devices found."
+def test_connection(connectedMotors):
+    assert emio.device_name == emio.motors.simulation.getPortName()
+    assert set(EmioAPI.listUnusedEmioDevices()) == set(EmioAPI.listEmioDevices()) - set(EmioAPI.listUsedEmioDevices()), "Unused devices found."
 
-def test_main(setupBefore):
 
-    initial_pos_pulse = [0] * 4
-    logger.info(f"Initial position in pulses: {initial_pos_pulse}")
+def test_main(connectedMotors):
+    motors = connectedMotors
+
+    initial_pos = [0] * 4
+    logger.info(f"Initial position in rad: {initial_pos}")
     emio.printStatus()
 
-    emio.max_velocity = [1000] * 4
+    motors.max_velocity = [1000] * 4
     time.sleep(1)
     new_pos = [3.14/8] * 4
     logger.info(new_pos)
-    emio.angles = new_pos
+    motors.angles = new_pos
 
-    emio.printStatus()
+    motors.printStatus()
     time.sleep(1)
-    emio.printStatus()
+    motors.printStatus()
     new_pos = [3.14/2] * 4
     logger.info(new_pos)
-    emio.angles = new_pos
-    logging.info(emio.moving)
+    motors.angles = new_pos
+    logging.info(motors.moving)
     time.sleep(1)
-    emio.printStatus()
-    emio.angles = initial_pos_pulse
+    motors.printStatus()
+    assert np.allclose(motors.angles, new_pos, atol=0.01), "Motor did not reach the new position."
+    motors.angles = initial_pos
     time.sleep(1)
-    emio.printStatus()
-    assert (emio.angles == emio.angles) , "Motor did not return to initial position."
+    motors.printStatus()
+    assert np.allclose(motors.angles, initial_pos, atol=0.01), "Motor did not return to initial position."
 
 
 if __name__ == "__main__":
@@ -50,4 +61,4 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"An error occurred: {e}")
     finally:
-        emio.close()
+        emio.disconnect()
@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+
+from emioapi._goalwriter import GoalWriter
+from emioapi._motorbus import RAD_TO_PULSE
+
+
+def test_goal_suppression():
+    writes = []
+    writer = GoalWriter(writes.append, 2048)
+    assert writer.submit([0.5, 1.0, 0.5, 1.0])
+    assert not writer.submit(np.array([0.5, 1.0, 0.5, 1.0]))
+    assert not writer.submit([0.5 + 0.1 / RAD_TO_PULSE, 1.0, 0.5, 1.0])  # less than half a pulse
+    assert writer.submit([0.5 + 1 / RAD_TO_PULSE, 1.0, 0.5, 1.0])
+    assert writer.stats() == {"submitted": 4, "issued": 2, "suppressed": 2, "coalesced": 0}
+
+    writer.reset()
+    assert writer.submit([0.5 + 1 / RAD_TO_PULSE, 1.0, 0.5, 1.0])
+    assert len(writes) == 3
+
+
+def test_goal_coalescing():
+    writes = []
+    writer = GoalWriter(writes.append, 2048, period=0.05)
+    angles = np.zeros(4)
+    for i in range(10):
+        angles[:] = i * 0.01
+        writer.submit(angles)
+    assert len(writes) == 1
+    time.sleep(0.15)
+    assert len(writes) == 2
+    assert np.allclose(writes[-1], 0.09)
+    assert writer.stats() == {"submitted": 10, "issued": 2, "suppressed": 0, "coalesced": 8}
+
+    assert writer.submit([0.2] * 4)
+    writer.submit([0.3] * 4)
+    writer.submit([0.2] * 4)  # back to the goals written, the pending goals are dropped at the end of the period
+    writer.flush()
+    assert len(writes) == 3
+    assert writer.stats()["suppressed"] == 1
@@ -0,0 +1,45 @@
+import numpy as np
+
+from emioapi._markertracker import MarkerTracker
+
+
+MARKERS = np.array([[0.0, 0.0, 0.0], [50.0, 0.0, 0.0], [0.0, 50.0, 0.0]])
+
+
+def test_identities_are_stable_when_detections_reorder():
+    tracker = MarkerTracker()
+    positions, valid = tracker.update(MARKERS, 0.0)
+    assert np.allclose(positions, MARKERS) and valid.all()
+
+    positions, valid = tracker.update(MARKERS[[2, 0, 1]] + [1.0, 0.0, 0.0], 0.1)
+    assert valid.all()
+    assert np.allclose(positions[:, 0], MARKERS[:, 0] + 0.8)
+    assert np.allclose(positions[:, 1:], MARKERS[:, 1:])
+
+
+def test_missing_marker_coasts_then_is_dropped():
+    tracker = MarkerTracker(max_missed=2, alpha=1.0, beta=1.0)
+    for i in range(3):
+        tracker.update(MARKERS + [i, 0.0, 0.0], i * 0.1)
+    assert np.allclose(tracker.predict(0.3)[:, 0], MARKERS[:, 0] + 3)
+
+    positions, valid = tracker.update(MARKERS[:2] + [3.0, 0.0, 0.0], 0.3)
+    assert list(valid) == [True, True, False]
+    assert np.allclose(positions[2], MARKERS[2] + [3.0, 0.0, 0.0])
+
+    for i in range(4, 6):
+        positions, valid = tracker.update(MARKERS[:2] + [i, 0.0, 0.0], i * 0.1)
+    assert np.isnan(positions[2]).all() and not tracker.active[2]
+
+    # A new marker takes the free identity
+    positions, valid = tracker.update(np.vstack((MARKERS[:2] + [6.0, 0.0, 0.0], [[100.0, 100.0, 0.0]])), 0.6)
+    assert valid.all() and tracker.count == 3
+    assert np.allclose(positions[2], [100.0, 100.0, 0.0])
+
+
+def test_detection_outside_gate_starts_a_new_identity():
+    tracker = MarkerTracker(gate=10.0)
+    tracker.update(MARKERS[:1], 0.0)
+    positions, valid = tracker.update(MARKERS[:1] + [30.0, 0.0, 0.0], 0.1)
+    assert tracker.count == 2
+    assert list(valid) == [False, True]
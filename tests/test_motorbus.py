@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from emioapi._motorbus import (STATE_DTYPE, LEN_STATE, RAD_TO_PULSE, angles_to_pulses, pulses_to_angles,
+                               decode_state, snapshot_dtype)
+
+
+def test_pulse_conversions():
+    angles = np.array([0.0, 0.5, -1.0, np.pi])
+    pulses = angles_to_pulses(angles, 2048)
+    assert pulses[0] == 2048 and pulses[3] == 0
+    assert np.allclose(pulses_to_angles(pulses, 2048), angles, atol=0.5 / RAD_TO_PULSE)
+
+
+def test_decode_state():
+    state = np.zeros(4, dtype=STATE_DTYPE)
+    state["position"] = [2048, 3072, 1024, 2048]
+    state["velocity"] = [0, 10, -10, 0]
+    state["current"] = [0, 100, -100, 0]
+    state["temperature"] = 35
+    state["moving"] = [0, 1, 1, 0]
+    raw = state.view(np.uint8).reshape(4, LEN_STATE)
+
+    logs = np.zeros(3, dtype=snapshot_dtype(4))
+    sample = decode_state(raw, 2048, 12.5, out=logs[1:2])
+    assert sample.base is logs or np.shares_memory(sample, logs)
+    assert logs[1]["timestamp"] == 12.5
+    assert logs[1]["position"] == pytest.approx([0, -np.pi / 2, np.pi / 2, 0])
+    assert logs[1]["velocity"][1] == pytest.approx(-10 * 0.229 * 2 * np.pi / 60)
+    assert logs[1]["current"] == pytest.approx([0, 269, -269, 0])
+    assert list(logs[1]["moving"]) == [False, True, True, False]
+    assert list(logs[1]["temperature"]) == [35] * 4
+    assert logs[0]["timestamp"] == 0 and logs[2]["timestamp"] == 0
+
+
+def test_invalid_angles_are_rejected():
+    for angles in ([0.0, np.nan, 0.0, 0.0], [np.inf, 0.0, 0.0, 0.0], [1e9, 0.0, 0.0, 0.0]):
+        with pytest.raises(ValueError):
+            angles_to_pulses(angles, 2048)
@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+import pytest
+
+from emioapi._motorbus import LEN_STATE
+from emioapi._motorcontrolloop import MotorControlLoop
+
+
+class FakeBus:
+    """
+    Bus of 4 motors at rest, recording the goal pulses written, and taking `duration` seconds per read.
+    """
+
+    def __init__(self, duration: float=0.0):
+        self.ids = [0, 1, 2, 3]
+        self.duration = duration
+        self.writes = []
+        self.failure = None
+
+    def write_goal_pulses(self, pulses):
+        self.writes.append(np.array(pulses))
+
+    def read_state(self):
+        if self.failure is not None:
+            raise self.failure
+        time.sleep(self.duration)
+        return np.zeros((len(self.ids), LEN_STATE), dtype=np.uint8), time.perf_counter()
+
+
+def test_control_loop_period():
+    loop = MotorControlLoop(FakeBus(), 2048, period=0.005)
+    start = time.perf_counter()
+    loop.start()
+    time.sleep(0.2)
+    loop.stop()
+    elapsed = time.perf_counter() - start
+    stats = loop.stats()
+    deadlines = stats["ticks"] + stats["skipped_ticks"]
+    assert elapsed / 0.005 - 5 <= deadlines <= elapsed / 0.005 + 1  # on the grid of deadlines, without drift
+    assert stats["ticks"] > 0.8 * deadlines and stats["errors"] == 0
+    assert sum(stats["jitter_histogram"]) == stats["ticks"]
+
+
+def test_control_loop_overruns():
+    loop = MotorControlLoop(FakeBus(duration=0.012), 2048, period=0.005)
+    loop.start()
+    time.sleep(0.2)
+    loop.stop()
+    stats = loop.stats()
+    assert stats["overruns"] >= stats["ticks"] - 1
+    assert stats["skipped_ticks"] >= stats["ticks"]
+
+
+def test_control_loop_coalescing_and_suppression():
+    bus = FakeBus()
+    loop = MotorControlLoop(bus, 2048, period=0.05)
+    loop.start()
+    time.sleep(0.01)  # after the first tick
+    for i in range(5):
+        loop.set_angles([i * 0.1] * 4)
+    time.sleep(0.06)
+    loop.set_angles([0.4] * 4)
+    time.sleep(0.05)
+    loop.stop()
+    assert len(bus.writes) == 1
+    assert np.array_equal(bus.writes[0], [2048 - 261] * 4)
+    assert loop.stats()["coalesced"] == 4 and loop.stats()["suppressed"] == 1
+
+
+def test_control_loop_error():
+    bus = FakeBus()
+    loop = MotorControlLoop(bus, 2048, period=0.005)
+    loop.start()
+    bus.failure = ConnectionError("no status packet")
+    time.sleep(0.05)
+    assert loop.is_alive() and loop.errors > 0  # retried at the next tick
+
+    bus.failure = OSError("port closed")
+    loop.join(1.0)
+    assert not loop.is_alive() and loop.error is bus.failure
+    with pytest.raises(OSError):
+        loop.set_angles([0.0] * 4)
+    with pytest.raises(OSError):
+        loop.state
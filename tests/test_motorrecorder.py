@@ -0,0 +1,50 @@
+import time
+
+import numpy as np
+
+from emioapi._motorrecorder import MotorTelemetryRecorder, read_motor_recording
+
+
+def test_recorder_ring(tmp_path):
+    path = tmp_path.joinpath("motors.npy")
+    calls = []
+
+    def sample(record):
+        calls.append(len(calls))
+        record["timestamp"] = time.perf_counter()
+        record["position"] = len(calls)
+
+    recorder = MotorTelemetryRecorder(sample, path, count=4, capacity=16, period=0.001)
+    recorder.start()
+    while recorder.samples < 40:
+        # The file is readable while recording
+        records = read_motor_recording(path)
+        assert np.all(np.diff(records["sequence"]) == 1)
+        time.sleep(0.001)
+    recorder.stop()
+
+    records = read_motor_recording(path)
+    assert len(records) == 16
+    assert records["sequence"][-1] == recorder.samples
+    assert np.all(np.diff(records["timestamp"]) > 0)
+    assert np.array_equal(records["position"][:, 0], records["sequence"])
+    assert np.load(path, mmap_mode="r").shape == (16,)
+
+
+def test_recorder_error(tmp_path):
+    path = tmp_path.joinpath("motors.npy")
+
+    calls = []
+
+    def sample(record):
+        calls.append(len(calls))
+        if len(calls) > 3:
+            raise RuntimeError("The motors are not connected")
+        record["timestamp"] = time.perf_counter()
+
+    recorder = MotorTelemetryRecorder(sample, path, count=4, capacity=16, period=0.001)
+    recorder.start()
+    recorder.join(1.0)
+    assert not recorder.is_alive()
+    assert isinstance(recorder.error, RuntimeError) and recorder.errors == 0
+    assert recorder.samples == 3 and len(read_motor_recording(path)) == 3
@@ -0,0 +1,23 @@
+import pickle
+
+import numpy as np
+
+from emioapi._sharedframebuffer import SharedFrameRingBuffer
+
+
+def test_frames_carry_their_camera_frame():
+    buffer = SharedFrameRingBuffer((2, 3), np.float32, slots=3)
+    reader = pickle.loads(pickle.dumps(buffer))
+    assert reader.latest() == (0, None) and reader.info(0) is None
+
+    for i in range(1, 5):
+        assert buffer.write(np.full((2, 3), i), frame_number=100 + i, timestamp=i / 30) == i
+    sequence, frame = reader.latest()
+    assert sequence == 4 and np.all(frame == 4)
+    assert reader.info(sequence) == (104, 4 / 30)
+    assert reader.info(2) == (102, 2 / 30)
+    assert reader.info(1) is None  # overwritten
+
+    del frame
+    reader.close()
+    buffer.close()
@@ -0,0 +1,101 @@
+import time
+
+import numpy as np
+import pytest
+from dynamixel_sdk import PacketHandler, COMM_SUCCESS
+
+from emioapi import EmioMotors, SimulatedPortHandler
+from emioapi._motorbus import DynamixelBus, LEN_STATE, decode_state
+from emioapi._motorcontrolloop import MotorControlLoop
+from emioapi._trajectory import TrajectoryHandle, trajectory_times
+
+
+IDS = [0, 1, 2, 3]
+
+
+def open_bus(**kwargs):
+    port = SimulatedPortHandler(IDS, **kwargs)
+    assert port.openPort()
+    bus = DynamixelBus(port, IDS)
+    bus.sync_write(64, np.ones((4, 1)))  # torque enable
+    return port, bus
+
+
+def test_simulated_control_table():
+    port, bus = open_bus(realtime=False)
+    packet_handler = PacketHandler(2.0)
+    assert packet_handler.ping(port, 2) == (1030, COMM_SUCCESS, 0)
+    assert packet_handler.ping(port, 7)[1] != COMM_SUCCESS
+    assert packet_handler.write4ByteTxRx(port, 1, 132, 0) == (COMM_SUCCESS, 7)  # the present position is read only
+    assert packet_handler.write1ByteTxRx(port, 1, 11, 4) == (COMM_SUCCESS, 7)  # the EEPROM is locked by the torque
+
+    bus.write_goal_pulses([2048, 3072, 1024, 5000])
+    time.sleep(0.3)
+    raw, timestamp = bus.read_state()
+    state = decode_state(raw, 2048, timestamp)
+    assert np.allclose(state["position_pulse"], [2048, 3072, 1024, 4095], atol=5)  # limited in position mode
+    assert not state["moving"].any()
+    assert state["voltage"] == pytest.approx([12.0] * 4)
+
+
+def test_simulated_serial_timing():
+    port, bus = open_bus(baud_rate=57600, return_delay=0.0001)
+    port.reset_stats()
+    start = time.perf_counter()
+    bus.read_state()
+    elapsed = time.perf_counter() - start
+    # Sync read instruction with the 4 ids, then 4 status packets after the return delay
+    expected = ((14 + 4) + 4 * (11 + LEN_STATE)) * 10 / 57600 + 4 * 0.0001
+    assert port.stats()["bus_time"] == pytest.approx(expected)
+    assert elapsed >= expected
+
+
+def test_simulated_control_loop_and_trajectory():
+    port, bus = open_bus()
+    loop = MotorControlLoop(bus, 2048, period=0.005)
+    loop.start()
+    angles = np.outer(np.linspace(0, 1, 11), [0.5, -0.5, 0.25, 0.0])
+    trajectory = TrajectoryHandle(bus, 2048, angles, trajectory_times(angles, dt=0.02), period=0.005, control_loop=loop)
+    trajectory.start()
+    assert trajectory.wait(2.0) and trajectory.error is None
+    time.sleep(0.3)
+    loop.stop()
+    assert loop.stats()["errors"] == 0 and loop.writes > 0
+    assert np.allclose(loop.state["position"], angles[-1], atol=0.01)
+    assert np.abs(trajectory.tracking_errors).max() < 0.5
+
+
+def test_simulated_emio_motors():
+    motors = EmioMotors(simulation=SimulatedPortHandler(IDS, realtime=False))
+    assert not motors.is_connected
+    assert motors.open()
+    motors.angles = [0.5, 1.0, 0.5, 1.0]
+    motors.angles = [0.5, 1.0, 0.5, 1.0]
+    assert motors.goal_writer.stats()["suppressed"] == 1
+    time.sleep(0.3)
+    assert np.allclose(motors.angles, [0.5, 1.0, 0.5, 1.0], atol=0.01)
+    motors.close()
+    assert not motors.is_connected
+
+    assert motors.open()
+    motors.angles = [0.5, 1.0, 0.5, 1.0]
+    assert motors.goal_writer.stats()["issued"] == 2  # written again after the reconnection
+    motors.close()
+
+
+def test_simulated_emio_motors_properties():
+    motors = EmioMotors(simulation=SimulatedPortHandler(IDS, realtime=False))
+    assert motors.open()
+    assert motors.device_name == "simulated"
+    assert motors.position_p_gain == [800] * 4
+    motors.max_velocity = [1000] * 4
+    motors.position_d_gain = [10, 20, 30, 40]
+    assert motors.max_velocity == [1000] * 4 and motors.position_d_gain == [10, 20, 30, 40]
+    motors.angles = [1.0] * 4
+    assert motors.moving == [True] * 4 and all(v < 0 for v in motors.velocity)  # the pulses decrease with the angles
+    with pytest.raises(AttributeError):
+        motors.moving = [False] * 4
+    motors.enablePWMMode()
+    motors.goal_pwm = [-200] * 4
+    assert motors.goal_pwm == [-200] * 4
+    motors.close()
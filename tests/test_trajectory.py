@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+import pytest
+
+from emioapi import SimulatedPortHandler
+from emioapi._motorbus import DynamixelBus, LEN_STATE
+from emioapi._motorcontrolloop import MotorControlLoop
+from emioapi._trajectory import TrajectoryHandle, interpolate_trajectory, trajectory_times
+
+
+IDS = [0, 1, 2, 3]
+
+
+def test_trajectory_times():
+    angles = np.zeros((5, 4))
+    assert np.allclose(trajectory_times(angles, dt=0.1), [0, 0.1, 0.2, 0.3, 0.4])
+    assert np.allclose(trajectory_times(angles, timestamps=[10, 10.5, 11, 12, 14]), [0, 0.5, 1, 2, 4])
+    with pytest.raises(ValueError):
+        trajectory_times(angles)
+    with pytest.raises(ValueError):
+        trajectory_times(angles, timestamps=[0, 1, 1, 2, 3])
+    with pytest.raises(ValueError):
+        trajectory_times(np.zeros(4), dt=0.1)
+
+
+def test_interpolate_trajectory():
+    angles = np.array([[0.0, 0.0], [1.0, -2.0], [1.0, 0.0]])
+    times = np.array([0.0, 1.0, 3.0])
+    out = np.zeros(2)
+    assert interpolate_trajectory(times, angles, 0.25, out=out) is out
+    assert np.allclose(out, [0.25, -0.5])
+    assert np.allclose(interpolate_trajectory(times, angles, 2.0), [1.0, -1.0])
+    assert np.allclose(interpolate_trajectory(times, angles, -1.0), [0.0, 0.0])
+    assert np.allclose(interpolate_trajectory(times, angles, 5.0), [1.0, 0.0])
+
+
+def test_trajectory_on_simulated_bus():
+    port = SimulatedPortHandler(IDS, realtime=False)
+    assert port.openPort()
+    bus = DynamixelBus(port, IDS)
+    bus.sync_write(64, np.ones((4, 1)))  # torque enable
+    angles = np.outer(np.linspace(0, 1, 101), [0.5, -0.5, 0.25, 0.0])
+    trajectory = TrajectoryHandle(bus, 2048, angles, trajectory_times(angles, dt=0.01), period=0.005)
+    trajectory.start()
+    time.sleep(0.2)
+    trajectory.cancel()
+    assert trajectory.done and trajectory.cancelled and trajectory.error is None
+    assert 0 < trajectory.progress < 1
+    ticks = np.rint(trajectory.tick_times / 0.005)
+    assert np.allclose(trajectory.tick_times, ticks * 0.005) and np.all(np.diff(ticks) > 0)
+    assert ticks[-1] + 1 == len(ticks) + trajectory.skipped_ticks
+    assert trajectory.progress == pytest.approx(trajectory.tick_times[-1] / 1.0)
+
+
+class FailingBus:
+    """
+    Bus whose reads fail after the first one, with an error which is not a failed transaction.
+    """
+    ids = IDS
+
+    def __init__(self):
+        self.reads = 0
+
+    def write_goal_pulses(self, pulses):
+        pass
+
+    def read_state(self):
+        self.reads += 1
+        if self.reads > 1:
+            raise OSError("port closed")
+        return np.zeros((len(self.ids), LEN_STATE), dtype=np.uint8), time.perf_counter()
+
+
+def test_trajectory_error():
+    loop = MotorControlLoop(FailingBus(), 2048, period=0.005)
+    loop.start()
+    loop.join(1.0)
+    angles = np.zeros((11, 4))
+    trajectory = TrajectoryHandle(loop.bus, 2048, angles, trajectory_times(angles, dt=0.1), control_loop=loop)
+    trajectory.start()
+    assert trajectory.wait(1.0)
+    assert isinstance(trajectory.error, OSError) and trajectory.error is loop.error
+    assert not trajectory.cancelled and trajectory.progress == 0.0